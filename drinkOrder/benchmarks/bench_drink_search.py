@@ -0,0 +1,94 @@
+"""
+Drink search benchmark: the old name__icontains path (count, exists, then the
+rendered list: three full scans) against the FTS5 index in drinks.search, on
+a generated catalog. Runs against a throwaway in-memory test database.
+
+    python benchmarks/bench_drink_search.py --drinks 100000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'drinkOrder.settings')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+BASES = ['Mojito', 'Margarita', 'Espresso', 'Latte', 'Lemonade', 'Iced Tea', 'Smoothie', 'Martini',
+         'Negroni', 'Cold Brew', 'Milkshake', 'Spritz', 'Daiquiri', 'Chai', 'Matcha', 'Sangria']
+FLAVOURS = ['Strawberry', 'Mango', 'Vanilla', 'Caramel', 'Passionfruit', 'Coconut', 'Ginger', 'Hazelnut',
+            'Blueberry', 'Lime', 'Peach', 'Cinnamon', 'Honey', 'Mint', 'Raspberry', 'Pineapple']
+STYLES = ['Classic', 'Frozen', 'Spiced', 'Sparkling', 'Double', 'Skinny', 'Royal', 'Smoked']
+CATEGORIES = ['Cocktails', 'Coffee', 'Tea', 'Soft Drinks', 'Shakes', 'Mocktails']
+QUERIES = ['mojito', 'mang', 'vanilla latte', 'cold br', 'spiced chai', 'margartia', 'x']
+
+
+def seed(count):
+    from drinks.models import Category, Drink
+    from drinks.search import rebuild_index
+    rng = random.Random(42)
+    categories = Category.objects.bulk_create([Category(name=name) for name in CATEGORIES])
+    Drink.objects.bulk_create([
+        Drink(name=f"{rng.choice(STYLES)} {rng.choice(FLAVOURS)} {rng.choice(BASES)} #{i}",
+              category=rng.choice(categories), price=rng.randint(2, 15))
+        for i in range(count)
+    ], batch_size=5000)
+    rebuild_index()
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--drinks', type=int, default=100000)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    import logging
+    logging.disable(logging.INFO)
+    from django.db import connection
+    from drinks.models import Drink
+    from drinks.search import fts_available, search_drinks, suggest_query
+
+    connection.creation.create_test_db(verbosity=0)
+    started = time.perf_counter()
+    seed(args.drinks)
+    print(f"Seeded and indexed {args.drinks} drinks in {time.perf_counter() - started:.1f}s (FTS5: {fts_available()})")
+
+    def old(query):
+        drinks = Drink.objects.filter(name__icontains=query)
+        drinks.count()
+        drinks.exists()
+        return list(drinks.order_by('name'))
+
+    def new(query):
+        results = list(search_drinks(Drink.objects.all(), query))
+        if not results:
+            suggestion = suggest_query(query)
+            if suggestion:
+                results = list(search_drinks(Drink.objects.all(), suggestion))
+        return results
+
+    print(f"{'query':<16} {'icontains':>10} {'hits':>7} {'fts5':>10} {'hits':>7}  top result")
+    for query in QUERIES:
+        old_ms, old_hits = timed(lambda: old(query), args.runs)
+        new_ms, new_hits = timed(lambda: new(query), args.runs)
+        top = new_hits[0].name if new_hits else '-'
+        print(f"{query:<16} {old_ms:>8.1f}ms {len(old_hits):>7} {new_ms:>8.1f}ms {len(new_hits):>7}  {top}")
+
+
+if __name__ == '__main__':
+    main()
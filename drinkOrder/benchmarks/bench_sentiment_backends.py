@@ -0,0 +1,122 @@
+"""
+Compares the sentiment backends in drinks.sentiment on a fixed review corpus:
+model load time, per-review latency, batch throughput, resident memory and
+label agreement with the full-precision PyTorch baseline.
+
+Each backend runs in its own interpreter so RSS numbers are not shared.
+Run from the project directory:
+
+    python benchmarks/bench_sentiment_backends.py --threads 4
+"""
+import argparse
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_DIR))
+
+OPENINGS = ['', 'Honestly, ', 'Ordered this twice. ', 'First time trying it and ']
+BODIES = [
+    'great', 'too sweet', 'the best mojito in town', 'watery and bland',
+    'it was okay, nothing special', 'loved the fresh mint', 'way overpriced for the size',
+    'perfect balance of sour and sweet', 'tasted like cough syrup', 'would order again',
+]
+ENDINGS = ['', '!', ' The bartender was friendly.', ' Took forever to arrive though.']
+
+
+def corpus():
+    # Deterministic mix of short repeated texts and longer sentences, plus the blank text Review allows
+    return [''] + [f"{o}{b}{e}".strip() for o, b, e in itertools.product(OPENINGS, BODIES, ENDINGS)]
+
+
+def rss_mb():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def run_backend(args):
+    from drinks.sentiment import DEFAULT_SENTIMENT_MODEL, build_pipeline, to_sentiment
+
+    texts = corpus()
+    started = time.perf_counter()
+    classifier = build_pipeline(args.model or DEFAULT_SENTIMENT_MODEL, backend=args.backend,
+                                num_threads=args.threads, onnx_path=args.onnx_path)
+    load_seconds = time.perf_counter() - started
+    classifier(texts[:4])
+
+    latencies = []
+    for text in texts:
+        started = time.perf_counter()
+        classifier(text)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    results = classifier(texts, batch_size=args.batch_size, truncation=True)
+    batch_seconds = time.perf_counter() - started
+
+    latencies.sort()
+    print(json.dumps({
+        'load_s': load_seconds,
+        'p50_ms': statistics.median(latencies),
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1],
+        'batch_per_s': len(texts) / batch_seconds,
+        'rss_mb': rss_mb(),
+        'sentiments': [to_sentiment(result, args.threshold) for result in results],
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', default='pytorch,quantized,onnx')
+    parser.add_argument('--model')
+    parser.add_argument('--threads', type=int)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--threshold', type=float, default=0.7)
+    parser.add_argument('--onnx-path', help='Reuse (or save) the exported ONNX model here')
+    parser.add_argument('--backend', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.backend:
+        run_backend(args)
+        return
+
+    backends = args.backends.split(',')
+    if 'pytorch' not in backends:
+        backends.insert(0, 'pytorch')
+    forwarded = ['--batch-size', str(args.batch_size), '--threshold', str(args.threshold)]
+    for option in ('model', 'threads', 'onnx_path'):
+        if getattr(args, option):
+            forwarded += [f"--{option.replace('_', '-')}", str(getattr(args, option))]
+    reports = {}
+    for backend in backends:
+        proc = subprocess.run([sys.executable, __file__, '--backend', backend, *forwarded],
+                              cwd=PROJECT_DIR, capture_output=True, text=True, env=dict(os.environ))
+        if proc.returncode != 0:
+            print(f"{backend}: failed\n{proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else ''}")
+            continue
+        reports[backend] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    baseline = reports.get('pytorch')
+    print(f"corpus: {len(corpus())} reviews, threads: {args.threads or 'default'}, batch size: {args.batch_size}")
+    print(f"{'backend':<10} {'load':>7} {'p50':>9} {'p95':>9} {'batch/s':>9} {'RSS':>8} {'agree':>7}")
+    for backend, report in reports.items():
+        if baseline:
+            matches = sum(a == b for a, b in zip(report['sentiments'], baseline['sentiments']))
+            agreement = f"{matches / len(baseline['sentiments']):.1%}"
+        else:
+            agreement = 'n/a'
+        print(f"{backend:<10} {report['load_s']:>6.1f}s {report['p50_ms']:>7.1f}ms {report['p95_ms']:>7.1f}ms "
+              f"{report['batch_per_s']:>9.1f} {report['rss_mb']:>6.0f}MB {agreement:>7}")
+
+
+if __name__ == '__main__':
+    main()
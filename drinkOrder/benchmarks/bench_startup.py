@@ -0,0 +1,64 @@
+"""
+Startup-time benchmark for the lazy sentiment model import.
+
+Each scenario runs in a fresh interpreter so module caches don't leak between
+runs. Run from the project directory:
+
+    python benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+SETUP = (
+    "import os, django;"
+    "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'drinkOrder.settings');"
+    "django.setup();"
+)
+
+SCENARIOS = {
+    # What every manage.py command and worker boot pays now
+    'django.setup (lazy)': SETUP,
+    # What it used to pay when drinks.models imported transformers eagerly
+    'django.setup + transformers import (old eager)': SETUP + "from transformers import pipeline",
+    # Opt-in warm-up: model loaded and one inference run at boot
+    'django.setup + warm_up': SETUP + "from drinks.sentiment import SentimentClassifier; SentimentClassifier().warm_up()",
+}
+
+
+def time_scenario(code, runs):
+    env = dict(os.environ)
+    env.setdefault('SECRET_KEY', 'benchmark')
+    env['SENTIMENT_WARMUP'] = '0'
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=PROJECT_DIR, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'scenario':<50} {'median':>9} {'min':>9} {'max':>9}")
+    for name, code in SCENARIOS.items():
+        try:
+            samples = time_scenario(code, args.runs)
+        except subprocess.CalledProcessError:
+            print(f"{name:<50} {'failed':>9}")
+            continue
+        print(f"{name:<50} {statistics.median(samples):>8.2f}s {min(samples):>8.2f}s {max(samples):>8.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Reports memory for a preforking server master and its workers from
+/proc/<pid>/smaps_rollup (Linux only):
+
+- RSS: resident pages, counting shared copy-on-write pages in full
+- PSS: resident pages with shared pages split between the sharers
+- USS: pages private to the process; what another worker would really cost
+
+    python benchmarks/worker_memory.py --pid $(cat /tmp/gunicorn.pid)
+"""
+import argparse
+from pathlib import Path
+
+
+def read_rollup(pid):
+    fields = {}
+    for line in Path(f'/proc/{pid}/smaps_rollup').read_text().splitlines()[1:]:
+        name, value = line.split(':', 1)
+        fields[name] = int(value.split()[0])
+    return {
+        'rss': fields.get('Rss', 0),
+        'pss': fields.get('Pss', 0),
+        'uss': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+        'shared': fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0),
+    }
+
+
+def children(pid):
+    found = []
+    for task in Path(f'/proc/{pid}/task').iterdir():
+        found += [int(child) for child in (task / 'children').read_text().split()]
+    return found
+
+
+def mb(kb):
+    return f"{kb / 1024:.1f}MB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pid', type=int, required=True, help='Master process id')
+    args = parser.parse_args()
+
+    master = read_rollup(args.pid)
+    workers = {pid: read_rollup(pid) for pid in children(args.pid)}
+
+    print(f"{'process':<16} {'RSS':>10} {'PSS':>10} {'USS':>10} {'shared':>10}")
+    print(f"{'master ' + str(args.pid):<16} {mb(master['rss']):>10} {mb(master['pss']):>10} {mb(master['uss']):>10} {mb(master['shared']):>10}")
+    for pid, usage in workers.items():
+        print(f"{'worker ' + str(pid):<16} {mb(usage['rss']):>10} {mb(usage['pss']):>10} {mb(usage['uss']):>10} {mb(usage['shared']):>10}")
+    if workers:
+        total_pss = master['pss'] + sum(usage['pss'] for usage in workers.values())
+        mean_uss = sum(usage['uss'] for usage in workers.values()) / len(workers)
+        print(f"\n{len(workers)} workers, total PSS {mb(total_pss)}, mean worker USS {mb(mean_uss)}")
+        print(f"Each additional worker costs roughly {mb(mean_uss)} on top of the shared preloaded image.")
+
+
+if __name__ == '__main__':
+    main()
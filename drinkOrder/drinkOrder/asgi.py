@@ -3,6 +3,11 @@ ASGI config for drinkOrder project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The bartenders' live order feed (orders:order_events) holds one connection
+open per screen, which only an ASGI server can do, e.g.
+gunicorn -k uvicorn.workers.UvicornWorker drinkOrder.asgi:application.
+Under the WSGI application the feed falls back to the browser polling it.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
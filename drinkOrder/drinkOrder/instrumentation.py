@@ -0,0 +1,324 @@
+"""
+Per-request timing instrumentation.
+
+InstrumentationMiddleware gives each request a RequestMetrics collector.
+Instrumented code adds to it through timed() and count():
+- the connection wrapper from query_budget adds 'db';
+- InstrumentedDjangoTemplates adds 'tpl' for every render()/render_to_string();
+- SentimentClassifier adds 'sentiment' and 'sentiment-cache';
+- Drink.get_top_drinks adds 'top-drinks';
+- the menu fragment cache adds 'menu-cache'.
+Outside a request, timed() and count() do nothing.
+
+The middleware then does three things. It sends the numbers back as a
+Server-Timing header, to staff only unless DEBUG or SERVER_TIMING is on,
+since they show how long the queries behind each page take. It checks the
+query budget. It records the durations into in-process histograms keyed by
+URL name and metric.
+
+Every TIMING_FLUSH_INTERVAL seconds, each process publishes a snapshot of its
+histograms to the default cache. The staff-only stats view (views.py) and
+the dump_timings command merge those snapshots. With a file-based cache they
+therefore cover every gunicorn worker on the host.
+"""
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.backends.django import DjangoTemplates
+
+from .query_budget import check_query_budget, count_queries
+
+logger = logging.getLogger('django')
+
+_current_metrics = ContextVar('request_metrics', default=None)
+
+WORKERS_KEY = 'instrumentation:workers'
+WORKER_SNAPSHOT_TIMEOUT = 3600
+
+
+class RequestMetrics:
+    '''
+    Durations (seconds, with call counts) and event counters collected
+    during one request.
+    '''
+    def __init__(self):
+        self.durations = {}
+        self.calls = Counter()
+        self.events = {}
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+        self.calls[name] += 1
+
+    def count(self, name, event, n=1):
+        self.events.setdefault(name, Counter())[event] += n
+
+    def server_timing(self):
+        entries = []
+        for name, seconds in self.durations.items():
+            entry = f"{name};dur={seconds * 1000:.1f}"
+            if self.calls[name] > 1:
+                entry += f';desc="{self.calls[name]} calls"'
+            entries.append(entry)
+        for name, events in self.events.items():
+            desc = ' '.join(f"{event}={n}" for event, n in sorted(events.items()))
+            entries.append(f'{name};desc="{desc}"')
+        return ', '.join(entries)
+
+
+@contextmanager
+def timed(name):
+    metrics = _current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(name, time.perf_counter() - start)
+
+
+def timed_function(name):
+    '''
+    Decorator form of timed().
+    '''
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, event, n=1):
+    metrics = _current_metrics.get()
+    if metrics is not None and n:
+        metrics.count(name, event, n)
+
+
+class Histogram:
+    '''
+    Log-bucketed latency histogram in milliseconds: 8 buckets per doubling
+    from 1µs, so percentiles are exact to within 9% at any scale and
+    histograms from different processes merge by adding bucket counts.
+    '''
+    BUCKETS_PER_DOUBLING = 8
+    BASE_MS = 0.001
+
+    def __init__(self, counts=None, total_ms=0.0, max_ms=0.0):
+        self.counts = Counter(counts or {})
+        self.total_ms = total_ms
+        self.max_ms = max_ms
+
+    @classmethod
+    def bucket(cls, ms):
+        if ms <= cls.BASE_MS:
+            return 0
+        return math.ceil(math.log2(ms / cls.BASE_MS) * cls.BUCKETS_PER_DOUBLING)
+
+    @classmethod
+    def bucket_upper_bound(cls, index):
+        return cls.BASE_MS * 2 ** (index / cls.BUCKETS_PER_DOUBLING)
+
+    @property
+    def count(self):
+        return sum(self.counts.values())
+
+    def record(self, ms):
+        self.counts[self.bucket(ms)] += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+
+    def percentile(self, fraction):
+        total = self.count
+        if not total:
+            return None
+        rank = math.ceil(fraction * total)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return round(min(self.bucket_upper_bound(index), self.max_ms), 3)
+        return round(self.max_ms, 3)
+
+    def summary(self):
+        total = self.count
+        return {
+            'count': total,
+            'mean_ms': round(self.total_ms / total, 3) if total else None,
+            'p50_ms': self.percentile(0.50),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': round(self.max_ms, 3),
+        }
+
+    def to_dict(self):
+        return {'counts': dict(self.counts), 'total_ms': self.total_ms, 'max_ms': self.max_ms}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls({int(index): n for index, n in data['counts'].items()}, data['total_ms'], data['max_ms'])
+
+
+class TimingRegistry:
+    '''
+    The histograms of this process, keyed by (URL name, metric).
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.last_flush = time.monotonic()
+
+    def record(self, view_name, metrics, total_seconds):
+        samples = [('total', total_seconds)] + list(metrics.durations.items())
+        with self.lock:
+            for metric, seconds in samples:
+                key = (view_name, metric)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram()
+                self.histograms[key].record(seconds * 1000)
+
+    def snapshot(self):
+        with self.lock:
+            return {f"{view_name}|{metric}": histogram.to_dict() for (view_name, metric), histogram in self.histograms.items()}
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+
+    def maybe_flush(self):
+        interval = getattr(settings, 'TIMING_FLUSH_INTERVAL', 10)
+        if time.monotonic() - self.last_flush < interval:
+            return
+        self.last_flush = time.monotonic()
+        self.flush()
+
+    def flush(self):
+        pid = os.getpid()
+        try:
+            cache.set(f"instrumentation:worker:{pid}", self.snapshot(), WORKER_SNAPSHOT_TIMEOUT)
+            now = time.time()
+            workers = cache.get(WORKERS_KEY) or {}
+            workers = {worker: seen for worker, seen in workers.items() if now - seen < WORKER_SNAPSHOT_TIMEOUT}
+            workers[pid] = now
+            cache.set(WORKERS_KEY, workers, None)
+        except Exception as e:
+            logger.warning(f"Could not publish timing histograms: {str(e)}")
+
+
+registry = TimingRegistry()
+
+
+def collect_histograms(include_local=True):
+    '''
+    Merges the snapshots every process published to the cache, with this
+    process's live histograms in place of its own (possibly stale) snapshot.
+    Returns {(view name, metric): Histogram}.
+    '''
+    own_pid = os.getpid()
+    workers = cache.get(WORKERS_KEY) or {}
+    snapshots = cache.get_many([f"instrumentation:worker:{pid}" for pid in workers if pid != own_pid or not include_local])
+    if include_local:
+        snapshots['local'] = registry.snapshot()
+    merged = {}
+    for snapshot in snapshots.values():
+        for key, data in snapshot.items():
+            view_name, metric = key.rsplit('|', 1)
+            merged.setdefault((view_name, metric), Histogram()).merge(Histogram.from_dict(data))
+    return merged
+
+
+def summarize(histograms):
+    '''
+    {view name: {metric: summary}} sorted by view name, for the stats view
+    and the dump command.
+    '''
+    summary = {}
+    for (view_name, metric), histogram in sorted(histograms.items()):
+        summary.setdefault(view_name, {})[metric] = histogram.summary()
+    return summary
+
+
+def reset_histograms():
+    registry.reset()
+    workers = cache.get(WORKERS_KEY) or {}
+    cache.delete_many([f"instrumentation:worker:{pid}" for pid in workers] + [WORKERS_KEY])
+
+
+class InstrumentationMiddleware:
+    '''
+    Outermost middleware: times the request, counts its queries, sets the
+    Server-Timing header and feeds the histograms and query budgets.
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            with count_queries() as counter:
+                response = self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        total = time.perf_counter() - start
+        if counter.count:
+            metrics.durations['db'] = counter.duration
+            metrics.calls['db'] = counter.count
+
+        match = request.resolver_match
+        view_name = match.view_name if match else 'unresolved'
+        check_query_budget(view_name, counter)
+        registry.record(view_name, metrics, total)
+        registry.maybe_flush()
+
+        if self.sends_server_timing(request):
+            header = metrics.server_timing()
+            response['Server-Timing'] = f"{header}, total;dur={total * 1000:.1f}" if header else f"total;dur={total * 1000:.1f}"
+        return response
+
+    def sends_server_timing(self, request):
+        if settings.DEBUG or getattr(settings, 'SERVER_TIMING', False):
+            return True
+        user = getattr(request, 'user', None)
+        return bool(user and user.is_staff)
+
+
+class TimedTemplate:
+    '''
+    Wraps a backend template so that rendering it counts towards 'tpl'.
+    '''
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        with timed('tpl'):
+            return self.template.render(context, request)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
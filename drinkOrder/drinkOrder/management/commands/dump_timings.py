@@ -0,0 +1,46 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from drinkOrder.instrumentation import collect_histograms, reset_histograms, summarize
+
+METRICS_ORDER = ['total', 'db', 'tpl', 'top-drinks', 'sentiment']
+
+
+def format_ms(value):
+    return '-' if value is None else f"{value:.1f}"
+
+
+class Command(BaseCommand):
+    help = ("Print the request timing percentiles per URL name, merged from the snapshots the web workers "
+            "publish to the cache (needs a shared cache such as CACHE_DIR).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Print the raw summary as JSON')
+        parser.add_argument('--view', help='Only show URL names containing this text')
+        parser.add_argument('--reset', action='store_true', help='Clear the published histograms afterwards')
+
+    def handle(self, *args, **options):
+        summary = summarize(collect_histograms(include_local=False))
+        if options['view']:
+            summary = {view_name: metrics for view_name, metrics in summary.items() if options['view'] in view_name}
+
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+        elif not summary:
+            self.stdout.write('No timings published yet')
+        else:
+            self.stdout.write(f"{'view / metric':<40} {'count':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  (ms)")
+            for view_name, metrics in summary.items():
+                self.stdout.write(view_name)
+                ordered = sorted(metrics, key=lambda metric: (METRICS_ORDER.index(metric) if metric in METRICS_ORDER else len(METRICS_ORDER), metric))
+                for metric in ordered:
+                    stats = metrics[metric]
+                    self.stdout.write(
+                        f"  {metric:<38} {stats['count']:>7} {format_ms(stats['p50_ms']):>8} {format_ms(stats['p95_ms']):>8} "
+                        f"{format_ms(stats['p99_ms']):>8} {format_ms(stats['max_ms']):>8}"
+                    )
+
+        if options['reset']:
+            reset_histograms()
+            self.stdout.write(self.style.SUCCESS('Cleared the published timings'))
@@ -0,0 +1,76 @@
+import pstats
+import shutil
+from collections import Counter
+from io import StringIO
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from drinkOrder.profiling import profile_dir
+
+
+def read_collapsed(paths):
+    stacks = Counter()
+    for path in paths:
+        for line in path.read_text().splitlines():
+            stack, _, samples = line.rpartition(' ')
+            if stack:
+                stacks[stack] += int(samples)
+    return stacks
+
+
+class Command(BaseCommand):
+    help = ('Merge the request profiles written by ProfilingMiddleware per URL name, rank the hotspots and '
+            'write merged collapsed stacks for flamegraph.pl or speedscope.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='Profile directory (default settings.PROFILE_DIR)')
+        parser.add_argument('--view', help='Only URL names containing this text')
+        parser.add_argument('--limit', type=int, default=15, help='Hotspots to list per URL name')
+        parser.add_argument('--sort', choices=['tottime', 'cumulative'], default='tottime',
+                            help='pstats order: own time or time including callees')
+        parser.add_argument('--clear', action='store_true', help='Delete the profiles afterwards')
+
+    def handle(self, *args, **options):
+        root = Path(options['dir']) if options['dir'] else profile_dir()
+        if not root.is_dir():
+            raise CommandError(f"No profiles in {root}")
+        merged_dir = root / '_merged'
+        views = sorted(path for path in root.iterdir() if path.is_dir() and path != merged_dir)
+        if options['view']:
+            views = [path for path in views if options['view'] in path.name]
+
+        for view_dir in views:
+            prof_files = sorted(view_dir.glob('*.prof'))
+            if not prof_files:
+                continue
+            stats_output = StringIO()
+            stats = pstats.Stats(str(prof_files[0]), stream=stats_output)
+            for path in prof_files[1:]:
+                stats.add(str(path))
+            stacks = read_collapsed(view_dir.glob('*.collapsed'))
+            total_samples = sum(stacks.values())
+
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{view_dir.name}: {len(prof_files)} requests, {stats.total_tt * 1000 / len(prof_files):.1f}ms "
+                f"profiled per request, {total_samples} stack samples"
+            ))
+            stats.sort_stats(options['sort']).print_stats(options['limit'])
+            self.stdout.write(stats_output.getvalue().split('\n\n', 1)[-1].strip('\n'))
+
+            if total_samples:
+                self_samples = Counter()
+                for stack, samples in stacks.items():
+                    self_samples[stack.rsplit(';', 1)[-1]] += samples
+                self.stdout.write('  Sampled leaf frames:')
+                for frame, samples in self_samples.most_common(options['limit']):
+                    self.stdout.write(f"  {samples * 100 / total_samples:5.1f}%  {frame}")
+                merged_dir.mkdir(exist_ok=True)
+                merged_path = merged_dir / f"{view_dir.name}.collapsed"
+                merged_path.write_text(''.join(f"{stack} {samples}\n" for stack, samples in stacks.most_common()))
+                self.stdout.write(f"  Flamegraph input: {merged_path}")
+            self.stdout.write('')
+
+        if options['clear']:
+            shutil.rmtree(root)
+            self.stdout.write(self.style.SUCCESS(f"Deleted {root}"))
@@ -0,0 +1,131 @@
+"""
+Opt-in request profiling.
+
+ProfilingMiddleware profiles a random PROFILE_SAMPLE_RATE fraction of
+requests, and any request from a staff user carrying ?_profile=1. It sits
+after the authentication middleware, and the URL dispatch, view and template
+rendering all happen inside it. Each profiled request writes two files to
+PROFILE_DIR/<URL name>/:
+- <id>.prof: the cProfile stats, readable by pstats and snakeviz;
+- <id>.collapsed: 'frame;frame;frame count' lines from a stack sampler
+  thread, ready for flamegraph.pl or speedscope.
+manage.py profile_hotspots merges the files per URL name and ranks the
+hotspots. The response of a profiled request carries the id in X-Profile-Id.
+"""
+import cProfile
+import itertools
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger('django')
+
+
+def frame_label(code):
+    filename = code.co_filename
+    for marker in ('site-packages' + os.sep, str(settings.BASE_DIR) + os.sep):
+        if marker in filename:
+            filename = filename.split(marker, 1)[1]
+            break
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class StackSampler(threading.Thread):
+    '''
+    Samples the stack of one thread every interval seconds into a Counter of
+    collapsed stacks (root first, ';'-separated), cut at the frame running
+    root_code so that only the request's own work is kept.
+    '''
+    def __init__(self, thread_id, root_code, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.root_code = root_code
+        self.interval = interval
+        self.stacks = Counter()
+        self.finished = threading.Event()
+
+    def run(self):
+        while not self.finished.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if self.finished.is_set():
+                # The request is over and the thread is waiting in stop()
+                break
+            labels = []
+            while frame is not None:
+                if frame.f_code is self.root_code:
+                    break
+                labels.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if labels:
+                self.stacks[';'.join(reversed(labels))] += 1
+
+    def stop(self):
+        self.finished.set()
+        self.join()
+
+
+def profile_dir():
+    return Path(getattr(settings, 'PROFILE_DIR', settings.BASE_DIR / 'profiles'))
+
+
+def safe_view_name(view_name):
+    return re.sub(r'[^\w.-]+', '_', view_name)
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.counter = itertools.count(1)
+
+    def should_profile(self, request):
+        if request.GET.get('_profile') == '1' and request.user.is_staff:
+            return True
+        rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+        return rate > 0 and random.random() < rate
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        sampler = StackSampler(threading.get_ident(), sys._getframe().f_code, getattr(settings, 'PROFILE_SAMPLE_INTERVAL', 0.001))
+        profiler = cProfile.Profile()
+        sampler.start()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler (e.g. a debugger) already owns this thread
+            sampler.stop()
+            return self.get_response(request)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+            sampler.stop()
+        elapsed = time.perf_counter() - start
+
+        match = request.resolver_match
+        view_name = match.view_name if match else 'unresolved'
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(self.counter)}"
+        try:
+            directory = profile_dir() / safe_view_name(view_name)
+            directory.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(directory / f"{profile_id}.prof")
+            with open(directory / f"{profile_id}.collapsed", 'w') as collapsed:
+                for stack, samples in sampler.stacks.items():
+                    collapsed.write(f"{stack} {samples}\n")
+        except OSError as e:
+            logger.error(f"Could not write profile for {view_name}: {str(e)}")
+            return response
+
+        logger.info(f"Profiled {view_name} ({elapsed * 1000:.1f}ms, {sum(sampler.stacks.values())} samples) as {profile_id}")
+        response['X-Profile-Id'] = f"{safe_view_name(view_name)}/{profile_id}"
+        return response
@@ -0,0 +1,89 @@
+"""
+Per-request SQL query budgets.
+
+count_queries() wraps the database connection and counts every statement and
+the time spent executing it; it works with DEBUG off, unlike
+connection.queries. The instrumentation middleware runs each request inside
+it and check_query_budget() logs a warning, with the most repeated statement
+(usually the N+1), when a view goes over its budget from
+settings.QUERY_BUDGETS. The tests use QueryBudgetTestMixin to hold the views
+to the same budgets against seeded data.
+"""
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger('django')
+
+
+class QueryCounter:
+    '''
+    Execute wrapper recording the number of statements, their total
+    duration in seconds, and how often each SQL string ran.
+    '''
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    def most_repeated(self):
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+
+@contextmanager
+def count_queries(using=DEFAULT_DB_ALIAS):
+    counter = QueryCounter()
+    with connections[using].execute_wrapper(counter):
+        yield counter
+
+
+def get_query_budget(view_name):
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(view_name, getattr(settings, 'QUERY_BUDGET_DEFAULT', 20))
+
+
+def check_query_budget(view_name, counter):
+    '''
+    Logs the request when counter went over the budget of view_name.
+    '''
+    budget = get_query_budget(view_name)
+    if counter.count > budget:
+        sql, repeats = counter.most_repeated()
+        logger.warning(
+            f"Query budget exceeded for {view_name}: {counter.count} queries (budget {budget}) "
+            f"in {counter.duration * 1000:.1f}ms; most repeated ({repeats}x): {sql}"
+        )
+
+
+class QueryBudgetTestMixin:
+    '''
+    TestCase mixin: assertQueryBudget(budget) fails when the block runs more
+    queries than budget, an int or a view name from settings.QUERY_BUDGETS.
+    '''
+    @contextmanager
+    def assertQueryBudget(self, budget, using=DEFAULT_DB_ALIAS):
+        view_name = budget if isinstance(budget, str) else None
+        if view_name:
+            budget = get_query_budget(view_name)
+        with count_queries(using) as counter:
+            yield counter
+        if counter.count > budget:
+            sql, repeats = counter.most_repeated()
+            self.fail(
+                f"{view_name or 'Block'} ran {counter.count} queries, over its budget of {budget}; "
+                f"most repeated ({repeats}x): {sql}"
+            )
@@ -0,0 +1,51 @@
+"""
+Query plan checks for the indexes declared in the models' Meta.indexes.
+
+QueryPlanTestMixin.assertUsesIndex() captures the statements a block runs,
+for example one view request, and asks SQLite for the plan of each SELECT
+with EXPLAIN QUERY PLAN. It fails unless one of them reads through the named
+index. The indexes therefore stay tied to the queries the views actually
+send, rather than to a copy of those queries in the tests.
+"""
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+def explain(sql, params=(), using=DEFAULT_DB_ALIAS):
+    '''
+    Returns the EXPLAIN QUERY PLAN detail lines of one statement (SQLite).
+    '''
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def uses_index(plan, index_name):
+    return any(f"INDEX {index_name} " in f"{line} " for line in plan)
+
+
+class QueryPlanTestMixin:
+    '''
+    TestCase mixin: assertUsesIndex(index_name) fails when no SELECT run in
+    the block is planned through index_name. SQLite only; other backends
+    skip the check.
+    '''
+    @contextmanager
+    def assertUsesIndex(self, index_name, using=DEFAULT_DB_ALIAS):
+        connection = connections[using]
+        with CaptureQueriesContext(connection) as captured:
+            yield captured
+        if connection.vendor != 'sqlite':
+            return
+        plans = []
+        for query in captured.captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            plan = explain(sql, using=using)
+            if uses_index(plan, index_name):
+                return
+            plans.append(f"{sql}\n  " + '\n  '.join(plan))
+        self.fail(f"No query used index {index_name}:\n" + '\n'.join(plans))
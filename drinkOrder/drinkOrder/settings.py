@@ -40,16 +40,20 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'drinks',
     'orders',
-    'users'
+    'users',
+    # Project-wide management commands (dump_timings, profile_hotspots)
+    'drinkOrder',
 ]
 
 MIDDLEWARE = [
+    'drinkOrder.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'drinkOrder.profiling.ProfilingMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -59,7 +63,8 @@ ROOT_URLCONF = 'drinkOrder.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that times every render for the Server-Timing header
+        'BACKEND': 'drinkOrder.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [ os.path.join(BASE_DIR, 'templates') ],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -130,9 +135,44 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': False,
         },
+        # At DEBUG every missing template variable is logged with a repr() of
+        # the whole context, which re-runs its querysets row by row
+        'django.template': {
+            'handlers': ['console', 'file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
+# Review sentiment is classified by the process_sentiment_jobs worker instead of
+# inline in Review.save() when this is enabled.
+SENTIMENT_DEFERRED = True
+
+# Changing the model or threshold invalidates cached sentiment results.
+SENTIMENT_MODEL = 'distilbert-base-uncased-finetuned-sst-2-english'
+SENTIMENT_THRESHOLD = 0.7
+SENTIMENT_CACHE_SIZE = 1024
+
+# CPU inference backend: 'pytorch', 'quantized' (dynamic int8) or 'onnx' (needs
+# optimum[onnxruntime]; exported once to SENTIMENT_ONNX_PATH). A thread count of
+# None leaves the runtime default.
+SENTIMENT_BACKEND = os.getenv('SENTIMENT_BACKEND', 'pytorch')
+SENTIMENT_NUM_THREADS = int(os.getenv('SENTIMENT_NUM_THREADS', 0)) or None
+SENTIMENT_ONNX_PATH = BASE_DIR / 'onnx' / 'sentiment'
+
+# When set, workers send uncached texts to the run_sentiment_server daemon on
+# this Unix socket instead of loading their own copy of the model. A request
+# may take SENTIMENT_SERVER_TIMEOUT seconds plus
+# SENTIMENT_SERVER_TIMEOUT_PER_TEXT for each text it sends.
+SENTIMENT_SERVER_SOCKET = os.getenv('SENTIMENT_SERVER_SOCKET') or None
+SENTIMENT_SERVER_TIMEOUT = 2.0
+SENTIMENT_SERVER_TIMEOUT_PER_TEXT = 0.05
+
+# Load the sentiment model when the app starts (e.g. in WSGI/ASGI workers) rather
+# than on first use. Leave off for manage.py commands that never classify.
+SENTIMENT_WARMUP = os.getenv('SENTIMENT_WARMUP') == '1'
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -158,4 +198,90 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Media files
 MEDIA_URL = '/media/'
-MEDIA_ROOT = BASE_DIR / 'media'
\ No newline at end of file
+MEDIA_ROOT = BASE_DIR / 'media'
+# Rendered menu fragments are cached per catalog version (drinks/menu_cache.py).
+# The local-memory cache is private to each process, so multi-worker servers
+# should set CACHE_DIR to share one file-based cache; gunicorn.conf.py does.
+CACHE_DIR = os.getenv('CACHE_DIR')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_DIR,
+    } if CACHE_DIR else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+MENU_CACHE_TIMEOUT = 300
+# Lifetime of the per-drink versions behind the detail pages' ETags (seconds)
+DRINK_VERSION_TIMEOUT = 24 * 3600
+
+# How long an order form's idempotency key guards against resubmission
+# before expire_idempotency_keys clears it (seconds)
+ORDER_IDEMPOTENCY_TTL = 24 * 3600
+
+# Live order feed (orders/events.py): streams poll the database for events
+# from other workers after ORDER_EVENTS_POLL_INTERVAL idle seconds and send a
+# heartbeat every ORDER_EVENTS_HEARTBEAT seconds; browsers reconnect after
+# ORDER_EVENTS_RETRY milliseconds. prune_order_events keeps
+# ORDER_EVENTS_RETENTION seconds of events.
+ORDER_EVENTS_POLL_INTERVAL = 5
+ORDER_EVENTS_HEARTBEAT = 15
+ORDER_EVENTS_RETRY = 3000
+ORDER_EVENTS_RETENTION = 24 * 3600
+
+# archive_orders (orders/archive.py) moves served orders placed more than
+# ORDER_ARCHIVE_AFTER_DAYS days ago to ArchivedOrder, ORDER_ARCHIVE_BATCH_SIZE
+# orders per transaction
+ORDER_ARCHIVE_AFTER_DAYS = 90
+ORDER_ARCHIVE_BATCH_SIZE = 500
+
+# Sales rollups (orders/rollups.py): update_sales_rollups counts the orders
+# served more than SALES_ROLLUP_LAG seconds ago; the sales report covers the
+# last SALES_REPORT_DAYS days unless given a range
+SALES_ROLLUP_LAG = 60
+SALES_REPORT_DAYS = 30
+
+# Customer profile stats (users.models.CustomerStats): the visit histogram
+# covers CUSTOMER_VISIT_HISTORY_DAYS days; the customer list shows the
+# REGULARS_LIMIT customers with the most orders over REGULARS_WINDOW_DAYS days
+CUSTOMER_VISIT_HISTORY_DAYS = 90
+REGULARS_WINDOW_DAYS = 30
+REGULARS_LIMIT = 5
+
+# Per-request timings (drinkOrder/instrumentation.py): sent as a Server-Timing
+# header to staff, and to everyone with DEBUG or SERVER_TIMING on, and
+# published for the stats view and dump_timings every TIMING_FLUSH_INTERVAL
+# seconds.
+SERVER_TIMING = os.getenv('SERVER_TIMING', '0') == '1'
+TIMING_FLUSH_INTERVAL = 10
+
+# Fraction of requests profiled by drinkOrder/profiling.py (staff can also add
+# ?_profile=1); cProfile and stack sample files go to PROFILE_DIR.
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_SAMPLE_INTERVAL = 0.001
+PROFILE_DIR = BASE_DIR / 'profiles'
+
+# Maximum queries per request by URL name; drinkOrder.query_budget logs the
+# requests that go over and the tests hold the views to the same numbers.
+QUERY_BUDGET_DEFAULT = 20
+QUERY_BUDGETS = {
+    'drinks:drink_menu': 5,
+    'drinks:bartender_menu': 6,
+    'drinks:drink_detail': 7,
+    'orders:order_list': 5,
+    'orders:customer_order_list': 7,
+    # Locking the pending orders, one UPDATE of those and the served events,
+    # whatever the number of orders
+    'orders:serve_order': 7,
+    'orders:serve_orders': 7,
+    # Placing an order is a fixed number of bulk writes, however many drinks:
+    # the order and its lines, the leaderboards, one UPDATE of the customer's
+    # stats (plus an insert on their first order) and the order event
+    'orders:place_order': 16,
+    # Reports read only the daily rollups, whatever the date range
+    'orders:sales_report': 7,
+    'orders:sales_report_data': 5,
+    'users:customer_list': 5,
+    # Favorites and visits come from the customer's stats row
+    'users:customer_profile': 5,
+}
@@ -18,10 +18,12 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from .views import TimingStatsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('drinks.urls')),
     path('orders/', include('orders.urls')),
-    path('accounts/', include('users.urls'))
+    path('accounts/', include('users.urls')),
+    path('stats/timings/', TimingStatsView.as_view(), name='timing_stats'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
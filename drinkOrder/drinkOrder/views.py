@@ -0,0 +1,21 @@
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.http import JsonResponse
+from django.views import View
+import os
+
+from .instrumentation import collect_histograms, summarize
+
+
+class TimingStatsView(LoginRequiredMixin, UserPassesTestMixin, View):
+    '''
+    Staff-only JSON summary of the request timing histograms: p50/p95/p99
+    per URL name and metric, merged across the workers sharing the cache.
+    '''
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request):
+        return JsonResponse({
+            'pid': os.getpid(),
+            'views': summarize(collect_histograms()),
+        }, json_dumps_params={'indent': 2})
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Category, Drink, Review
+from .models import Category, Drink, Review, SentimentJob
 admin.site.register(Category)
 admin.site.register(Drink)
 admin.site.register(Review)
+admin.site.register(SentimentJob)
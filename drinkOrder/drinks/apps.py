@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class DrinksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'drinks'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        # Opt-in: load the sentiment model at boot instead of on the first review
+        if getattr(settings, 'SENTIMENT_WARMUP', False):
+            from .sentiment import SentimentClassifier
+            SentimentClassifier().warm_up()
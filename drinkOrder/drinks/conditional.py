@@ -0,0 +1,67 @@
+"""
+Conditional GET for the public drink pages.
+
+The validators come from the catalog and drink versions in menu_cache, so a
+revalidation costs a couple of cache reads and returns 304 before the view
+runs any query or renders anything. The shared part of the ETag depends only
+on the data versions: every anonymous client (e.g. the kiosk tablets) gets
+the same one. Signed-in users see their own name, avatar and CSRF token in
+the page, so a hash of those is appended and the response is marked private.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .menu_cache import version_modified
+
+
+def user_validator(request):
+    '''
+    Hash of everything per-user that the page template renders, or '' for
+    anonymous visitors.
+    '''
+    user = request.user
+    if not user.is_authenticated:
+        return ''
+    parts = [
+        user.pk, user.get_username(), user.full_name, user.avatar.name,
+        user.is_customer, user.is_bartender, request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+    ]
+    return hashlib.md5('\x1f'.join(str(part) for part in parts).encode()).hexdigest()[:16]
+
+
+class ConditionalGetMixin:
+    '''
+    Adds a strong ETag and Last-Modified to GET/HEAD responses and answers
+    matching If-None-Match/If-Modified-Since with 304 without calling the
+    view. Subclasses return the data versions the page depends on from
+    get_versions().
+    '''
+    def get_versions(self, request, *args, **kwargs):
+        raise ImproperlyConfigured(f"{type(self).__name__} must define get_versions()")
+
+    def dispatch(self, request, *args, **kwargs):
+        # Pending flash messages would be rendered (and consumed) by the page
+        if request.method not in ('GET', 'HEAD') or len(get_messages(request)):
+            return super().dispatch(request, *args, **kwargs)
+
+        versions = self.get_versions(request, *args, **kwargs)
+        user_part = user_validator(request)
+        etag = quote_etag('-'.join([format(version, 'x') for version in versions] + ([user_part] if user_part else [])))
+        last_modified = int(version_modified(max(versions)).timestamp())
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response.headers.setdefault('ETag', etag)
+            response.headers.setdefault('Last-Modified', http_date(last_modified))
+            patch_cache_control(response, no_cache=True)
+            if user_part:
+                patch_cache_control(response, private=True)
+            patch_vary_headers(response, ['Cookie'])
+        return response
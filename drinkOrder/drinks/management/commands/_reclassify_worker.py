@@ -0,0 +1,15 @@
+"""
+Process pool entry points for reclassify_reviews. Kept apart from the command
+module so spawned workers can unpickle them before Django is set up.
+"""
+import django
+
+
+def init_worker():
+    django.setup()
+
+
+def classify_chunk(texts, batch_size):
+    from drinks.sentiment import SentimentClassifier
+    # None when the model is unavailable; the parent aborts on it
+    return SentimentClassifier().classify_batch(texts, batch_size=batch_size, fallback=None)
@@ -0,0 +1,70 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from drinks.models import Review, SentimentJob
+from drinks.sentiment import SentimentClassifier
+
+logger = logging.getLogger('django')
+
+
+class Command(BaseCommand):
+    help = 'Classify queued review sentiment in micro-batches and write the results back in bulk.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=32, help='Number of reviews classified per pipeline call')
+        parser.add_argument('--max-attempts', type=int, default=3, help='Skip jobs that already failed this many times')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new jobs instead of exiting when the queue is empty')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to sleep between polls when --loop is set')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        classifier = SentimentClassifier()
+        total = 0
+        while True:
+            processed = self.process_batch(classifier, batch_size, options['max_attempts'])
+            total += processed
+            if processed:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['poll_interval'])
+        self.stdout.write(self.style.SUCCESS(f"Processed {total} sentiment jobs"))
+        self.stdout.write(f"Sentiment cache: {classifier.cache.stats}")
+
+    def process_batch(self, classifier, batch_size, max_attempts):
+        '''
+        Claims up to batch_size jobs, classifies them in one pipeline call and
+        returns the number of jobs handled (0 when the queue is drained). When
+        the model is unavailable the jobs stay queued with one more attempt
+        counted, and 0 is returned so the next try waits for the next poll.
+        '''
+        claimed_at = timezone.now()
+        jobs = list(
+            SentimentJob.objects.select_related('review')
+            .filter(attempts__lt=max_attempts)[:batch_size]
+        )
+        if not jobs:
+            return 0
+        job_ids = [job.pk for job in jobs]
+        SentimentJob.objects.filter(pk__in=job_ids).update(attempts=F('attempts') + 1)
+
+        reviews = [job.review for job in jobs]
+        sentiments = classifier.classify_batch([review.text for review in reviews], batch_size=batch_size, fallback=None)
+        if sentiments is None:
+            logger.error(f"Sentiment model unavailable, leaving jobs {job_ids} queued")
+            return 0
+        try:
+            with transaction.atomic():
+                Review.update_sentiments({review.pk: sentiment for review, sentiment in zip(reviews, sentiments)})
+                # Jobs re-queued by an edit after we claimed them stay in the queue
+                SentimentJob.objects.filter(pk__in=job_ids, enqueued_on__lte=claimed_at).delete()
+        except Exception as e:
+            logger.error(f"Failed to store sentiment for jobs {job_ids}: {str(e)}")
+        else:
+            logger.info(f"Classified sentiment for {len(reviews)} reviews")
+        return len(jobs)
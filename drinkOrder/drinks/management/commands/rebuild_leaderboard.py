@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+
+from drinks.menu_cache import bump_catalog_version
+from drinks.models import Drink, DrinkLeaderboard, DrinkLeaderboardDay
+from orders.archive import archived_quantities
+from orders.models import OrderItem
+
+
+class Command(BaseCommand):
+    help = 'Recompute the top-drinks leaderboard counters from the order history, repairing any drift.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            before = dict(DrinkLeaderboard.objects.values_list('drink_id', 'total_quantity'))
+            # Orders moved out by archive_orders still count towards the leaderboard
+            totals = archived_quantities()
+            totals.update(dict(
+                OrderItem.objects.values('drink_id').annotate(total_quantity=Sum('quantity')).values_list('drink_id', 'total_quantity')
+            ))
+            daily = archived_quantities(by_day=True)
+            daily.update({
+                (row['drink_id'], row['day']): row['quantity']
+                for row in OrderItem.objects.annotate(
+                    day=TruncDate('order__created_on')
+                ).values('drink_id', 'day').annotate(quantity=Sum('quantity'))
+            })
+
+            # Archived lines may name drinks deleted since
+            drink_ids = set(Drink.objects.values_list('id', flat=True))
+            totals = {drink_id: quantity for drink_id, quantity in totals.items() if drink_id in drink_ids}
+            daily = {key: quantity for key, quantity in daily.items() if key[0] in drink_ids}
+
+            DrinkLeaderboard.objects.all().delete()
+            DrinkLeaderboardDay.objects.all().delete()
+            DrinkLeaderboard.objects.bulk_create([
+                DrinkLeaderboard(drink_id=drink_id, total_quantity=total_quantity) for drink_id, total_quantity in totals.items()
+            ])
+            DrinkLeaderboardDay.objects.bulk_create([
+                DrinkLeaderboardDay(drink_id=drink_id, day=day, quantity=quantity) for (drink_id, day), quantity in daily.items()
+            ])
+            bump_catalog_version()
+
+        after = totals
+        drifted = [drink_id for drink_id in before.keys() | after.keys() if before.get(drink_id, 0) != after.get(drink_id, 0)]
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt leaderboard for {len(after)} drinks; {len(drifted)} all-time counters had drifted"
+        ))
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from drinks.menu_cache import bump_catalog_version
+from drinks.models import Drink, Review
+
+STAT_FIELDS = ['rating_sum', 'rating_count', 'positive_count', 'negative_count', 'neutral_count', 'pending_count']
+
+
+def review_stats():
+    """
+    Returns drink id -> dict of the review aggregates recomputed from the
+    reviews table.
+    """
+    rows = Review.objects.values('drink_id').annotate(
+        rating_sum=Sum('rating'),
+        rating_count=Count('id'),
+        positive_count=Count('id', filter=Q(sentiment='positive')),
+        negative_count=Count('id', filter=Q(sentiment='negative')),
+        neutral_count=Count('id', filter=Q(sentiment='neutral')),
+        pending_count=Count('id', filter=Q(sentiment='pending')),
+    )
+    return {row.pop('drink_id'): row for row in rows}
+
+
+class Command(BaseCommand):
+    help = "Check the denormalized review aggregates on Drink against the reviews and repair any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only report drinks whose aggregates are wrong')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            expected = review_stats()
+            drifted = []
+            for drink in Drink.objects.only('id', 'name', *STAT_FIELDS):
+                stats = expected.get(drink.id, dict.fromkeys(STAT_FIELDS, 0))
+                if any(getattr(drink, field) != stats[field] for field in STAT_FIELDS):
+                    self.stdout.write(f"{drink.name} (id {drink.id}): stored "
+                                      f"{[getattr(drink, field) for field in STAT_FIELDS]}, expected {[stats[field] for field in STAT_FIELDS]}")
+                    for field in STAT_FIELDS:
+                        setattr(drink, field, stats[field])
+                    drifted.append(drink)
+            if drifted and not options['check']:
+                Drink.objects.bulk_update(drifted, STAT_FIELDS)
+                bump_catalog_version([drink.id for drink in drifted])
+
+        if options['check']:
+            self.stdout.write(f"{len(drifted)} drinks have drifted review aggregates")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Repaired review aggregates for {len(drifted)} drinks"))
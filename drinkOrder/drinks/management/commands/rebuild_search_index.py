@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from drinks.menu_cache import bump_catalog_version
+from drinks.search import fts_available, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Repopulate the drink search index, e.g. after bulk imports that bypass signals.'
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            raise CommandError('The FTS5 search index is not available on this database')
+        with transaction.atomic():
+            count = rebuild_index()
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} drinks"))
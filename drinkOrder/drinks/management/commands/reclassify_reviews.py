@@ -0,0 +1,104 @@
+import logging
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from drinks.models import Review
+from drinks.sentiment import SentimentClassifier
+from ._reclassify_worker import classify_chunk, init_worker
+
+logger = logging.getLogger('django')
+
+
+class Command(BaseCommand):
+    help = 'Re-run sentiment classification over every review, streaming the table in chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Reviews read and written per chunk')
+        parser.add_argument('--batch-size', type=int, default=32, help='Pipeline batch size inside a chunk')
+        parser.add_argument('--workers', type=int, default=1, help='Classify chunks in this many processes')
+        parser.add_argument('--checkpoint', help='File recording the last review id written, used to resume')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint and start from the first review')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1 or options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--chunk-size, --batch-size and --workers must be positive')
+
+        checkpoint = Path(options['checkpoint']) if options['checkpoint'] else None
+        last_id = 0
+        if checkpoint and checkpoint.exists() and not options['restart']:
+            last_id = int(checkpoint.read_text().strip() or 0)
+            self.stdout.write(f"Resuming after review {last_id}")
+
+        self.checkpoint = checkpoint
+        self.scanned = 0
+        self.changed = 0
+        started = time.monotonic()
+
+        if options['workers'] > 1:
+            self.run_pool(last_id, options)
+        else:
+            classifier = SentimentClassifier()
+            for chunk in self.chunks(last_id, chunk_size):
+                sentiments = classifier.classify_batch(
+                    [review.text for review in chunk], batch_size=options['batch_size'], fallback=None
+                )
+                self.write_chunk(chunk, sentiments)
+
+        elapsed = time.monotonic() - started
+        rate = self.scanned / elapsed if elapsed > 0 else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Reclassified {self.scanned} reviews ({self.changed} changed) in {elapsed:.1f}s, {rate:.1f} reviews/sec"
+        ))
+
+    def run_pool(self, last_id, options):
+        workers = options['workers']
+        pending = deque()
+        # Spawned children start clean instead of inheriting the parent's
+        # database connection; each loads its own model copy.
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker) as pool:
+            for chunk in self.chunks(last_id, options['chunk_size']):
+                texts = [review.text for review in chunk]
+                pending.append((chunk, pool.submit(classify_chunk, texts, options['batch_size'])))
+                # Bound memory and keep checkpoints ordered by writing the oldest chunk first
+                if len(pending) >= workers * 2:
+                    chunk_done, future = pending.popleft()
+                    self.write_chunk(chunk_done, future.result())
+            while pending:
+                chunk_done, future = pending.popleft()
+                self.write_chunk(chunk_done, future.result())
+
+    def chunks(self, last_id, chunk_size):
+        '''
+        Yields the reviews after last_id in pk order, chunk_size at a time.
+        Each chunk is its own keyset query, so no read cursor stays open on
+        the reviews table while the chunks before it are written back.
+        '''
+        while True:
+            chunk = list(Review.objects.filter(pk__gt=last_id).order_by('pk').only('id', 'text')[:chunk_size])
+            if not chunk:
+                return
+            yield chunk
+            last_id = chunk[-1].pk
+
+    def write_chunk(self, chunk, sentiments):
+        if sentiments is None:
+            # Stop before the checkpoint moves past reviews that were never classified
+            raise CommandError(
+                f"Sentiment classification failed for reviews {chunk[0].pk} to {chunk[-1].pk}; "
+                f"{self.scanned} reviews were written, rerun with the same --checkpoint to resume"
+            )
+        with transaction.atomic():
+            changed = Review.update_sentiments({review.pk: sentiment for review, sentiment in zip(chunk, sentiments)})
+        self.scanned += len(chunk)
+        self.changed += changed
+        if self.checkpoint:
+            self.checkpoint.write_text(str(chunk[-1].pk))
+        logger.info(f"Reclassified reviews up to {chunk[-1].pk}: {changed} of {len(chunk)} changed")
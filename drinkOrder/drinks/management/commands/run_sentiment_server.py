@@ -0,0 +1,37 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from drinks.sentiment import SentimentClassifier
+from drinks.sentiment_server import SentimentServer
+
+
+class Command(BaseCommand):
+    help = 'Run the shared sentiment inference server on a Unix domain socket.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=settings.SENTIMENT_SERVER_SOCKET, help='Socket path (defaults to SENTIMENT_SERVER_SOCKET)')
+        parser.add_argument('--max-batch-size', type=int, default=32, help='Texts per model call')
+        parser.add_argument('--max-wait-ms', type=float, default=10, help='How long the first request in a batch waits for company')
+
+    def handle(self, *args, **options):
+        if not options['socket']:
+            raise CommandError('Pass --socket or set SENTIMENT_SERVER_SOCKET')
+        classifier = SentimentClassifier()
+        # The server always runs the model itself, whatever this process's settings say
+        classifier.server_socket = None
+        if not classifier.warm_up():
+            raise CommandError('Sentiment model could not be loaded')
+
+        server = SentimentServer(
+            lambda texts: classifier.predict_local(texts, batch_size=options['max_batch_size']),
+            options['socket'],
+            max_batch_size=options['max_batch_size'],
+            max_wait_ms=options['max_wait_ms'],
+        )
+        try:
+            asyncio.run(server.serve())
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"Sentiment server stopped: {server.stats}")
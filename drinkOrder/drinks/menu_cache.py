@@ -0,0 +1,153 @@
+"""
+Catalog versions and the version-keyed cache for rendered menu fragments.
+
+Every write that can change what a menu shows (drinks, categories, reviews,
+ordered quantities) bumps the catalog version once its transaction commits,
+along with the version of each drink whose detail page it changes. The
+versions also back the ETag/Last-Modified validators in conditional.py.
+
+Fragments are cached under the version current when they were rendered, so a
+bump retires all of them at once without tracking keys; the old entries
+simply expire. Concurrent misses on the same fragment are
+coalesced so that only one request rebuilds it: threads in a process queue on
+a striped lock, other processes wait on a cache.add() lock for the builder.
+
+Only cache.get/set/add/delete and their *_many forms are used, so this works
+with the local-memory backend (one cache per process, fine for runserver) and the
+file-based backend (shared by all gunicorn workers on a host).
+"""
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from drinkOrder.instrumentation import count
+
+logger = logging.getLogger('django')
+
+CATALOG_SCOPE = 'catalog'
+BUILD_LOCK_TIMEOUT = 30
+BUILD_WAIT = 5.0
+BUILD_POLL_INTERVAL = 0.05
+
+_thread_locks = [threading.Lock() for _ in range(64)]
+
+
+def _version_key(scope):
+    return f"drinks:version:{scope}"
+
+
+def _new_version(previous=None):
+    # Versions are nanosecond timestamps of the last change. They stay unique
+    # when an evicted counter is re-seeded, and double as Last-Modified.
+    return max(time.time_ns(), (previous or 0) + 1)
+
+
+def _version_timeout(scope):
+    # Any drink id a client asks for gets a version, deleted and nonexistent
+    # ones included, so drink versions expire; expiry just re-seeds a newer one
+    if scope == CATALOG_SCOPE:
+        return None
+    return getattr(settings, 'DRINK_VERSION_TIMEOUT', 86400)
+
+
+def get_version(scope):
+    key = _version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), _version_timeout(scope))
+        version = cache.get(key)
+    return version
+
+
+def catalog_version():
+    return get_version(CATALOG_SCOPE)
+
+
+def drink_version(drink_id):
+    return get_version(f"drink:{drink_id}")
+
+
+def version_modified(version):
+    return datetime.fromtimestamp(version / 1e9, tz=dt_timezone.utc)
+
+
+def _bump(scopes):
+    keys = {_version_key(scope): _version_timeout(scope) for scope in scopes}
+    current = cache.get_many(list(keys))
+    for timeout in set(keys.values()):
+        cache.set_many({
+            key: _new_version(current.get(key)) for key, key_timeout in keys.items() if key_timeout == timeout
+        }, timeout)
+
+
+def bump_catalog_version(drink_ids=()):
+    '''
+    Invalidates every cached menu fragment, and the detail pages of
+    drink_ids, once the current transaction commits (immediately outside
+    one), so no request can cache the pre-commit state under the new version.
+    '''
+    scopes = [CATALOG_SCOPE] + [f"drink:{drink_id}" for drink_id in drink_ids]
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def bump_drink_versions(drink_ids):
+    '''
+    Like bump_catalog_version() for changes that only show on the drinks'
+    detail pages, such as a reviewer's profile.
+    '''
+    scopes = [f"drink:{drink_id}" for drink_id in drink_ids]
+    if scopes:
+        transaction.on_commit(lambda: _bump(scopes))
+
+
+def fragment_key(name, *parts):
+    digest = hashlib.md5('\x1f'.join(str(part) for part in parts).encode()).hexdigest()
+    return f"drinks:menu:{name}:{catalog_version()}:{digest}"
+
+
+def get_or_build(key, build, timeout=None):
+    '''
+    Returns the cached value for key, calling build() to produce and store it
+    on a miss. Concurrent misses wait for a single build instead of all
+    rebuilding; a waiter gives up after BUILD_WAIT seconds and builds itself.
+    '''
+    value = cache.get(key)
+    if value is not None:
+        count('menu-cache', 'hit')
+        return value
+    count('menu-cache', 'miss')
+    if timeout is None:
+        timeout = getattr(settings, 'MENU_CACHE_TIMEOUT', 300)
+
+    with _thread_locks[hash(key) % len(_thread_locks)]:
+        value = cache.get(key)
+        if value is not None:
+            return value
+
+        lock_key = f"{key}:lock"
+        if cache.add(lock_key, 1, BUILD_LOCK_TIMEOUT):
+            try:
+                value = build()
+                cache.set(key, value, timeout)
+            finally:
+                cache.delete(lock_key)
+            return value
+
+        deadline = time.monotonic() + BUILD_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(BUILD_POLL_INTERVAL)
+            value = cache.get(key)
+            if value is not None:
+                return value
+            if cache.get(lock_key) is None:
+                break
+        logger.warning(f"Menu fragment {key} was not built by another worker in time, building it here")
+        value = build()
+        cache.set(key, value, timeout)
+        return value
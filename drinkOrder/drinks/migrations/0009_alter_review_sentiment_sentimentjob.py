@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drinks', '0008_review_sentiment'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='review',
+            name='sentiment',
+            field=models.CharField(choices=[('positive', 'Positive'), ('negative', 'Negative'), ('neutral', 'Neutral'), ('pending', 'Pending')], default='neutral', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='SentimentJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('enqueued_on', models.DateTimeField(auto_now=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('review', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='sentiment_job', to='drinks.review')),
+            ],
+            options={
+                'ordering': ['enqueued_on'],
+            },
+        ),
+    ]
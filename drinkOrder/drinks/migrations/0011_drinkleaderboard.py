@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_leaderboard(apps, schema_editor):
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    DrinkLeaderboard = apps.get_model('drinks', 'DrinkLeaderboard')
+    DrinkLeaderboardDay = apps.get_model('drinks', 'DrinkLeaderboardDay')
+    DrinkLeaderboard.objects.bulk_create([
+        DrinkLeaderboard(drink_id=row['drink_id'], total_quantity=row['total_quantity'])
+        for row in OrderItem.objects.values('drink_id').annotate(total_quantity=Sum('quantity'))
+    ])
+    DrinkLeaderboardDay.objects.bulk_create([
+        DrinkLeaderboardDay(drink_id=row['drink_id'], day=row['day'], quantity=row['quantity'])
+        for row in OrderItem.objects.annotate(day=TruncDate('order__created_on')).values('drink_id', 'day').annotate(quantity=Sum('quantity'))
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drinks', '0010_sentimentcacheentry'),
+        ('orders', '0003_alter_order_customer_alter_order_status_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DrinkLeaderboard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_quantity', models.IntegerField(db_index=True, default=0)),
+                ('drink', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard', to='drinks.drink')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DrinkLeaderboardDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('drink', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_days', to='drinks.drink')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'drink'], name='drinks_drin_day_9b500f_idx')],
+                'unique_together': {('drink', 'day')},
+            },
+        ),
+        migrations.RunPython(backfill_leaderboard, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:45
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_review_stats(apps, schema_editor):
+    Drink = apps.get_model('drinks', 'Drink')
+    Review = apps.get_model('drinks', 'Review')
+    rows = Review.objects.values('drink_id').annotate(
+        rating_sum=Sum('rating'),
+        rating_count=Count('id'),
+        positive_count=Count('id', filter=Q(sentiment='positive')),
+        negative_count=Count('id', filter=Q(sentiment='negative')),
+        neutral_count=Count('id', filter=Q(sentiment='neutral')),
+        pending_count=Count('id', filter=Q(sentiment='pending')),
+    )
+    for row in rows:
+        Drink.objects.filter(pk=row.pop('drink_id')).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drinks', '0011_drinkleaderboard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drink',
+            name='negative_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='drink',
+            name='neutral_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='drink',
+            name='pending_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='drink',
+            name='positive_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='drink',
+            name='rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='drink',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_review_stats, migrations.RunPython.noop),
+    ]
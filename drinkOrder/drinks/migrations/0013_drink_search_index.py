@@ -0,0 +1,40 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 is SQLite-only; other databases keep using name__icontains
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE drinks_drink_fts USING fts5("
+            "name, category, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+    except OperationalError:
+        # SQLite built without FTS5
+        return
+    schema_editor.execute("CREATE VIRTUAL TABLE drinks_drink_fts_vocab USING fts5vocab('drinks_drink_fts', 'row')")
+    schema_editor.execute(
+        "INSERT INTO drinks_drink_fts (rowid, name, category) "
+        "SELECT drinks_drink.id, drinks_drink.name, COALESCE(drinks_category.name, '') "
+        "FROM drinks_drink LEFT JOIN drinks_category ON drinks_category.id = drinks_drink.category_id"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS drinks_drink_fts_vocab")
+    schema_editor.execute("DROP TABLE IF EXISTS drinks_drink_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drinks', '0012_drink_review_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
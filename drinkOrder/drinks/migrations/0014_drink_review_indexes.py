@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drinks', '0013_drink_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='drink',
+            index=models.Index(fields=['name'], name='drink_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='drink',
+            index=models.Index(fields=['category', 'name'], name='drink_category_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['drink', '-created_on'], name='review_drink_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['drink', 'sentiment', '-created_on'], name='review_drink_sentiment_idx'),
+        ),
+    ]
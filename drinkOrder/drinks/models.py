@@ -1,42 +1,15 @@
-from django.db import models
+from django.db import models, transaction
+from django.conf import settings
 from users.models import CustomUser
-from django.db.models import Sum
-from transformers import pipeline
+from django.db.models import Case, F, Sum, When
+from django.utils import timezone
+from .sentiment import SentimentClassifier
+from .menu_cache import bump_catalog_version
+from drinkOrder.instrumentation import timed_function
+from collections import Counter
 import logging
 
 logger = logging.getLogger('django')
-# Singleton for sentiment analysis model
-class SentimentClassifier:
-    _instance = None
-    _classifier = None
-
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(SentimentClassifier, cls).__new__(cls)
-            try:
-                cls._classifier = pipeline('sentiment-analysis', model='distilbert-base-uncased-finetuned-sst-2-english')
-            except Exception as e:
-                logger.error(f"Failed to load sentiment classifier: {str(e)}")
-                cls._classifier = None
-        return cls._instance
-
-    def classify(self, text):
-        if self._classifier is None:
-            return 'neutral'  # Fallback if model fails to load
-        try:
-            result = self._classifier(text)[0]
-            label = result['label'].lower()
-            score = result['score']
-            # Map model output to sentiment (adjust thresholds as needed)
-            if label == 'positive' and score > 0.7:
-                return 'positive'
-            elif label == 'negative' and score > 0.7:
-                return 'negative'
-            else:
-                return 'neutral'
-        except Exception as e:
-            logger.error(f"Sentiment classification error: {str(e)}")
-            return 'neutral'
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
@@ -53,36 +26,147 @@ class Drink (models.Model):
     image = models.ImageField(upload_to='drinks/', blank=True, null=True)
     price = models.DecimalField(max_digits=5, decimal_places=2)
     is_available = models.BooleanField(default=True)
+    # Review aggregates, maintained with the reviews (see adjust_review_stats)
+    rating_sum = models.IntegerField(default=0)
+    rating_count = models.IntegerField(default=0)
+    positive_count = models.IntegerField(default=0)
+    negative_count = models.IntegerField(default=0)
+    neutral_count = models.IntegerField(default=0)
+    pending_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name'], name='drink_name_idx'),
+            models.Index(fields=['category', 'name'], name='drink_category_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
+
+    @property
+    def avg_rating(self):
+        if not self.rating_count:
+            return None
+        return self.rating_sum / self.rating_count
+
+    @classmethod
+    def adjust_review_stats(cls, drink_id, rating=0, count=0, sentiments=None):
+        """
+        Moves the denormalized review aggregates of one drink by the given
+        deltas; sentiments maps a sentiment to its count delta. Call inside the
+        transaction that writes the reviews.
+        """
+        updates = {}
+        if rating:
+            updates['rating_sum'] = F('rating_sum') + rating
+        if count:
+            updates['rating_count'] = F('rating_count') + count
+        for sentiment, delta in (sentiments or {}).items():
+            if delta:
+                field = f'{sentiment}_count'
+                updates[field] = F(field) + delta
+        if updates:
+            cls.objects.filter(pk=drink_id).update(**updates)
     
     @classmethod
-    def get_top_drinks(cls, limit=5):
+    @timed_function('top-drinks')
+    def get_top_drinks(cls, limit=5, window='all'):
         """
         Returns the top most ordered drinks, ranked by total quantity ordered.
+        window is 'all', 'today' or '7d'; counts come from the incrementally
+        maintained DrinkLeaderboard tables rather than the order history.
         Returns a list of dicts with 'drink', 'total_quantity', and 'rank'.
         """
         try:
-            top_drinks = cls.objects.filter(is_available=True).annotate(
-                total_quantity=Sum('orderitem__quantity')
-            ).exclude(total_quantity__isnull=True).order_by('-total_quantity')[:limit]
-            
+            if window == 'all':
+                rows = [
+                    (entry.drink, entry.total_quantity)
+                    for entry in DrinkLeaderboard.objects.select_related('drink').filter(
+                        drink__is_available=True, total_quantity__gt=0
+                    ).order_by('-total_quantity')[:limit]
+                ]
+            else:
+                days = {'today': 1, '7d': 7}[window]
+                since = timezone.localdate() - timezone.timedelta(days=days - 1)
+                totals = DrinkLeaderboardDay.objects.filter(
+                    day__gte=since, drink__is_available=True
+                ).values('drink').annotate(
+                    total_quantity=Sum('quantity')
+                ).filter(total_quantity__gt=0).order_by('-total_quantity')[:limit]
+                drinks = cls.objects.in_bulk([row['drink'] for row in totals])
+                rows = [(drinks[row['drink']], row['total_quantity']) for row in totals]
+
             # Assign ranks (1 to limit)
             ranked_drinks = [
-                {'drink': drink, 'total_quantity': drink.total_quantity, 'rank': index + 1}
-                for index, drink in enumerate(top_drinks)
+                {'drink': drink, 'total_quantity': total_quantity, 'rank': index + 1}
+                for index, (drink, total_quantity) in enumerate(rows)
             ]
             logger.info(f"Retrieved top ordered drinks: {[d['drink'].name for d in ranked_drinks]}")
             return ranked_drinks
         except Exception as e:
             logger.error(f"Error retrieving top ordered drinks: {str(e)}")
             return []
+
+class DrinkLeaderboard(models.Model):
+    """
+    All-time ordered quantity per drink, kept in step with OrderItem writes
+    by DrinkLeaderboard.record(). Rebuild with the rebuild_leaderboard command.
+    """
+    drink = models.OneToOneField(Drink, on_delete=models.CASCADE, related_name='leaderboard')
+    total_quantity = models.IntegerField(default=0, db_index=True)
+
+    def __str__(self):
+        return f"{self.drink.name}: {self.total_quantity}"
+
+    @classmethod
+    def record(cls, quantities, ordered_on):
+        """
+        Adds quantities, a dict of drink id -> quantity delta (negative for
+        removed or cancelled items), to the all-time counters and to the daily
+        counters for the day the order was placed. Call inside the transaction
+        that writes the OrderItems.
+        """
+        quantities = {drink_id: delta for drink_id, delta in quantities.items() if delta}
+        if not quantities:
+            return
+        day = timezone.localdate(ordered_on)
+        # Make sure every counter row exists, then bump it with F() so concurrent
+        # orders never lose an update; one UPDATE per table covers every drink.
+        cls.objects.bulk_create(
+            [cls(drink_id=drink_id) for drink_id in quantities], ignore_conflicts=True
+        )
+        DrinkLeaderboardDay.objects.bulk_create(
+            [DrinkLeaderboardDay(drink_id=drink_id, day=day) for drink_id in quantities], ignore_conflicts=True
+        )
+        cls.objects.filter(drink_id__in=list(quantities)).update(
+            total_quantity=F('total_quantity') + Case(*[When(drink_id=drink_id, then=delta) for drink_id, delta in quantities.items()])
+        )
+        DrinkLeaderboardDay.objects.filter(drink_id__in=list(quantities), day=day).update(
+            quantity=F('quantity') + Case(*[When(drink_id=drink_id, then=delta) for drink_id, delta in quantities.items()])
+        )
+
+class DrinkLeaderboardDay(models.Model):
+    """
+    Ordered quantity per drink per day (the day the order was placed), used for
+    the 'today' and '7d' leaderboard windows.
+    """
+    drink = models.ForeignKey(Drink, on_delete=models.CASCADE, related_name='leaderboard_days')
+    day = models.DateField()
+    quantity = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('drink', 'day')
+        indexes = [models.Index(fields=['day', 'drink'])]
+
+    def __str__(self):
+        return f"{self.drink.name} on {self.day}: {self.quantity}"
+
 class Review(models.Model):
     SENTIMENT_CHOICES = [
         ('positive', 'Positive'),
         ('negative', 'Negative'),
         ('neutral', 'Neutral'),
+        ('pending', 'Pending'),
     ]    
     drink = models.ForeignKey(Drink, on_delete=models.CASCADE, related_name='reviews')
     customer = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
@@ -94,23 +178,108 @@ class Review(models.Model):
     class Meta:
         unique_together = ('drink', 'customer')
         ordering = ['-created_on']
+        indexes = [
+            # Drink detail reviews, newest first, optionally by sentiment
+            models.Index(fields=['drink', '-created_on'], name='review_drink_created_idx'),
+            models.Index(fields=['drink', 'sentiment', '-created_on'], name='review_drink_sentiment_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         # Check if text has changed or this is a new review
-        original_text = None
+        original = None
         if self.pk:  # Existing review
-            try:
-                original_text = Review.objects.get(pk=self.pk).text
-            except Review.DoesNotExist:
-                pass
+            original = Review.objects.filter(pk=self.pk).values('text', 'rating', 'sentiment').first()
+        original_text = original['text'] if original else None
         # Classify sentiment if new review or text has changed
-        if original_text is None or original_text != self.text:
+        text_changed = original_text is None or original_text != self.text
+        deferred = text_changed and getattr(settings, 'SENTIMENT_DEFERRED', True)
+        if text_changed and not deferred:
             classifier = SentimentClassifier()
-            new_sentiment = classifier.classify(self.text)
-            if self.sentiment != new_sentiment:
-                self.sentiment = new_sentiment
+            sentiments = classifier.classify_batch([self.text], batch_size=1, fallback=None)
+            if sentiments is None:
+                # The model or the sentiment server failed; let the worker retry
+                deferred = True
+            elif self.sentiment != sentiments[0]:
+                self.sentiment = sentiments[0]
                 logger.info(f"Sentiment updated for review {self.pk or 'new'} to {self.sentiment}")
-        super().save(*args, **kwargs)
+        if deferred:
+            # Leave classification to the process_sentiment_jobs worker
+            self.sentiment = 'pending'
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if deferred:
+                SentimentJob.enqueue(self)
+            if original is None:
+                Drink.adjust_review_stats(self.drink_id, rating=self.rating, count=1, sentiments={self.sentiment: 1})
+            else:
+                sentiments = Counter({self.sentiment: 1})
+                sentiments[original['sentiment']] -= 1
+                Drink.adjust_review_stats(self.drink_id, rating=self.rating - original['rating'], sentiments=sentiments)
+
+    @classmethod
+    def update_sentiments(cls, sentiments):
+        """
+        Writes sentiments, a dict of review id -> sentiment, with one
+        bulk_update and moves the per-drink sentiment counts to match.
+        Returns the number of reviews whose sentiment changed. Call inside a
+        transaction.
+        """
+        changed = []
+        deltas = {}
+        for review in cls.objects.filter(pk__in=list(sentiments)).only('id', 'drink_id', 'sentiment'):
+            new_sentiment = sentiments[review.pk]
+            if review.sentiment == new_sentiment:
+                continue
+            drink_deltas = deltas.setdefault(review.drink_id, Counter())
+            drink_deltas[review.sentiment] -= 1
+            drink_deltas[new_sentiment] += 1
+            review.sentiment = new_sentiment
+            changed.append(review)
+        cls.objects.bulk_update(changed, ['sentiment'])
+        for drink_id, drink_deltas in deltas.items():
+            Drink.adjust_review_stats(drink_id, sentiments=drink_deltas)
+        if changed:
+            # bulk_update sends no post_save, so invalidate the cached pages here
+            bump_catalog_version(list(deltas))
+        return len(changed)
+
+    def __str__(self):
+        return f"{self.customer.username}'s review of {self.drink.name} ({self.rating} stars)"
+
+class SentimentJob(models.Model):
+    """
+    Pending sentiment classification for a review, drained in batches by
+    the process_sentiment_jobs management command.
+    """
+    review = models.OneToOneField(Review, on_delete=models.CASCADE, related_name='sentiment_job')
+    enqueued_on = models.DateTimeField(auto_now=True)
+    attempts = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['enqueued_on']
+
+    @classmethod
+    def enqueue(cls, review):
+        # Re-queueing an edited review refreshes enqueued_on so a batch that is
+        # already classifying the old text will not drop the new job.
+        job, created = cls.objects.update_or_create(review=review, defaults={'attempts': 0})
+        logger.info(f"Queued sentiment job for review {review.pk}")
+        return job
+
+    def __str__(self):
+        return f"Sentiment job for review {self.review_id}"
+
+class SentimentCacheEntry(models.Model):
+    """
+    Persistent tier of SentimentCache. One row per normalized review text.
+    """
+    text_hash = models.CharField(max_length=64, unique=True)
+    model_version = models.CharField(max_length=150)
+    sentiment = models.CharField(max_length=20, choices=Review.SENTIMENT_CHOICES)
+    updated_on = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Sentiment cache entries"
 
     def __str__(self):
-        return f"{self.customer.username}'s review of {self.drink.name} ({self.rating} stars)"
\ No newline at end of file
+        return f"{self.text_hash[:12]} ({self.sentiment})"
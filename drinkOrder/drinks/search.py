@@ -0,0 +1,129 @@
+"""
+Drink search backed by an SQLite FTS5 index over drink and category names.
+
+drinks_drink_fts holds one row per drink (rowid = drink id) and is kept in
+sync by the signals in drinks.signals; rebuild_search_index repopulates it
+after bulk writes. Each search term is matched as a prefix and results are
+ranked by bm25 with the drink name weighted above the category. The index
+only matches from the start of a word, so the menus fall back to a substring
+match on the name when a search finds nothing, and only then correct misspelt
+terms against the index vocabulary.
+On databases without FTS5 the search falls back to name__icontains.
+"""
+import difflib
+import logging
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+logger = logging.getLogger('django')
+
+FTS_TABLE = 'drinks_drink_fts'
+VOCAB_TABLE = 'drinks_drink_fts_vocab'
+# bm25 column weights: name, category
+RANK_SQL = f"bm25({FTS_TABLE}, 10.0, 1.0)"
+
+_fts_available = None
+
+
+def fts_available():
+    global _fts_available
+    if _fts_available is None:
+        _fts_available = connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+    return _fts_available
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def match_expression(terms):
+    # Quoting keeps FTS5 operators in user input literal; * makes each term a prefix
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_drinks(queryset, query):
+    """
+    Filters queryset to drinks matching every term of query, best match first.
+    Evaluates to a single SQL query.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none()
+    if not fts_available():
+        return queryset.filter(name__icontains=query).order_by('name')
+    match = match_expression(terms)
+    drink_table = queryset.model._meta.db_table
+    # The MATCH runs once for the id filter; the rank is looked up by rowid
+    # for the matching drinks only
+    return queryset.filter(
+        id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+    ).annotate(
+        search_rank=RawSQL(
+            f"SELECT {RANK_SQL} FROM {FTS_TABLE} WHERE {FTS_TABLE}.rowid = {drink_table}.id AND {FTS_TABLE} MATCH %s",
+            [match],
+        )
+    ).order_by('search_rank', 'name')
+
+
+def suggest_query(query):
+    """
+    Returns query with each term the index doesn't know replaced by the
+    closest indexed term (same first letter), or None if nothing changed.
+    """
+    if not fts_available():
+        return None
+    terms = search_terms(query)
+    corrected = []
+    with connection.cursor() as cursor:
+        for term in terms:
+            # Terms that prefix-match something are fine as they are
+            cursor.execute(f"SELECT term FROM {VOCAB_TABLE} WHERE term >= %s AND term < %s LIMIT 1", [term, term + '\uffff'])
+            if cursor.fetchone():
+                corrected.append(term)
+                continue
+            cursor.execute(f"SELECT term FROM {VOCAB_TABLE} WHERE term >= %s AND term < %s", [term[0], term[0] + '\uffff'])
+            candidates = [row[0] for row in cursor.fetchall()]
+            match = difflib.get_close_matches(term, candidates, n=1, cutoff=0.7)
+            corrected.append(match[0] if match else term)
+    if corrected == terms:
+        return None
+    return ' '.join(corrected)
+
+
+def index_drinks(drink_ids):
+    """
+    (Re)writes the index rows of the given drinks from the current table data.
+    Drinks that no longer exist are removed from the index.
+    """
+    if not fts_available():
+        return
+    drink_ids = list(drink_ids)
+    if not drink_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(drink_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", drink_ids)
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, category) "
+            f"SELECT drinks_drink.id, drinks_drink.name, COALESCE(drinks_category.name, '') "
+            f"FROM drinks_drink LEFT JOIN drinks_category ON drinks_category.id = drinks_drink.category_id "
+            f"WHERE drinks_drink.id IN ({placeholders})",
+            drink_ids,
+        )
+
+
+def rebuild_index():
+    if not fts_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, category) "
+            f"SELECT drinks_drink.id, drinks_drink.name, COALESCE(drinks_category.name, '') "
+            f"FROM drinks_drink LEFT JOIN drinks_category ON drinks_category.id = drinks_drink.category_id"
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT count(*) FROM {FTS_TABLE}")
+        return cursor.fetchone()[0]
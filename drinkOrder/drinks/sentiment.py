@@ -0,0 +1,279 @@
+"""
+Review sentiment classification. Kept out of drinks.models so that importing
+the models (every manage.py command and worker boot) never imports
+transformers or torch; the model is loaded on first use or by warm_up().
+"""
+from collections import OrderedDict
+import hashlib
+import logging
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+from drinkOrder.instrumentation import count, timed
+
+logger = logging.getLogger('django')
+
+DEFAULT_SENTIMENT_MODEL = 'distilbert-base-uncased-finetuned-sst-2-english'
+
+SENTIMENT_BACKENDS = ('pytorch', 'quantized', 'onnx')
+
+
+def build_pipeline(model_name, backend='pytorch', num_threads=None, onnx_path=None):
+    """
+    Builds a transformers sentiment-analysis pipeline on one of the CPU backends:
+    - pytorch: the full-precision model
+    - quantized: the PyTorch model with Linear layers dynamically quantized to int8
+    - onnx: an ONNX Runtime session via optimum, exported once to onnx_path if given
+    num_threads caps intra-op threads for torch or the ONNX Runtime session.
+    """
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer, pipeline
+
+    if backend not in SENTIMENT_BACKENDS:
+        raise ValueError(f"Unknown sentiment backend '{backend}', expected one of {SENTIMENT_BACKENDS}")
+
+    if backend == 'onnx':
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+        session_options = onnxruntime.SessionOptions()
+        if num_threads:
+            session_options.intra_op_num_threads = num_threads
+        if onnx_path and Path(onnx_path, 'model.onnx').exists():
+            model = ORTModelForSequenceClassification.from_pretrained(onnx_path, session_options=session_options)
+            tokenizer = AutoTokenizer.from_pretrained(onnx_path)
+        else:
+            model = ORTModelForSequenceClassification.from_pretrained(model_name, export=True, session_options=session_options)
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+            if onnx_path:
+                model.save_pretrained(onnx_path)
+                tokenizer.save_pretrained(onnx_path)
+        return pipeline('sentiment-analysis', model=model, tokenizer=tokenizer)
+
+    import torch
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if backend == 'quantized':
+        model = AutoModelForSequenceClassification.from_pretrained(model_name)
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        return pipeline('sentiment-analysis', model=model, tokenizer=tokenizer)
+    return pipeline('sentiment-analysis', model=model_name)
+
+
+def to_sentiment(result, threshold):
+    label = result['label'].lower()
+    score = result['score']
+    # Map model output to sentiment (adjust thresholds as needed)
+    if label == 'positive' and score > threshold:
+        return 'positive'
+    elif label == 'negative' and score > threshold:
+        return 'negative'
+    else:
+        return 'neutral'
+
+
+class SentimentCache:
+    """
+    Two-tier cache of sentiment results keyed by a hash of the normalized
+    review text: a bounded in-process LRU in front of SentimentCacheEntry rows.
+    Entries are only valid for the model_version they were computed with.
+    """
+    def __init__(self, model_version, max_size=1024):
+        self.model_version = model_version
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0}
+
+    @staticmethod
+    def normalize(text):
+        # Only the cache key is normalized: reviews differing in case and
+        # spacing share an entry, but the model always sees the original text
+        return ' '.join((text or '').split()).lower()
+
+    @staticmethod
+    def text_hash(normalized_text):
+        return hashlib.sha256(normalized_text.encode('utf-8')).hexdigest()
+
+    def _remember(self, key, sentiment):
+        with self._lock:
+            self._entries[key] = sentiment
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_many(self, hashes):
+        """
+        Returns a dict of text hash -> sentiment for the hashes found in
+        either tier. Persistent hits are promoted into the LRU.
+        """
+        found = {}
+        missing = []
+        with self._lock:
+            for key in hashes:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+                    self.stats['memory_hits'] += 1
+                else:
+                    missing.append(key)
+        if missing:
+            try:
+                from .models import SentimentCacheEntry
+                rows = SentimentCacheEntry.objects.filter(
+                    text_hash__in=missing, model_version=self.model_version
+                ).values_list('text_hash', 'sentiment')
+                for key, sentiment in rows:
+                    found[key] = sentiment
+                    self._remember(key, sentiment)
+                    self.stats['db_hits'] += 1
+            except Exception as e:
+                logger.error(f"Sentiment cache lookup failed: {str(e)}")
+            self.stats['misses'] += len([key for key in missing if key not in found])
+        return found
+
+    def set_many(self, results):
+        for key, sentiment in results.items():
+            self._remember(key, sentiment)
+        try:
+            from .models import SentimentCacheEntry
+            # Upsert so rows left by an older model version are overwritten in place
+            SentimentCacheEntry.objects.bulk_create(
+                [SentimentCacheEntry(text_hash=key, model_version=self.model_version, sentiment=sentiment)
+                 for key, sentiment in results.items()],
+                update_conflicts=True,
+                unique_fields=['text_hash'],
+                update_fields=['model_version', 'sentiment', 'updated_on'],
+            )
+        except Exception as e:
+            logger.error(f"Sentiment cache write failed: {str(e)}")
+
+# Singleton for sentiment analysis model. The transformers pipeline is only
+# imported and built the first time a text actually needs the model.
+class SentimentClassifier:
+    _instance = None
+    _classifier = None
+    _loaded = False
+    _load_lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(SentimentClassifier, cls).__new__(cls)
+            cls.model_name = getattr(settings, 'SENTIMENT_MODEL', DEFAULT_SENTIMENT_MODEL)
+            cls.threshold = getattr(settings, 'SENTIMENT_THRESHOLD', 0.7)
+            cls.backend = getattr(settings, 'SENTIMENT_BACKEND', 'pytorch')
+            cls.server_socket = getattr(settings, 'SENTIMENT_SERVER_SOCKET', None)
+            # Quantized/ONNX outputs can differ slightly, so each backend gets its own cache entries
+            cls.cache = SentimentCache(
+                f"{cls.model_name}/{cls.backend}@{cls.threshold}",
+                max_size=getattr(settings, 'SENTIMENT_CACHE_SIZE', 1024),
+            )
+        return cls._instance
+
+    @classmethod
+    def _load(cls):
+        with cls._load_lock:
+            if cls._loaded:
+                return cls._classifier
+            started = time.monotonic()
+            try:
+                cls._classifier = build_pipeline(
+                    cls.model_name,
+                    backend=cls.backend,
+                    num_threads=getattr(settings, 'SENTIMENT_NUM_THREADS', None),
+                    onnx_path=getattr(settings, 'SENTIMENT_ONNX_PATH', None),
+                )
+                logger.info(f"Loaded sentiment classifier {cls.model_name} ({cls.backend}) in {time.monotonic() - started:.2f}s")
+            except Exception as e:
+                logger.error(f"Failed to load sentiment classifier: {str(e)}")
+                cls._classifier = None
+            cls._loaded = True
+            return cls._classifier
+
+    @property
+    def classifier(self):
+        if not self._loaded:
+            return self._load()
+        return self._classifier
+
+    def warm_up(self):
+        """
+        Loads the model and runs one inference so the first real review
+        doesn't pay for it. Returns False if the model could not be loaded.
+        A no-op when the model lives in the shared sentiment server.
+        """
+        if self.server_socket:
+            return True
+        classifier = self.classifier
+        if classifier is None:
+            return False
+        try:
+            classifier('warm up')
+        except Exception as e:
+            logger.error(f"Sentiment classifier warm-up failed: {str(e)}")
+            return False
+        return True
+
+    def predict(self, texts, batch_size=32):
+        """
+        Runs texts through the model, or through the shared sentiment server
+        when SENTIMENT_SERVER_SOCKET is set. Returns None if neither is available.
+        """
+        if self.server_socket:
+            from .sentiment_server import SentimentClient
+            return SentimentClient(
+                self.server_socket,
+                timeout=getattr(settings, 'SENTIMENT_SERVER_TIMEOUT', 2.0),
+                timeout_per_text=getattr(settings, 'SENTIMENT_SERVER_TIMEOUT_PER_TEXT', 0.05),
+            ).classify(texts)
+        return self.predict_local(texts, batch_size=batch_size)
+
+    def predict_local(self, texts, batch_size=32):
+        classifier = self.classifier
+        if classifier is None:
+            return None
+        try:
+            outputs = classifier(list(texts), batch_size=batch_size, truncation=True)
+        except Exception as e:
+            logger.error(f"Sentiment classification error: {str(e)}")
+            return None
+        return [to_sentiment(output, self.threshold) for output in outputs]
+
+    def classify(self, text):
+        return self.classify_batch([text], batch_size=1)[0]
+
+    def classify_batch(self, texts, batch_size=32, fallback='neutral'):
+        """
+        Classifies a list of texts, answering repeated texts from the cache and
+        running the rest through a single batched pipeline call.
+        Returns a list of sentiments in the same order as texts. When the model
+        is unavailable, the uncached texts get fallback, or the whole call
+        returns None if fallback is None so the caller can retry later.
+        """
+        texts = [text or '' for text in texts]
+        if not texts:
+            return []
+        hashes = [SentimentCache.text_hash(SentimentCache.normalize(text)) for text in texts]
+        results = self.cache.get_many(set(hashes))
+
+        # Each distinct uncached text goes through the model once
+        to_classify = {}
+        for key, text in zip(hashes, texts):
+            if key not in results:
+                to_classify.setdefault(key, text)
+        count('sentiment-cache', 'hit', len(hashes) - len(to_classify))
+        count('sentiment-cache', 'miss', len(to_classify))
+        if to_classify:
+            with timed('sentiment'):
+                sentiments = self.predict(list(to_classify.values()), batch_size=batch_size)
+            if sentiments is None:
+                if fallback is None:
+                    return None
+                # Fallback if the model is unavailable; never cached
+                return [results.get(key, fallback) for key in hashes]
+            computed = dict(zip(to_classify, sentiments))
+            self.cache.set_many(computed)
+            results.update(computed)
+        return [results[key] for key in hashes]
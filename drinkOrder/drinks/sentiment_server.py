@@ -0,0 +1,142 @@
+"""
+Local sentiment inference daemon and its client.
+
+One process per host owns the model (run_sentiment_server) and listens on a
+Unix domain socket. Web workers send the texts their cache could not answer;
+the daemon gathers concurrent requests into dynamic batches bounded by a
+maximum batch size and a maximum wait, and returns each request its slice.
+
+Wire format: one JSON object per line.
+    request:  {"texts": ["great", "too sweet"]}
+    response: {"sentiments": ["positive", "negative"]} or {"error": "..."}
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger('django')
+
+
+class SentimentClient:
+    def __init__(self, socket_path, timeout=2.0, timeout_per_text=0.05):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.timeout_per_text = timeout_per_text
+
+    def timeout_for(self, texts):
+        # A job or reclassify chunk of hundreds of texts takes far longer
+        # than the few a web request sends
+        return self.timeout + self.timeout_per_text * len(texts)
+
+    def classify(self, texts):
+        """
+        Returns a list of sentiments, or None if the daemon is unreachable, too
+        slow or reports an error; the caller decides whether to retry later
+        or fall back (see SentimentClassifier.classify_batch).
+        """
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+                conn.settimeout(self.timeout_for(texts))
+                conn.connect(self.socket_path)
+                conn.sendall(json.dumps({'texts': list(texts)}).encode('utf-8') + b'\n')
+                with conn.makefile('rb') as stream:
+                    response = json.loads(stream.readline())
+        except (OSError, ValueError) as e:
+            logger.error(f"Sentiment server request failed: {str(e)}")
+            return None
+        if 'error' in response or len(response.get('sentiments', [])) != len(texts):
+            logger.error(f"Sentiment server error: {response.get('error', 'malformed response')}")
+            return None
+        return response['sentiments']
+
+
+class SentimentServer:
+    def __init__(self, predict, socket_path, max_batch_size=32, max_wait_ms=10):
+        self.predict = predict
+        self.socket_path = socket_path
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.stats = {'requests': 0, 'batches': 0, 'texts': 0}
+
+    async def handle(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                try:
+                    texts = json.loads(line)['texts']
+                    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                        raise ValueError('texts must be a list of strings')
+                except (ValueError, KeyError, TypeError) as e:
+                    response = {'error': f"Bad request: {str(e)}"}
+                else:
+                    future = asyncio.get_running_loop().create_future()
+                    await self.queue.put((texts, future))
+                    try:
+                        response = {'sentiments': await future}
+                    except Exception as e:
+                        response = {'error': str(e)}
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def batcher(self):
+        loop = asyncio.get_running_loop()
+        # The model runs off the event loop so the next batch keeps filling meanwhile
+        executor = ThreadPoolExecutor(max_workers=1)
+        while True:
+            items = [await self.queue.get()]
+            count = len(items[0][0])
+            deadline = loop.time() + self.max_wait
+            while count < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                count += len(item[0])
+
+            texts = [text for item_texts, _ in items for text in item_texts]
+            try:
+                sentiments = await loop.run_in_executor(executor, self.predict, texts)
+                if sentiments is None:
+                    raise RuntimeError('Sentiment model unavailable')
+            except Exception as e:
+                logger.error(f"Sentiment server batch of {len(texts)} failed: {str(e)}")
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            offset = 0
+            for item_texts, future in items:
+                if not future.done():
+                    future.set_result(sentiments[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+            self.stats['requests'] += len(items)
+            self.stats['batches'] += 1
+            self.stats['texts'] += len(texts)
+            logger.debug(f"Sentiment server batch: {len(items)} requests, {len(texts)} texts")
+
+    async def serve(self):
+        self.queue = asyncio.Queue()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self.handle, path=self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        batcher = asyncio.create_task(self.batcher())
+        logger.info(f"Sentiment server listening on {self.socket_path}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
@@ -0,0 +1,64 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .menu_cache import bump_catalog_version
+from .models import Category, Drink, Review
+from .search import index_drinks
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_from_drink_stats(sender, instance, **kwargs):
+    # Runs inside the delete's transaction, including cascades from a deleted customer
+    Drink.adjust_review_stats(
+        instance.drink_id, rating=-instance.rating, count=-1, sentiments={instance.sentiment: -1}
+    )
+
+
+@receiver(post_save, sender=Drink)
+def index_saved_drink(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {'name', 'category'} & set(update_fields):
+        return
+    index_drinks([instance.pk])
+
+
+@receiver(post_delete, sender=Drink)
+def unindex_deleted_drink(sender, instance, **kwargs):
+    index_drinks([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def index_category_drinks(sender, instance, **kwargs):
+    index_drinks(Drink.objects.filter(category=instance).values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_drinks(sender, instance, **kwargs):
+    # The drinks are detached (SET_NULL) without signals, so reindex them afterwards
+    instance._drink_ids = list(Drink.objects.filter(category=instance).values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def index_uncategorized_drinks(sender, instance, **kwargs):
+    index_drinks(getattr(instance, '_drink_ids', []))
+
+
+@receiver(post_save, sender=Drink)
+@receiver(post_delete, sender=Drink)
+def invalidate_drink_pages(sender, instance, **kwargs):
+    bump_catalog_version([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def invalidate_category_pages(sender, instance, **kwargs):
+    bump_catalog_version(Drink.objects.filter(category=instance).values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def invalidate_uncategorized_pages(sender, instance, **kwargs):
+    bump_catalog_version(getattr(instance, '_drink_ids', []))
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_review_pages(sender, instance, **kwargs):
+    bump_catalog_version([instance.drink_id])
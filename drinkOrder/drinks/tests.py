@@ -1,3 +1,668 @@
-from django.test import TestCase
+import json
+import socket
+import tempfile
+import threading
+import time
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.views import View
+
+from drinkOrder.query_budget import QueryBudgetTestMixin
+from drinkOrder.query_plans import QueryPlanTestMixin
+from orders.models import Order, OrderItem
+from users.models import CustomUser
+
+from .conditional import ConditionalGetMixin
+from .menu_cache import catalog_version, drink_version
+from .models import Category, Drink, DrinkLeaderboard, DrinkLeaderboardDay, Review, SentimentJob
+from .search import search_drinks, suggest_query
+from .sentiment import SentimentCache, SentimentClassifier
+from .sentiment_server import SentimentClient
+
+
+def seed_catalog(drinks_per_category=10, customers=5):
+    '''
+    Three categories of drinks, every drink reviewed by every customer and
+    ordered once, so that any per-row query shows up as dozens of extra
+    queries.
+    '''
+    categories = [Category.objects.create(name=name) for name in ('Coffee', 'Tea', 'Cocktail')]
+    drinks = [
+        Drink.objects.create(name=f"{category.name} {index}", price=3 + index, category=category)
+        for category in categories for index in range(drinks_per_category)
+    ]
+    users = [
+        CustomUser.objects.create_user(f"customer{index}", password='password', full_name=f"Customer {index}")
+        for index in range(customers)
+    ]
+    for user in users:
+        for drink in drinks:
+            Review.objects.create(drink=drink, customer=user, rating=4, text='Nice')
+    order = Order.objects.create(customer=users[0], total_price=sum(drink.price for drink in drinks))
+    for drink in drinks:
+        OrderItem.objects.create(order=order, drink=drink, quantity=1, unit_price=drink.price)
+    DrinkLeaderboard.record({drink.id: 1 for drink in drinks}, order.created_on)
+    return categories, drinks, users
+
+
+class DrinkViewQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories, cls.drinks, cls.customers = seed_catalog()
+        cls.bartender = CustomUser.objects.create_user(
+            'bartender', password='password', is_customer=False, is_bartender=True
+        )
+
+    def setUp(self):
+        # The fragment cache outlives each test's rolled back transaction
+        cache.clear()
+
+    def test_drink_menu(self):
+        with self.assertQueryBudget('drinks:drink_menu'):
+            response = self.client.get(reverse('drinks:drink_menu'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Category: Cocktail')
+
+    def test_drink_menu_search_and_category(self):
+        with self.assertQueryBudget('drinks:drink_menu'):
+            response = self.client.get(reverse('drinks:drink_menu'), {'search': 'coffee'})
+        self.assertContains(response, 'Coffee 9')
+        with self.assertQueryBudget('drinks:drink_menu'):
+            response = self.client.get(reverse('drinks:drink_menu'), {'category': self.categories[1].id})
+        self.assertContains(response, 'Tea 0')
+        self.assertNotContains(response, 'Coffee 0')
+
+    def test_cached_drink_menu_runs_no_queries(self):
+        self.client.get(reverse('drinks:drink_menu'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('drinks:drink_menu'))
+        self.assertContains(response, 'Tea 9')
+
+    def test_unchanged_drink_menu_is_not_modified(self):
+        etag = self.client.get(reverse('drinks:drink_menu'))['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('drinks:drink_menu'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_bartender_menu(self):
+        self.client.force_login(self.bartender)
+        with self.assertQueryBudget('drinks:bartender_menu'):
+            response = self.client.get(reverse('drinks:bartender_menu'))
+        self.assertContains(response, 'Make Coffee 0 unavailable')
+        self.assertNotContains(response, '__csrf_token_placeholder__')
+
+    def test_drink_detail(self):
+        drink = self.drinks[0]
+        with self.assertQueryBudget('drinks:drink_detail'):
+            response = self.client.get(reverse('drinks:drink_detail', args=[drink.id]))
+        self.assertContains(response, 'Customer 4')
+
+    def test_drink_detail_for_customer(self):
+        self.client.force_login(self.customers[0])
+        with self.assertQueryBudget('drinks:drink_detail'):
+            response = self.client.get(reverse('drinks:drink_detail', args=[self.drinks[0].id]))
+        self.assertContains(response, 'You have already reviewed this drink.')
+
+
+class DrinkQueryPlanTests(QueryPlanTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories, cls.drinks, cls.customers = seed_catalog()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_drink_menu_uses_name_indexes(self):
+        with self.assertUsesIndex('drink_name_idx'):
+            self.client.get(reverse('drinks:drink_menu'))
+        with self.assertUsesIndex('drink_category_name_idx'):
+            self.client.get(reverse('drinks:drink_menu'), {'category': self.categories[0].id})
+
+    def test_drink_detail_uses_review_indexes(self):
+        url = reverse('drinks:drink_detail', args=[self.drinks[0].id])
+        with self.assertUsesIndex('review_drink_created_idx'):
+            self.client.get(url)
+        with self.assertUsesIndex('review_drink_sentiment_idx'):
+            self.client.get(url, {'sentiment': 'positive'})
+
+
+class InstrumentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories, cls.drinks, cls.customers = seed_catalog(drinks_per_category=2, customers=1)
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('drinks:drink_menu'))
+        timings = response['Server-Timing']
+        for metric in ('db;dur=', 'tpl;dur=', 'top-drinks;dur=', 'menu-cache;desc="miss=1"', 'total;dur='):
+            self.assertIn(metric, timings)
+        response = self.client.get(reverse('drinks:drink_menu'))
+        self.assertIn('menu-cache;desc="hit=1"', response['Server-Timing'])
+        self.assertNotIn('top-drinks', response['Server-Timing'])
+
+    def test_server_timing_header_is_staff_only_by_default(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('drinks:drink_menu')))
+        self.client.force_login(self.customers[0])
+        self.assertNotIn('Server-Timing', self.client.get(reverse('drinks:drink_menu')))
+
+        self.client.force_login(CustomUser.objects.create_user('staff', password='password', is_staff=True))
+        self.assertIn('total;dur=', self.client.get(reverse('drinks:drink_menu'))['Server-Timing'])
+
+    def test_timing_stats_are_staff_only(self):
+        self.client.get(reverse('drinks:drink_menu'))
+        self.client.force_login(self.customers[0])
+        self.assertEqual(self.client.get(reverse('timing_stats')).status_code, 403)
+
+        staff = CustomUser.objects.create_user('staff', password='password', is_staff=True)
+        self.client.force_login(staff)
+        views = self.client.get(reverse('timing_stats')).json()['views']
+        self.assertGreaterEqual(views['drinks:drink_menu']['total']['count'], 1)
+        self.assertIsNotNone(views['drinks:drink_menu']['tpl']['p95_ms'])
+
+    def test_staff_can_profile_a_request(self):
+        staff = CustomUser.objects.create_user('staff', password='password', is_staff=True)
+        with tempfile.TemporaryDirectory() as profile_dir, override_settings(PROFILE_DIR=profile_dir):
+            response = self.client.get(reverse('drinks:drink_menu'), {'_profile': 1})
+            self.assertNotIn('X-Profile-Id', response)
+
+            self.client.force_login(staff)
+            response = self.client.get(reverse('drinks:drink_menu'), {'_profile': 1})
+            profile = Path(profile_dir) / response['X-Profile-Id']
+            self.assertTrue(profile.with_suffix('.prof').exists())
+            self.assertTrue(profile.with_suffix('.collapsed').exists())
+
+
+class SentimentJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.drink = Drink.objects.create(name='Espresso', price=3)
+        cls.customer = CustomUser.objects.create_user('customer', password='password')
+
+    def process_jobs(self, **options):
+        call_command('process_sentiment_jobs', stdout=StringIO(), **options)
+
+    def test_saving_a_review_queues_its_classification(self):
+        review = Review.objects.create(drink=self.drink, customer=self.customer, rating=5, text='Queued and delicious')
+        self.assertEqual(review.sentiment, 'pending')
+        self.assertEqual(SentimentJob.objects.get().review, review)
+        self.drink.refresh_from_db()
+        self.assertEqual(self.drink.pending_count, 1)
+
+        with mock.patch.object(SentimentClassifier, 'predict', return_value=['positive']) as predict:
+            self.process_jobs()
+        predict.assert_called_once_with(['Queued and delicious'], batch_size=32)
+        review.refresh_from_db()
+        self.assertEqual(review.sentiment, 'positive')
+        self.assertFalse(SentimentJob.objects.exists())
+        self.drink.refresh_from_db()
+        self.assertEqual((self.drink.pending_count, self.drink.positive_count), (0, 1))
+
+    def test_edit_while_claimed_requeues_the_review(self):
+        review = Review.objects.create(drink=self.drink, customer=self.customer, rating=2, text='Claimed then edited')
+        classified = []
+
+        def classify(texts, batch_size):
+            classified.append(texts)
+            if len(classified) == 1:
+                # The customer edits the review while its first batch runs
+                edited = Review.objects.get(pk=review.pk)
+                edited.text = 'Edited while the batch ran'
+                edited.save()
+                return ['negative']
+            return ['positive']
+
+        with mock.patch.object(SentimentClassifier, 'predict', side_effect=classify):
+            self.process_jobs()
+        # The re-queued job survived the first batch and was picked up again
+        self.assertEqual(len(classified), 2)
+        self.assertFalse(SentimentJob.objects.exists())
+        review.refresh_from_db()
+        self.assertEqual(review.sentiment, 'positive')
+
+    def test_jobs_stay_queued_while_the_model_is_unavailable(self):
+        review = Review.objects.create(drink=self.drink, customer=self.customer, rating=3, text='Nobody to classify me')
+        with mock.patch.object(SentimentClassifier, 'predict', return_value=None) as predict:
+            for _ in range(3):
+                self.process_jobs(max_attempts=2)
+        self.assertEqual(predict.call_count, 2)
+        self.assertEqual(SentimentJob.objects.get().attempts, 2)
+        review.refresh_from_db()
+        self.assertEqual(review.sentiment, 'pending')
+        self.drink.refresh_from_db()
+        self.assertEqual((self.drink.pending_count, self.drink.neutral_count), (1, 0))
+
+
+class ReclassifyReviewsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.drink = Drink.objects.create(name='Matcha', price=4)
+        cls.reviews = [
+            Review.objects.create(
+                drink=cls.drink, customer=CustomUser.objects.create_user(f"reviewer{index}", password='password'),
+                rating=4, text=f"Reclassified review {index}",
+            )
+            for index in range(5)
+        ]
+
+    def test_failed_chunk_stops_before_the_checkpoint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = Path(directory) / 'checkpoint'
+            with mock.patch.object(SentimentClassifier, 'predict', side_effect=[['positive', 'positive'], None]):
+                with self.assertRaises(CommandError):
+                    call_command('reclassify_reviews', chunk_size=2, checkpoint=str(checkpoint), stdout=StringIO())
+            self.assertEqual(checkpoint.read_text(), str(self.reviews[1].pk))
+            sentiments = list(Review.objects.order_by('pk').values_list('sentiment', flat=True))
+            self.assertEqual(sentiments, ['positive', 'positive', 'pending', 'pending', 'pending'])
+
+            with mock.patch.object(SentimentClassifier, 'predict', side_effect=[['negative', 'negative'], ['neutral']]):
+                call_command('reclassify_reviews', chunk_size=2, checkpoint=str(checkpoint), stdout=StringIO())
+            self.assertEqual(checkpoint.read_text(), str(self.reviews[4].pk))
+            sentiments = list(Review.objects.order_by('pk').values_list('sentiment', flat=True))
+            self.assertEqual(sentiments, ['positive', 'positive', 'negative', 'negative', 'neutral'])
+
+
+class SentimentCacheTests(TestCase):
+    def test_memory_and_database_tiers(self):
+        key = SentimentCache.text_hash(SentimentCache.normalize('  Smooth   and RICH '))
+        self.assertEqual(key, SentimentCache.text_hash('smooth and rich'))
+        cache = SentimentCache('model-a', max_size=2)
+        self.assertEqual(cache.get_many({key}), {})
+        cache.set_many({key: 'positive'})
+        self.assertEqual(cache.get_many({key}), {key: 'positive'})
+        self.assertEqual(cache.stats, {'memory_hits': 1, 'db_hits': 0, 'misses': 1})
+
+        # A fresh process finds it in the database and keeps it in memory
+        cache = SentimentCache('model-a', max_size=2)
+        self.assertEqual(cache.get_many({key}), {key: 'positive'})
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.get_many({key}), {key: 'positive'})
+        self.assertEqual(cache.stats, {'memory_hits': 1, 'db_hits': 1, 'misses': 0})
+        # Results of another model version don't count
+        self.assertEqual(SentimentCache('model-b').get_many({key}), {})
+
+        cache.set_many({'b' * 64: 'neutral', 'c' * 64: 'negative'})
+        with self.assertNumQueries(1):
+            # key was evicted from the two-entry LRU and comes back from the database
+            self.assertEqual(cache.get_many({key}), {key: 'positive'})
+
+    def test_classify_batch_runs_each_new_text_once(self):
+        classifier = SentimentClassifier()
+        with mock.patch.object(SentimentClassifier, 'predict', return_value=['positive', 'negative']) as predict:
+            sentiments = classifier.classify_batch(['Very GOOD  coffee', 'very good coffee', 'Burnt'])
+        self.assertEqual(sentiments, ['positive', 'positive', 'negative'])
+        # The model gets the text as written, not its cache key
+        predict.assert_called_once_with(['Very GOOD  coffee', 'Burnt'], batch_size=32)
+
+        with mock.patch.object(SentimentClassifier, 'predict') as predict:
+            self.assertEqual(classifier.classify_batch(['VERY good coffee', 'burnt']), ['positive', 'negative'])
+        predict.assert_not_called()
+
+
+class SentimentServerClientTests(TestCase):
+    def slow_server(self, socket_path, delay):
+        '''
+        A one-connection stand-in for run_sentiment_server that answers
+        'positive' for every text after delay seconds.
+        '''
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(socket_path)
+        listener.listen(1)
+
+        def serve():
+            conn, _ = listener.accept()
+            with conn, conn.makefile('rb') as stream:
+                texts = json.loads(stream.readline())['texts']
+                time.sleep(delay)
+                try:
+                    conn.sendall(json.dumps({'sentiments': ['positive'] * len(texts)}).encode('utf-8') + b'\n')
+                except OSError:
+                    pass
+            listener.close()
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        self.addCleanup(thread.join)
+
+    def test_timeout_grows_with_the_number_of_texts(self):
+        with tempfile.TemporaryDirectory() as directory:
+            socket_path = str(Path(directory) / 'sentiment.sock')
+            client = SentimentClient(socket_path, timeout=0.1, timeout_per_text=0.1)
+            self.slow_server(socket_path, 0.4)
+            self.assertEqual(client.classify(['a'] * 5), ['positive'] * 5)
+
+        with tempfile.TemporaryDirectory() as directory:
+            socket_path = str(Path(directory) / 'sentiment.sock')
+            client = SentimentClient(socket_path, timeout=0.1, timeout_per_text=0.1)
+            self.slow_server(socket_path, 0.4)
+            self.assertIsNone(client.classify(['a']))
+
+    @override_settings(SENTIMENT_DEFERRED=False)
+    def test_failed_inline_classification_is_queued(self):
+        drink = Drink.objects.create(name='Cortado', price=3)
+        customer = CustomUser.objects.create_user('customer', password='password')
+        with mock.patch.object(SentimentClassifier, 'predict', return_value=None):
+            review = Review.objects.create(drink=drink, customer=customer, rating=4, text='Classified later')
+        self.assertEqual(review.sentiment, 'pending')
+        self.assertEqual(SentimentJob.objects.get().review, review)
+
+        with mock.patch.object(SentimentClassifier, 'predict', return_value=['positive']):
+            review = Review.objects.create(drink=drink, customer=CustomUser.objects.create_user('other'), rating=5, text='Classified now')
+        self.assertEqual(review.sentiment, 'positive')
+        self.assertEqual(SentimentJob.objects.count(), 1)
+
+
+class DrinkLeaderboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.espresso, cls.latte, cls.mocha = [
+            Drink.objects.create(name=name, price=3) for name in ('Espresso', 'Latte', 'Mocha')
+        ]
+
+    def ranking(self, window, limit=5):
+        return [(row['rank'], row['drink'].name, row['total_quantity']) for row in Drink.get_top_drinks(limit, window)]
+
+    def test_record_and_windows(self):
+        now = timezone.now()
+        DrinkLeaderboard.record({self.espresso.id: 3, self.latte.id: 1}, now)
+        DrinkLeaderboard.record({self.latte.id: 5}, now - timezone.timedelta(days=3))
+        DrinkLeaderboard.record({self.mocha.id: 10}, now - timezone.timedelta(days=10))
+        # A removed item takes its quantity back off the day the order was placed
+        DrinkLeaderboard.record({self.espresso.id: -1}, now)
+
+        self.assertEqual(self.ranking('today'), [(1, 'Espresso', 2), (2, 'Latte', 1)])
+        self.assertEqual(self.ranking('7d'), [(1, 'Latte', 6), (2, 'Espresso', 2)])
+        self.assertEqual(self.ranking('all'), [(1, 'Mocha', 10), (2, 'Latte', 6), (3, 'Espresso', 2)])
+        self.assertEqual(self.ranking('all', limit=2), [(1, 'Mocha', 10), (2, 'Latte', 6)])
+        self.assertEqual(DrinkLeaderboardDay.objects.filter(drink=self.latte).count(), 2)
+
+        # Fully cancelled and unavailable drinks drop off the board
+        DrinkLeaderboard.record({self.latte.id: -1}, now)
+        self.assertEqual(self.ranking('today'), [(1, 'Espresso', 2)])
+        Drink.objects.filter(pk=self.mocha.pk).update(is_available=False)
+        self.assertEqual(self.ranking('all'), [(1, 'Latte', 5), (2, 'Espresso', 2)])
+
+    def test_zero_deltas_write_nothing(self):
+        with self.assertNumQueries(0):
+            DrinkLeaderboard.record({self.espresso.id: 0}, timezone.now())
+        self.assertFalse(DrinkLeaderboard.objects.exists())
+        self.assertEqual(self.ranking('all'), [])
+
+
+class ReviewStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.drink = Drink.objects.create(name='Flat white', price=3)
+        cls.customers = [CustomUser.objects.create_user(f"taster{index}", password='password') for index in range(2)]
+
+    def stats(self):
+        drink = Drink.objects.get(pk=self.drink.pk)
+        return [drink.rating_sum, drink.rating_count, drink.positive_count, drink.negative_count, drink.neutral_count, drink.pending_count]
+
+    def test_stats_follow_review_writes(self):
+        review = Review.objects.create(drink=self.drink, customer=self.customers[0], rating=4, text='Velvety')
+        Review.objects.create(drink=self.drink, customer=self.customers[1], rating=2, text='Too milky')
+        self.assertEqual(self.stats(), [6, 2, 0, 0, 0, 2])
+
+        with transaction.atomic():
+            Review.update_sentiments({review.pk: 'positive'})
+        self.assertEqual(self.stats(), [6, 2, 1, 0, 0, 1])
+
+        # A new rating keeps the sentiment, new text sends it back to the queue
+        review = Review.objects.get(pk=review.pk)
+        review.rating = 5
+        review.save()
+        self.assertEqual(self.stats(), [7, 2, 1, 0, 0, 1])
+        review.text = 'Velvety, a bit sweet'
+        review.save()
+        self.assertEqual(self.stats(), [7, 2, 0, 0, 0, 2])
+
+        review.delete()
+        self.assertEqual(self.stats(), [2, 1, 0, 0, 0, 1])
+        # Deleting the customer cascades to their reviews
+        self.customers[1].delete()
+        self.assertEqual(self.stats(), [0, 0, 0, 0, 0, 0])
+
+    def test_check_reports_drift_without_repairing(self):
+        Review.objects.create(drink=self.drink, customer=self.customers[0], rating=3, text='Fine')
+        Drink.objects.filter(pk=self.drink.pk).update(rating_sum=10, pending_count=0)
+
+        out = StringIO()
+        call_command('rebuild_review_stats', check=True, stdout=out)
+        self.assertIn(f"Flat white (id {self.drink.pk}): stored [10, 1, 0, 0, 0, 0], expected [3, 1, 0, 0, 0, 1]", out.getvalue())
+        self.assertIn('1 drinks have drifted review aggregates', out.getvalue())
+        self.assertEqual(self.stats(), [10, 1, 0, 0, 0, 0])
+
+        call_command('rebuild_review_stats', stdout=StringIO())
+        self.assertEqual(self.stats(), [3, 1, 0, 0, 0, 1])
+        out = StringIO()
+        call_command('rebuild_review_stats', check=True, stdout=out)
+        self.assertIn('0 drinks have drifted review aggregates', out.getvalue())
+
+
+class DrinkSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tea = Category.objects.create(name='Tea')
+        cls.coffee = Category.objects.create(name='Coffee')
+        cls.chai = Drink.objects.create(name='Masala Chai', price=3, category=cls.tea)
+        cls.espresso = Drink.objects.create(name='Espresso', price=2, category=cls.coffee)
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query):
+        return [drink.name for drink in search_drinks(Drink.objects.all(), query)]
+
+    def test_index_follows_drink_and_category_writes(self):
+        self.assertEqual(self.search('tea'), ['Masala Chai'])
+        self.assertEqual(self.search('espr'), ['Espresso'])
+
+        self.espresso.name = 'Ristretto'
+        self.espresso.save()
+        self.assertEqual(self.search('espresso'), [])
+        self.assertEqual(self.search('ristretto'), ['Ristretto'])
+
+        self.tea.name = 'Infusion'
+        self.tea.save()
+        self.assertEqual(self.search('tea'), [])
+        self.assertEqual(self.search('infusion'), ['Masala Chai'])
+
+        self.tea.delete()
+        self.assertEqual(self.search('infusion'), [])
+        self.assertEqual(self.search('masala'), ['Masala Chai'])
+
+        self.chai.delete()
+        self.assertEqual(self.search('masala'), [])
+        self.assertIsNone(suggest_query('masala'))
+
+    def test_search_ranks_names_above_categories(self):
+        Drink.objects.create(name='Coffee Tonic', price=4)
+        self.assertEqual(self.search('coffee'), ['Coffee Tonic', 'Espresso'])
+
+    def test_menu_falls_back_to_substrings(self):
+        self.assertEqual(self.search('presso'), [])
+        response = self.client.get(reverse('drinks:drink_menu'), {'search': 'presso'})
+        self.assertContains(response, 'Espresso')
+        self.assertNotContains(response, 'Masala Chai')
+
+    def test_suggest_query(self):
+        self.assertEqual(suggest_query('expresso'), 'espresso')
+        self.assertEqual(suggest_query('masla chai'), 'masala chai')
+        # Known prefixes and unrelated words are left alone
+        self.assertIsNone(suggest_query('esp chai'))
+        self.assertIsNone(suggest_query('zzz'))
+
+
+class MenuCacheInvalidationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories, cls.drinks, cls.customers = seed_catalog(drinks_per_category=2, customers=2)
+
+    def setUp(self):
+        cache.clear()
+
+    def assertInvalidates(self, write, drink=None):
+        '''
+        Runs write with its on_commit callbacks and checks that it moves the
+        catalog version, and the version of drink when given.
+        '''
+        versions = (catalog_version(), drink and drink_version(drink.id))
+        other = self.drinks[-1]
+        other_version = drink_version(other.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        self.assertNotEqual(catalog_version(), versions[0])
+        if drink:
+            self.assertNotEqual(drink_version(drink.id), versions[1])
+        self.assertEqual(drink_version(other.id), other_version)
+
+    def test_drink_writes(self):
+        drink = self.drinks[0]
+        self.assertContains(self.client.get(reverse('drinks:drink_menu')), 'Coffee 0')
+
+        def rename():
+            drink.name = 'Cold Brew'
+            drink.save()
+        self.assertInvalidates(rename, drink)
+        response = self.client.get(reverse('drinks:drink_menu'))
+        self.assertContains(response, 'Cold Brew')
+        self.assertNotContains(response, 'Coffee 0')
+
+        self.assertInvalidates(drink.delete)
+        self.assertNotContains(self.client.get(reverse('drinks:drink_menu')), 'Cold Brew')
+
+    def test_category_writes(self):
+        category = self.categories[0]
+        self.assertContains(self.client.get(reverse('drinks:drink_menu')), 'Category: Coffee')
+
+        def rename():
+            category.name = 'Espresso bar'
+            category.save()
+        self.assertInvalidates(rename, self.drinks[0])
+        response = self.client.get(reverse('drinks:drink_menu'))
+        self.assertContains(response, 'Category: Espresso bar')
+        self.assertNotContains(response, 'Category: Coffee')
+
+        self.assertInvalidates(category.delete, self.drinks[0])
+        self.assertNotContains(self.client.get(reverse('drinks:drink_menu')), 'Category: Espresso bar')
+
+    def test_order_and_reviewer_writes(self):
+        order = Order.objects.create(customer=self.customers[0], total_price=3)
+        self.assertInvalidates(lambda: OrderItem.objects.create(order=order, drink=self.drinks[0], quantity=1, unit_price=3))
+
+        versions = [drink_version(drink.id) for drink in self.drinks]
+        catalog = catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.customers[0].full_name = 'New Name'
+            self.customers[0].save()
+        # Every drink shows the customer's review; the menus don't show reviewers
+        self.assertTrue(all(drink_version(drink.id) != version for drink, version in zip(self.drinks, versions)))
+        self.assertEqual(catalog_version(), catalog)
+
+    def test_fragment_key_ignores_other_parameters(self):
+        self.client.get(reverse('drinks:drink_menu'), {'search': 'Coffee', 'category': self.categories[0].id})
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('drinks:drink_menu'), {
+                'search': '  Coffee ', 'category': f"{self.categories[0].id}", 'utm_source': 'flyer',
+            })
+        self.assertContains(response, 'Coffee 1')
+        # Malformed categories all share the empty menu
+        empty = self.client.get(reverse('drinks:drink_menu'), {'category': 'x'})
+        self.assertNotEqual(empty.content, response.content)
+        with self.assertNumQueries(0):
+            self.client.get(reverse('drinks:drink_menu'), {'category': '-3', 'v': 1})
+            response = self.client.get(reverse('drinks:drink_menu'), {'category': '99999999999999999999'})
+        self.assertEqual(response.content, empty.content)
+
+    def test_review_writes(self):
+        drink = self.drinks[1]
+        url = reverse('drinks:drink_detail', args=[drink.id])
+        self.assertNotContains(self.client.get(url), 'Needs more crema')
+        review = Review.objects.get(drink=drink, customer=self.customers[0])
+
+        def edit():
+            review.text = 'Needs more crema'
+            review.save()
+        self.assertInvalidates(edit, drink)
+        self.assertContains(self.client.get(url), 'Needs more crema')
+
+        self.assertInvalidates(review.delete, drink)
+        self.assertNotContains(self.client.get(url), 'Needs more crema')
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories, cls.drinks, cls.customers = seed_catalog(drinks_per_category=2, customers=2)
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('drinks:drink_detail', args=[self.drinks[0].id])
+
+    def test_anonymous_revalidation(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertNotIn('private', response['Cache-Control'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        # Another drink's page has its own validators
+        other = self.client.get(reverse('drinks:drink_detail', args=[self.drinks[1].id]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(other.status_code, 200)
+
+        review = Review.objects.get(drink=self.drinks[0], customer=self.customers[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            review.rating = 1
+            review.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_signed_in_users_get_their_own_etag(self):
+        anonymous_etag = self.client.get(self.url)['ETag']
+        self.client.force_login(self.customers[0])
+        # The first page sets the CSRF cookie, which is part of the validator
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertNotEqual(etag, anonymous_etag)
+        self.assertTrue(etag.startswith(anonymous_etag.rstrip('"')))
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=anonymous_etag).status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Their name is on the page, so a new name changes the validator
+        self.customers[0].full_name = 'Renamed Customer'
+        self.customers[0].save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        self.client.force_login(self.customers[1])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_views_must_define_their_versions(self):
+        class UnversionedView(ConditionalGetMixin, View):
+            def get(self, request):
+                return HttpResponse()
+
+        with self.assertRaisesMessage(ImproperlyConfigured, 'UnversionedView must define get_versions()'):
+            UnversionedView.as_view()(RequestFactory().get('/'))
+
+    def test_unknown_drinks_get_expiring_versions(self):
+        with mock.patch.object(cache, 'add', wraps=cache.add) as add:
+            self.assertEqual(self.client.get(reverse('drinks:drink_detail', args=[999999])).status_code, 404)
+        add.assert_called_once_with('drinks:version:drink:999999', mock.ANY, 86400)
@@ -1,49 +1,110 @@
 from django.views import View
 from django.shortcuts import render, get_object_or_404, redirect
+from django.template.loader import render_to_string
+from django.middleware.csrf import get_token
+from django.utils.safestring import mark_safe
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from .models import Drink, Category, Review
-from django.db.models import Avg, Q
+from django.db.models import Q
 from .forms import ReviewForm
+from .search import search_drinks, suggest_query
+from .menu_cache import catalog_version, drink_version, fragment_key, get_or_build
+from .conditional import ConditionalGetMixin
 import logging
 
 logger = logging.getLogger('django')
 
-class DrinkMenuView(View):
+# Rendered into cached bartender fragments in place of the per-session CSRF
+# token, which is substituted back in on every request
+CSRF_TOKEN_PLACEHOLDER = '__csrf_token_placeholder__'
+
+def menu_filters(request):
+    '''
+    The search text and category id of a menu request, normalized. They are
+    all that goes into the menu fragment cache key, so other parameters and
+    other spellings of the same filter share one entry; a malformed category
+    becomes 0, which matches no category.
+    '''
+    search_query = ' '.join(request.GET.get('search', '').split())
+    category_id = request.GET.get('category') or None
+    if category_id is not None:
+        try:
+            category_id = int(category_id)
+        except ValueError:
+            category_id = 0
+        if not 0 < category_id < 2 ** 31:
+            category_id = 0
+    return search_query, category_id
+
+def filter_drinks(search_query, category_id):
+    '''
+    Shared search and category filter for the drink menus.
+    Returns (drinks, search_suggestion): drinks is an evaluated list, ranked by
+    relevance when searching and by name otherwise. When a search matches
+    nothing it is retried as a substring of the drink names, then once with
+    misspelt terms corrected, and the corrected query is returned as
+    search_suggestion.
+    '''
+    drinks = Drink.objects.select_related('category')
+    # category filter drink
+    if category_id:
+        try:
+            category = Category.objects.get(id=category_id)
+            drinks = drinks.filter(category=category)
+        except (Category.DoesNotExist, ValueError):
+            logger.warning(f"Invalid category_id: {category_id}")
+            return [], None  # Show no drinks for invalid category
+
+    # search feature
+    if not search_query:
+        return list(drinks.order_by('name')), None
+    search_suggestion = None
+    results = list(search_drinks(drinks, search_query))
+    if not results:
+        # The index matches word prefixes; mid-word text still finds drinks by name
+        results = list(drinks.filter(name__icontains=search_query).order_by('name'))
+    if not results:
+        search_suggestion = suggest_query(search_query)
+        if search_suggestion:
+            results = list(search_drinks(drinks, search_suggestion))
+    logger.debug(f"After search query '{search_query}': {len(results)} drinks")
+    if not results:
+        logger.info(f"No drinks found for search query: '{search_query}'")
+    return results, search_suggestion
+
+class DrinkMenuView(ConditionalGetMixin, View):
     '''
     Common drink menu view for customer
     Content display:
     - List of drinks with avarage rating from reviews
     - Search feature
     - Filter drink category
+    Revalidates with 304 until the catalog version changes.
     '''
+    def get_versions(self, request):
+        return [catalog_version()]
+
     def get(self, request):
-        search_query = request.GET.get('search', '').strip()
-        category_id = request.GET.get('category')
+        search_query, category_id = menu_filters(request)
+        menu_fragment = get_or_build(
+            fragment_key('customer', search_query, category_id),
+            lambda: self.render_menu(search_query, category_id),
+        )
+        return render(request, 'drinks/drink_menu.html', {
+            'menu_fragment': menu_fragment,
+        })
+
+    def render_menu(self, search_query, category_id):
         top_drinks = [top['drink'] for top in Drink.get_top_drinks(limit=5)]
-    
-        # search feature
-        if search_query:
-            drinks = Drink.objects.filter(name__icontains=search_query)
-            logger.debug(f"After search query '{search_query}': {drinks.count()} drinks")
-            if not drinks.exists():
-                logger.info(f"No drinks found for search query: '{search_query}'")
-        else:
-            drinks = Drink.objects.all()
-        # category filter drink
-        if category_id:
-            try:
-                category = Category.objects.get(id=category_id)
-                drinks = drinks.filter(category=category)
-            except (Category.DoesNotExist, ValueError):
-                logger.warning(f"Invalid category_id: {category_id}")
-                drinks = Drink.objects.none()  # Show no drinks for invalid category
-        
+        drinks, search_suggestion = filter_drinks(search_query, category_id)
+
         categories = Category.objects.all()
-        return render(request, 'drinks/drink_menu.html', {
-            'drinks': drinks.annotate(avg_rating=Avg('reviews__rating')).order_by('name'),
+        return render_to_string('drinks/partials/drink_menu.html', {
+            'drinks': drinks,
             'categories': categories,
             'selected_category': category_id,
             'search_query': search_query,
+            'search_suggestion': search_suggestion,
             'top_drinks': top_drinks,
         })
 class TopDrinksView(View):
@@ -61,35 +122,30 @@ class BartenderMenuView(LoginRequiredMixin, UserPassesTestMixin, View):
         return self.request.user.is_bartender
 
     def get(self, request):
-        search_query = request.GET.get('search', '').strip()
-        category_id = request.GET.get('category')
-        # search feature
-        if search_query:
-            drinks = Drink.objects.filter(name__icontains=search_query)
-            logger.debug(f"After search query '{search_query}': {drinks.count()} drinks")
-            if not drinks.exists():
-                logger.info(f"No drinks found for search query: '{search_query}'")
-        else:
-            drinks = Drink.objects.all()
+        search_query, category_id = menu_filters(request)
+        menu_fragment = get_or_build(
+            fragment_key('bartender', search_query, category_id),
+            lambda: self.render_menu(search_query, category_id),
+        )
+        menu_fragment = mark_safe(menu_fragment.replace(CSRF_TOKEN_PLACEHOLDER, get_token(request)))
+        return render(request, 'drinks/bartender_menu.html', {
+            'menu_fragment': menu_fragment,
+        })
 
-        #category filter drink        
-        if category_id:
-            try:
-                category = Category.objects.get(id=category_id)
-                drinks = drinks.filter(category=category)
-            except (Category.DoesNotExist, ValueError):
-                logger.warning(f"Invalid category_id: {category_id}")
-                drinks = Drink.objects.none()
-        
-        for drink in drinks.annotate(avg_rating=Avg('reviews__rating')).order_by('name'):
+    def render_menu(self, search_query, category_id):
+        drinks, search_suggestion = filter_drinks(search_query, category_id)
+
+        for drink in drinks:
             logger.debug(f"Bartender view - Drink {drink.name}: is_available={drink.is_available}, avg_rating={drink.avg_rating}")
         
         categories = Category.objects.all()
-        return render(request, 'drinks/bartender_menu.html', {
-            'drinks': drinks.annotate(avg_rating=Avg('reviews__rating')).order_by('name'),
+        return render_to_string('drinks/partials/bartender_menu.html', {
+            'drinks': drinks,
             'categories': categories,
             'selected_category': category_id,
             'search_query': search_query,
+            'search_suggestion': search_suggestion,
+            'csrf_token': CSRF_TOKEN_PLACEHOLDER,
         })
 
     def post(self, request):
@@ -119,10 +175,13 @@ class BartenderMenuView(LoginRequiredMixin, UserPassesTestMixin, View):
         
         return redirect('drinks:bartender_menu')
     
-class DrinkDetailView(View):
+class DrinkDetailView(ConditionalGetMixin, View):
+    def get_versions(self, request, drink_id):
+        return [drink_version(drink_id)]
+
     def get(self, request, drink_id):
-        drink = get_object_or_404(Drink, id=drink_id)
-        reviews = Review.objects.filter(drink=drink)
+        drink = get_object_or_404(Drink.objects.select_related('category'), id=drink_id)
+        reviews = Review.objects.filter(drink=drink).select_related('customer')
         sentiment = request.GET.get('sentiment')
         if sentiment:
             try:
@@ -0,0 +1,36 @@
+"""
+Production launcher for drinkOrder.wsgi: gunicorn -c gunicorn.conf.py
+
+The master imports Django and loads the sentiment model once (preload_app +
+SENTIMENT_WARMUP), then forks the workers. The model weights and the rest of
+the warmed heap are shared copy-on-write; gc.freeze() keeps the collector from
+touching those objects in the workers, which would otherwise dirty the pages.
+Check the result with benchmarks/worker_memory.py --pid <master pid>.
+"""
+import gc
+import multiprocessing
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'drinkOrder.settings')
+os.environ.setdefault('SENTIMENT_WARMUP', '1')
+# Workers must share one cache for menu invalidations to reach all of them
+os.environ.setdefault('CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+
+wsgi_app = 'drinkOrder.wsgi:application'
+bind = os.getenv('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+preload_app = True
+pidfile = os.getenv('GUNICORN_PIDFILE')
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before any worker forks
+    from django.db import connections
+    connections.close_all()
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"Froze {gc.get_freeze_count()} objects before forking {server.num_workers} workers")
+
+
+def post_fork(server, worker):
+    server.log.info(f"Worker {worker.pid} forked from preloaded master")
@@ -0,0 +1,151 @@
+"""
+Hot/cold archival of served orders.
+
+archive_served_orders() moves served orders older than a cutoff from Order
+and OrderItem into ArchivedOrder, in bounded batches, each in its own short
+transaction, so a scheduled run never holds the SQLite write lock for long.
+An archived order keeps its id, and its items become one JSON list of
+[drink id, quantity, unit price] triples on the order row. The leaderboard
+and order events are left as they are: archiving changes where an order is
+stored, not what was sold. Once the sales rollups exist, only the orders
+they already count are archived.
+
+Full-history readers go through the helpers below, which combine the two
+tables: customer_order_history() for the customer's order list, and
+archived_quantities() for aggregates that need the archived lines.
+"""
+import logging
+import time
+from collections import Counter
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Prefetch, Q
+from django.utils import timezone
+
+from drinks.models import Drink
+
+from .models import ArchivedOrder, Order, OrderItem, SalesRollupWatermark
+
+logger = logging.getLogger('django')
+
+
+class ArchivedLine:
+    '''
+    An archived item, with the attributes templates use on OrderItem.
+    '''
+    def __init__(self, drink, quantity, unit_price):
+        self.drink = drink
+        self.quantity = quantity
+        self.unit_price = unit_price
+
+    @property
+    def line_total(self):
+        return self.unit_price * self.quantity
+
+
+def pack_items(items):
+    return [[drink_id, quantity, str(unit_price)] for drink_id, quantity, unit_price in items]
+
+
+def archive_batch(older_than, batch_size):
+    '''
+    Archives up to batch_size of the oldest served orders placed before
+    older_than. Returns the number archived.
+    '''
+    with transaction.atomic():
+        orders = Order.objects.filter(status='served', created_on__lt=older_than)
+        rolled_up_until = SalesRollupWatermark.current()
+        if rolled_up_until is not None:
+            # Leave orders the sales rollups have yet to count (rollups.py)
+            orders = orders.filter(Q(served_on__lte=rolled_up_until) | Q(served_on__isnull=True))
+        orders = list(orders.order_by('created_on', 'id')[:batch_size])
+        if not orders:
+            return 0
+        order_ids = [order.id for order in orders]
+        items = {}
+        for order_id, drink_id, quantity, unit_price in OrderItem.objects.filter(order_id__in=order_ids).order_by('id').values_list(
+            'order_id', 'drink_id', 'quantity', 'unit_price'
+        ):
+            items.setdefault(order_id, []).append((drink_id, quantity, unit_price))
+        ArchivedOrder.objects.bulk_create([
+            ArchivedOrder(
+                id=order.id, created_on=order.created_on, served_on=order.served_on, total_price=order.total_price,
+                customer_id=order.customer_id, items=pack_items(items.get(order.id, [])),
+            )
+            for order in orders
+        ])
+        # A plain DELETE: OrderItem's post_delete receivers would bump the
+        # menu caches once per line although nothing on the menus changed
+        placeholders = ', '.join(['%s'] * len(order_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {OrderItem._meta.db_table} WHERE order_id IN ({placeholders})", order_ids)
+            cursor.execute(f"DELETE FROM {Order._meta.db_table} WHERE id IN ({placeholders})", order_ids)
+    return len(orders)
+
+
+def archive_served_orders(older_than, batch_size=500, max_batches=None, pause=0):
+    '''
+    Archives the served orders placed before older_than, batch_size at a
+    time, stopping after max_batches batches when given and sleeping pause
+    seconds between batches to let other writers in. Returns the number
+    archived.
+    '''
+    archived = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        moved = archive_batch(older_than, batch_size)
+        archived += moved
+        batches += 1
+        if moved < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    logger.info(f"Archived {archived} served orders placed before {older_than.isoformat()} in {batches} batches")
+    return archived
+
+
+def load_archived_lines(archived_orders):
+    '''
+    Sets .lines on each archived order to its ArchivedLines, with the drinks
+    of all of them loaded in one query.
+    '''
+    drink_ids = {drink_id for order in archived_orders for drink_id, _, _ in order.items}
+    drinks = Drink.objects.in_bulk(list(drink_ids))
+    for order in archived_orders:
+        order.lines = [
+            ArchivedLine(drinks.get(drink_id), quantity, Decimal(unit_price))
+            for drink_id, quantity, unit_price in order.items
+        ]
+    return archived_orders
+
+
+def customer_order_history(customer, full_history=False):
+    '''
+    The orders of customer, newest first: the live ones with their items
+    and drinks, followed, when full_history is set, by the archived ones,
+    which are always older.
+    '''
+    orders = list(
+        Order.objects.filter(customer=customer).prefetch_related(
+            Prefetch('orderitem_set', queryset=OrderItem.objects.select_related('drink').order_by('id'))
+        ).order_by('-created_on', '-id')
+    )
+    if full_history:
+        orders += load_archived_lines(list(ArchivedOrder.objects.filter(customer=customer).order_by('-created_on', '-id')))
+    return orders
+
+
+def archived_quantities(archived_orders=None, by_day=False):
+    '''
+    Ordered quantity per drink id over archived_orders (default: every
+    archived order), or per (drink id, local day ordered) with by_day.
+    '''
+    if archived_orders is None:
+        archived_orders = ArchivedOrder.objects.all()
+    quantities = Counter()
+    for created_on, items in archived_orders.values_list('created_on', 'items').iterator():
+        day = timezone.localdate(created_on) if by_day else None
+        for drink_id, quantity, _ in items:
+            quantities[(drink_id, day) if by_day else drink_id] += quantity
+    return quantities
@@ -0,0 +1,97 @@
+"""
+Live order events for the bartender screens.
+
+Every order write records OrderEvent rows ('new', 'updated', 'cancelled',
+'served') in its own transaction, carrying the JSON a screen needs. Once that
+transaction commits, the events are also published to the streams open in
+this process. OrderEventStreamView sends them as Server-Sent Events:
+- streams in this process get the events pushed in memory, without a query;
+- when no event arrives for ORDER_EVENTS_POLL_INTERVAL seconds, or a pushed
+  batch does not follow on from the last event sent, the stream reads the
+  OrderEvent rows past the last one it sent. That picks up the events
+  written by other worker processes, and any events a slow stream dropped;
+- a comment line every ORDER_EVENTS_HEARTBEAT seconds keeps proxies from
+  closing an idle connection;
+- the event id is the OrderEvent id, so a reconnecting EventSource resumes
+  from its Last-Event-ID header.
+
+Streaming needs the ASGI application (drinkOrder/asgi.py). Under WSGI the
+view answers with the events so far and a retry delay, so the browser falls
+back to polling.
+"""
+import asyncio
+import json
+import logging
+import threading
+
+logger = logging.getLogger('django')
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def order_payload(order, lines):
+    '''
+    What a bartender screen shows for order; lines is a list of
+    (drink name, quantity).
+    '''
+    return {
+        'id': order.id,
+        'status': order.status,
+        'customer': order.customer.username if order.customer else None,
+        'total_price': str(order.total_price),
+        'created_on': order.created_on.isoformat(),
+        'items': [{'drink': name, 'quantity': quantity} for name, quantity in lines],
+    }
+
+
+def format_event(message):
+    return f"id: {message['id']}\nevent: {message['type']}\ndata: {json.dumps(message['data'])}\n\n"
+
+
+class Subscription:
+    '''
+    The queue of event batches for one stream, filled from any thread.
+    '''
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+
+    def deliver(self, messages):
+        # Runs on the stream's event loop; a full queue drops the batch and
+        # the stream later reads the gap back from the database
+        try:
+            self.queue.put_nowait(messages)
+        except asyncio.QueueFull:
+            pass
+
+
+class OrderEventBroker:
+    '''
+    In-process fanout of committed order events to the open streams.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = set()
+
+    def subscribe(self):
+        subscription = Subscription(asyncio.get_running_loop())
+        with self.lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def publish(self, messages):
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, messages)
+            except RuntimeError:
+                # The stream's loop has closed; its finally block unsubscribes it
+                pass
+
+
+broker = OrderEventBroker()
@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from orders.archive import archive_served_orders
+
+
+class Command(BaseCommand):
+    help = ("Move served orders older than ORDER_ARCHIVE_AFTER_DAYS days to the order archive, in batches of "
+            "ORDER_ARCHIVE_BATCH_SIZE orders, each in its own transaction. Safe to run from a scheduler: an "
+            "interrupted run leaves whole batches archived and the next run carries on.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Archive orders placed more than this many days ago (default settings.ORDER_ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--batch-size', type=int, help='Orders per transaction (default settings.ORDER_ARCHIVE_BATCH_SIZE)')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches')
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to sleep between batches')
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', 90)
+        batch_size = options['batch_size'] or getattr(settings, 'ORDER_ARCHIVE_BATCH_SIZE', 500)
+        archived = archive_served_orders(
+            timezone.now() - timedelta(days=days),
+            batch_size=batch_size,
+            max_batches=options['max_batches'],
+            pause=options['pause'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} served orders"))
@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    help = ("Clear the idempotency keys of orders older than ORDER_IDEMPOTENCY_TTL, keeping the unique index "
+            "small. Cheap enough to run from cron every few minutes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl', type=int, help='Key lifetime in seconds (default settings.ORDER_IDEMPOTENCY_TTL)')
+
+    def handle(self, *args, **options):
+        ttl = options['ttl'] if options['ttl'] is not None else getattr(settings, 'ORDER_IDEMPOTENCY_TTL', 24 * 3600)
+        expired = Order.expire_idempotency_keys(timezone.now() - timedelta(seconds=ttl))
+        self.stdout.write(self.style.SUCCESS(f"Expired {expired} order idempotency keys"))
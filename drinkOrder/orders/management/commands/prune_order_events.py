@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from orders.models import OrderEvent
+
+
+class Command(BaseCommand):
+    help = ("Delete the live order feed events older than ORDER_EVENTS_RETENTION. Bartender screens "
+            "reconnecting after a longer gap just reload the queue.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention', type=int, help='Seconds of events to keep (default settings.ORDER_EVENTS_RETENTION)')
+
+    def handle(self, *args, **options):
+        retention = options['retention'] if options['retention'] is not None else getattr(settings, 'ORDER_EVENTS_RETENTION', 24 * 3600)
+        deleted = OrderEvent.prune(timezone.now() - timedelta(seconds=retention))
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} order events"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from orders.rollups import rebuild_sales_rollups, update_sales_rollups
+
+
+class Command(BaseCommand):
+    help = ("Add the orders served since the last run to the daily sales rollups behind the sales report. "
+            "Run it from a scheduler; --rebuild recomputes every day from the live and archived orders.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Recompute the rollups from the whole order history')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            written = rebuild_sales_rollups()
+        else:
+            written = update_sales_rollups()
+        self.stdout.write(self.style.SUCCESS(f"Wrote sales for {written} drink days"))
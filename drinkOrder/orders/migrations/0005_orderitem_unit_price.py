@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:02
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_unit_prices(apps, schema_editor):
+    # The price paid was never recorded, so existing lines get the drink's
+    # current price; the stored order totals are left as they were.
+    Drink = apps.get_model('drinks', 'Drink')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    OrderItem.objects.filter(unit_price__isnull=True).update(
+        unit_price=Subquery(Drink.objects.filter(pk=OuterRef('drink_id')).values('price')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drinks', '0014_drink_review_indexes'),
+        ('orders', '0004_order_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=5, null=True),
+        ),
+        migrations.RunPython(backfill_unit_prices, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=5),
+        ),
+    ]
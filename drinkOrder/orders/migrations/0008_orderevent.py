@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_order_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('new', 'New'), ('updated', 'Updated'), ('cancelled', 'Cancelled'), ('served', 'Served')], max_length=20)),
+                ('order_id', models.PositiveIntegerField()),
+                ('payload', models.JSONField()),
+                ('created_on', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
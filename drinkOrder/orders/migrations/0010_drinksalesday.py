@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drinks', '0014_drink_review_indexes'),
+        ('orders', '0009_archivedorder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('served_until', models.DateTimeField()),
+                ('updated_on', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DrinkSalesDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('order_count', models.IntegerField(default=0)),
+                ('drink', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_days', to='drinks.drink')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'drink'], name='drink_sales_day_idx')],
+                'unique_together': {('drink', 'day')},
+            },
+        ),
+    ]
@@ -1,7 +1,15 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from users.models import CustomUser
 from drinks.models import Drink
 
+from .events import broker
+
+# quantity * unit_price of an OrderItem, for aggregates over order lines
+LINE_TOTAL = ExpressionWrapper(F('quantity') * F('unit_price'), output_field=DecimalField(max_digits=9, decimal_places=2))
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -10,16 +18,208 @@ class Order(models.Model):
     created_on = models.DateTimeField(auto_now_add=True)
     total_price = models.DecimalField(max_digits=7, decimal_places=2)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    served_on = models.DateTimeField(null=True, blank=True)
+    # Token of the order form that placed the order, cleared once it expires
+    idempotency_key = models.CharField(max_length=32, null=True, blank=True)
     customer = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
     items = models.ManyToManyField(Drink, through='OrderItem')
 
+    class Meta:
+        indexes = [
+            # Bartender queue: the few pending orders get their own small
+            # index; served orders are most of the table, so the served and
+            # all tabs walk order_created_idx and stop after one page
+            models.Index(fields=['-created_on', '-id'], name='order_pending_queue_idx', condition=Q(status='pending')),
+            models.Index(fields=['-created_on', '-id'], name='order_created_idx'),
+            # Customer order history
+            models.Index(fields=['customer', '-created_on'], name='order_customer_created_idx'),
+            # Keys still to expire; the sweep empties it as it goes
+            models.Index(fields=['created_on'], name='order_idempotency_sweep_idx', condition=Q(idempotency_key__isnull=False)),
+        ]
+        constraints = [
+            # A resubmitted order form can never place a second order
+            models.UniqueConstraint(
+                fields=['customer', 'idempotency_key'], name='order_idempotency_key_unique',
+                condition=Q(idempotency_key__isnull=False),
+            ),
+        ]
+
     def __str__(self):
         return f"Order {self.id} ({self.status})"
-    
+
+    @property
+    def lines(self):
+        # Same shape as ArchivedOrder.lines, for templates showing both
+        return self.orderitem_set.all()
+
+    @classmethod
+    def expire_idempotency_keys(cls, older_than):
+        """
+        Clears the idempotency keys of orders placed before older_than so
+        the unique index only holds recent forms. Returns the number cleared.
+        """
+        return cls.objects.filter(idempotency_key__isnull=False, created_on__lt=older_than).update(idempotency_key=None)
+
+    @classmethod
+    def mark_served(cls, order_ids):
+        """
+        Serves the given orders that are still pending. The pending ones are
+        locked before the UPDATE, so concurrent bartenders never both serve
+        the same order. Returns the number of orders this call served.
+        """
+        served_on = timezone.now()
+        with transaction.atomic():
+            order_ids = list(
+                cls.objects.select_for_update().filter(pk__in=set(order_ids), status='pending').values_list('id', flat=True)
+            )
+            if order_ids:
+                cls.objects.filter(pk__in=order_ids).update(status='served', served_on=served_on)
+                OrderEvent.record('served', [
+                    {'id': order_id, 'status': 'served', 'served_on': served_on.isoformat()} for order_id in order_ids
+                ])
+        return len(order_ids)
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
     drink = models.ForeignKey(Drink, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
+    # Drink price when the item was ordered; later price changes leave it alone
+    unit_price = models.DecimalField(max_digits=5, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.drink.name} (x{self.quantity})"
+
+    @property
+    def line_total(self):
+        return self.unit_price * self.quantity
+
+    @classmethod
+    def revenue(cls, items=None):
+        """
+        Sum of quantity * unit_price over items (default: every OrderItem),
+        computed by the database.
+        """
+        items = cls.objects.all() if items is None else items
+        return items.aggregate(revenue=Coalesce(Sum(LINE_TOTAL), 0, output_field=LINE_TOTAL.output_field))['revenue']
+
+
+class OrderEvent(models.Model):
+    """
+    Change feed of the orders for the live bartender screens (see events.py).
+    order_id is a plain integer because cancelled orders are deleted. Old
+    events are removed by the prune_order_events command.
+    """
+    KIND_CHOICES = [
+        ('new', 'New'),
+        ('updated', 'Updated'),
+        ('cancelled', 'Cancelled'),
+        ('served', 'Served'),
+    ]
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    order_id = models.PositiveIntegerField()
+    payload = models.JSONField()
+    created_on = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Order {self.order_id} {self.kind}"
+
+    def as_message(self):
+        return {'id': self.id, 'type': self.kind, 'data': self.payload}
+
+    @classmethod
+    def record(cls, kind, payloads):
+        """
+        Writes one event per payload (a dict with at least the order 'id')
+        and publishes them to the open streams once the transaction commits.
+        Call inside the transaction that changes the orders.
+        """
+        events = cls.objects.bulk_create([cls(kind=kind, order_id=payload['id'], payload=payload) for payload in payloads])
+        messages = [event.as_message() for event in events]
+        transaction.on_commit(lambda: broker.publish(messages))
+
+    @classmethod
+    def after(cls, last_id, limit=500):
+        """
+        The messages of up to limit events recorded after event last_id,
+        oldest first.
+        """
+        return [event.as_message() for event in cls.objects.filter(pk__gt=last_id).order_by('pk')[:limit]]
+
+    @classmethod
+    def latest_id(cls):
+        return cls.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+    @classmethod
+    def prune(cls, older_than):
+        """
+        Deletes the events recorded before older_than. Returns the number
+        deleted.
+        """
+        deleted, _ = cls.objects.filter(created_on__lt=older_than).delete()
+        return deleted
+
+
+class ArchivedOrder(models.Model):
+    """
+    A served order moved out of the live tables by the archive_orders
+    command (see archive.py). It keeps its Order id, and its items are packed
+    into one JSON list of [drink id, quantity, unit price] triples.
+    """
+    id = models.PositiveIntegerField(primary_key=True)
+    created_on = models.DateTimeField()
+    served_on = models.DateTimeField(null=True, blank=True)
+    archived_on = models.DateTimeField(auto_now_add=True)
+    total_price = models.DecimalField(max_digits=7, decimal_places=2)
+    customer = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_orders')
+    items = models.JSONField()
+
+    status = 'served'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer', '-created_on'], name='archived_customer_created_idx'),
+            models.Index(fields=['created_on'], name='archived_created_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.drink.name} (x{self.quantity})"
\ No newline at end of file
+        return f"Archived order {self.id}"
+
+    def get_status_display(self):
+        return 'Served'
+
+
+class DrinkSalesDay(models.Model):
+    """
+    Sales of one drink on one day (the day the orders were placed): quantity
+    sold, revenue and the number of orders it was on. Counts served orders
+    only, and is kept up to date by the update_sales_rollups command (see
+    rollups.py).
+    """
+    drink = models.ForeignKey(Drink, on_delete=models.CASCADE, related_name='sales_days')
+    day = models.DateField()
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    order_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('drink', 'day')
+        indexes = [models.Index(fields=['day', 'drink'], name='drink_sales_day_idx')]
+
+    def __str__(self):
+        return f"{self.drink.name} on {self.day}: {self.quantity} for {self.revenue}"
+
+
+class SalesRollupWatermark(models.Model):
+    """
+    The single row recording how far DrinkSalesDay has been rolled up: every
+    order served up to served_until is counted.
+    """
+    served_until = models.DateTimeField()
+    updated_on = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Sales rolled up to {self.served_until}"
+
+    @classmethod
+    def current(cls):
+        return cls.objects.filter(pk=1).values_list('served_until', flat=True).first()
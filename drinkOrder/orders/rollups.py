@@ -0,0 +1,191 @@
+"""
+Daily sales rollups for the sales reports.
+
+DrinkSalesDay holds, per drink and per day orders were placed, the quantity
+sold, the revenue and the number of orders. Only served orders count: a
+pending order can still be updated or cancelled, a served one never changes
+again. That makes the rollups incremental:
+- update_sales_rollups() adds the orders served since the watermark
+  (SalesRollupWatermark.served_until) and up to SALES_ROLLUP_LAG seconds ago,
+  then moves the watermark there. The lag gives a serving transaction that
+  stamped served_on just before the cutoff time to commit;
+- rebuild_sales_rollups() recomputes every row from the live and the archived
+  orders, including served orders from before served_on was recorded. The
+  first update runs it.
+archive_served_orders() only moves orders the rollups already count, so the
+incremental update never reads the archive.
+
+sales_report() answers date-range questions from the rollup rows alone, a
+few hundred rows for a year of a typical menu, so reports never touch the
+order history.
+"""
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from drinks.models import Drink
+
+from .models import LINE_TOTAL, ArchivedOrder, DrinkSalesDay, Order, OrderItem, SalesRollupWatermark
+
+logger = logging.getLogger('django')
+
+REPORT_GROUPS = ('day', 'drink', 'category')
+
+
+def rollup_cutoff(now=None):
+    return (now or timezone.now()) - timedelta(seconds=getattr(settings, 'SALES_ROLLUP_LAG', 60))
+
+
+def add_sales(sales, key, quantity, revenue, order_count):
+    totals = sales.setdefault(key, [0, Decimal('0'), 0])
+    totals[0] += quantity
+    totals[1] += revenue
+    totals[2] += order_count
+
+
+def order_item_sales(orders, sales=None):
+    '''
+    Adds the sales of the items of orders, a queryset of served orders, to
+    sales: {(drink id, day): [quantity, revenue, order count]}. One
+    aggregate query.
+    '''
+    sales = {} if sales is None else sales
+    rows = OrderItem.objects.filter(order__in=orders).annotate(
+        day=TruncDate('order__created_on')
+    ).values('drink_id', 'day').annotate(
+        total_quantity=Sum('quantity'), revenue=Sum(LINE_TOTAL), order_count=Count('order_id', distinct=True)
+    ).order_by()
+    for row in rows:
+        add_sales(sales, (row['drink_id'], row['day']), row['total_quantity'], row['revenue'], row['order_count'])
+    return sales
+
+
+def archived_sales(sales=None):
+    '''
+    Adds the sales of every archived order to sales, as order_item_sales().
+    '''
+    sales = {} if sales is None else sales
+    for created_on, items in ArchivedOrder.objects.values_list('created_on', 'items').iterator():
+        day = timezone.localdate(created_on)
+        drinks = set()
+        for drink_id, quantity, unit_price in items:
+            add_sales(sales, (drink_id, day), quantity, Decimal(unit_price) * quantity, 0 if drink_id in drinks else 1)
+            drinks.add(drink_id)
+    return sales
+
+
+def apply_sales(sales):
+    '''
+    Adds sales to the DrinkSalesDay rows, creating the missing ones. Call in
+    the transaction that moves the watermark.
+    '''
+    if not sales:
+        return
+    rows = {
+        (row.drink_id, row.day): row
+        for row in DrinkSalesDay.objects.filter(
+            drink_id__in={drink_id for drink_id, _ in sales}, day__in={day for _, day in sales}
+        )
+    }
+    changed = []
+    added = []
+    for (drink_id, day), (quantity, revenue, order_count) in sales.items():
+        row = rows.get((drink_id, day))
+        if row is None:
+            added.append(DrinkSalesDay(drink_id=drink_id, day=day, quantity=quantity, revenue=revenue, order_count=order_count))
+            continue
+        row.quantity += quantity
+        row.revenue += revenue
+        row.order_count += order_count
+        changed.append(row)
+    if changed:
+        DrinkSalesDay.objects.bulk_update(changed, ['quantity', 'revenue', 'order_count'])
+    if added:
+        DrinkSalesDay.objects.bulk_create(added)
+
+
+def rebuild_sales_rollups(now=None):
+    '''
+    Recomputes DrinkSalesDay from every served order, live and archived, up
+    to the rollup cutoff. Returns the number of drink days written.
+    '''
+    cutoff = rollup_cutoff(now)
+    with transaction.atomic():
+        SalesRollupWatermark.objects.update_or_create(pk=1, defaults={'served_until': cutoff})
+        sales = order_item_sales(Order.objects.filter(
+            Q(served_on__lte=cutoff) | Q(served_on__isnull=True), status='served'
+        ))
+        archived_sales(sales)
+        # Archived lines may name drinks deleted since
+        drink_ids = set(Drink.objects.values_list('id', flat=True))
+        sales = {key: totals for key, totals in sales.items() if key[0] in drink_ids}
+        DrinkSalesDay.objects.all().delete()
+        DrinkSalesDay.objects.bulk_create([
+            DrinkSalesDay(drink_id=drink_id, day=day, quantity=quantity, revenue=revenue, order_count=order_count)
+            for (drink_id, day), (quantity, revenue, order_count) in sales.items()
+        ])
+    logger.info(f"Rebuilt sales rollups up to {cutoff.isoformat()}: {len(sales)} drink days")
+    return len(sales)
+
+
+def update_sales_rollups(now=None):
+    '''
+    Adds the orders served since the watermark to DrinkSalesDay, or rebuilds
+    the rollups when they have never been built. Returns the number of drink
+    days written.
+    '''
+    served_after = SalesRollupWatermark.current()
+    if served_after is None:
+        return rebuild_sales_rollups(now)
+    cutoff = rollup_cutoff(now)
+    if cutoff <= served_after:
+        return 0
+    with transaction.atomic():
+        # Moving the watermark first takes the write lock; a concurrent run
+        # that moved it already leaves nothing to do here
+        if not SalesRollupWatermark.objects.filter(pk=1, served_until=served_after).update(served_until=cutoff):
+            return 0
+        sales = order_item_sales(Order.objects.filter(
+            status='served', served_on__gt=served_after, served_on__lte=cutoff
+        ))
+        apply_sales(sales)
+    logger.info(f"Rolled up sales served up to {cutoff.isoformat()}: {len(sales)} drink days")
+    return len(sales)
+
+
+def sales_report(start, end, group_by='day'):
+    '''
+    Quantity and revenue per day, drink or category (group_by) for the days
+    start to end inclusive, read from DrinkSalesDay; drinks also get their
+    order count. Returns a list of dicts with the revenue as a string.
+    '''
+    rows = DrinkSalesDay.objects.filter(day__gte=start, day__lte=end)
+    totals = {'quantity': Sum('quantity'), 'revenue': Sum('revenue')}
+    if group_by == 'day':
+        rows = rows.values('day').annotate(**totals).order_by('day')
+    elif group_by == 'drink':
+        rows = rows.values('drink_id', 'drink__name').annotate(
+            order_count=Sum('order_count'), **totals
+        ).order_by('-revenue', 'drink__name')
+    elif group_by == 'category':
+        rows = rows.values('drink__category_id', 'drink__category__name').annotate(**totals).order_by('-revenue')
+    else:
+        raise ValueError(f"Unknown sales report grouping: {group_by}")
+
+    report = []
+    for row in rows:
+        if group_by == 'day':
+            entry = {'day': row['day'].isoformat()}
+        elif group_by == 'drink':
+            entry = {'drink_id': row['drink_id'], 'drink': row['drink__name'], 'order_count': row['order_count']}
+        else:
+            entry = {'category_id': row['drink__category_id'], 'category': row['drink__category__name'] or 'Uncategorized'}
+        entry.update(quantity=row['quantity'], revenue=f"{row['revenue']:.2f}")
+        report.append(entry)
+    return report
@@ -0,0 +1,187 @@
+"""
+Order write path shared by PlaceOrderView and OrderUpdateView.
+
+The order forms post one quantity_<drink id> field per drink. Only those
+keys are read, and the drinks they name are fetched in a single in_bulk()
+query. Each write is one transaction:
+- placing an order inserts the Order and all its items with bulk_create();
+- updating an order changes only what differs: it updates the quantities
+  that changed, deletes the removed lines and inserts the new ones.
+Each line keeps the drink price it was ordered at (unit_price), and the
+order total is the sum of the lines, computed from the lines being written
+rather than read back. The leaderboard counters and the customer's profile
+stats move by the same quantity deltas. Bulk writes send no post_save
+signals, so the menu caches are invalidated here instead.
+
+Every write also records the OrderEvent the live bartender screens stream
+(events.py).
+
+The order form carries a random idempotency key that is stored with the
+order under a unique constraint. A resubmitted form (a double click or a
+retry after a slow response) hits the constraint on its first insert and
+gets the order the first submission placed, without writing anything.
+"""
+import logging
+import re
+import uuid
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch, prefetch_related_objects
+
+from drinkOrder.instrumentation import count
+from drinks.menu_cache import bump_catalog_version
+from drinks.models import Drink, DrinkLeaderboard
+from users.models import CustomerStats
+
+from .events import order_payload
+from .models import Order, OrderEvent, OrderItem
+
+logger = logging.getLogger('django')
+
+QUANTITY_FIELD = re.compile(r'quantity_(\d+)')
+IDEMPOTENCY_KEY = re.compile(r'[0-9a-f]{32}')
+
+
+def new_idempotency_key():
+    return uuid.uuid4().hex
+
+
+def parse_idempotency_key(data):
+    '''
+    Returns the idempotency_key field of data, or None when it is missing or
+    malformed (the order is then placed without double-submit protection).
+    '''
+    key = data.get('idempotency_key', '')
+    return key if IDEMPOTENCY_KEY.fullmatch(key) else None
+
+
+def parse_quantities(data):
+    '''
+    Returns {drink id: quantity} for the quantity_<id> fields of data with a
+    positive quantity. Malformed quantities are logged and skipped.
+    '''
+    quantities = {}
+    for key, value in data.items():
+        match = QUANTITY_FIELD.fullmatch(key)
+        if not match:
+            continue
+        try:
+            quantity = int(value)
+        except ValueError:
+            logger.error(f"Invalid quantity for drink {match.group(1)}: {value}")
+            continue
+        if quantity > 0:
+            quantities[int(match.group(1))] = quantity
+    return quantities
+
+
+def lines(drinks, quantities):
+    return [(drinks[drink_id].name, quantity) for drink_id, quantity in quantities.items()]
+
+
+def order_total(items):
+    return sum((item.unit_price * item.quantity for item in items), Decimal('0'))
+
+
+def place_order(customer, quantities, idempotency_key=None):
+    '''
+    Creates a pending order for customer from quantities, skipping drinks
+    that do not exist or are not available. When customer already placed an
+    order with idempotency_key, returns that order instead. Returns the
+    order with its items and their drinks loaded, or None when nothing could
+    be ordered.
+    '''
+    drinks = Drink.objects.filter(is_available=True).in_bulk(list(quantities))
+    quantities = {drink_id: quantity for drink_id, quantity in quantities.items() if drink_id in drinks}
+    if not quantities:
+        return None
+    try:
+        with transaction.atomic():
+            items = [
+                OrderItem(drink_id=drink_id, quantity=quantity, unit_price=drinks[drink_id].price)
+                for drink_id, quantity in quantities.items()
+            ]
+            order = Order.objects.create(
+                total_price=order_total(items),
+                status='pending',
+                customer=customer,
+                idempotency_key=idempotency_key
+            )
+            for item in items:
+                item.order = order
+            OrderItem.objects.bulk_create(items)
+            DrinkLeaderboard.record(quantities, order.created_on)
+            CustomerStats.record(customer.id, quantities, order.created_on, visits=1)
+            OrderEvent.record('new', [order_payload(order, lines(drinks, quantities))])
+            bump_catalog_version()
+    except IntegrityError:
+        if idempotency_key is None:
+            raise
+        order = Order.objects.get(customer=customer, idempotency_key=idempotency_key)
+        count('idempotency', 'replayed')
+        logger.info(f"Order form {idempotency_key} resubmitted by {customer.username}, returning order {order.id}")
+    prefetch_related_objects([order], Prefetch('orderitem_set', queryset=OrderItem.objects.select_related('drink')))
+    return order
+
+
+def update_order(order, quantities):
+    '''
+    Replaces the items of order with quantities by applying the difference
+    to the existing lines. Lines already on the order keep their unit price;
+    new lines take the drink's current price. Returns False, leaving the
+    order untouched, when none of the drinks exist.
+    '''
+    drinks = Drink.objects.in_bulk(list(quantities))
+    quantities = {drink_id: quantity for drink_id, quantity in quantities.items() if drink_id in drinks}
+    if not quantities:
+        return False
+    with transaction.atomic():
+        current = {item.drink_id: item for item in OrderItem.objects.filter(order=order)}
+        deltas = dict(quantities)
+        changed = []
+        removed = []
+        for drink_id, item in current.items():
+            deltas[drink_id] = deltas.get(drink_id, 0) - item.quantity
+            if drink_id not in quantities:
+                removed.append(item.pk)
+            elif item.quantity != quantities[drink_id]:
+                item.quantity = quantities[drink_id]
+                changed.append(item)
+        added = [
+            OrderItem(order=order, drink_id=drink_id, quantity=quantity, unit_price=drinks[drink_id].price)
+            for drink_id, quantity in quantities.items() if drink_id not in current
+        ]
+
+        if removed:
+            OrderItem.objects.filter(pk__in=removed).delete()
+        if changed:
+            OrderItem.objects.bulk_update(changed, ['quantity'])
+        if added:
+            OrderItem.objects.bulk_create(added)
+        order.total_price = order_total(
+            [item for drink_id, item in current.items() if drink_id in quantities] + added
+        )
+        Order.objects.filter(pk=order.pk).update(total_price=order.total_price)
+        DrinkLeaderboard.record(deltas, order.created_on)
+        CustomerStats.record(order.customer_id, deltas, order.created_on)
+        OrderEvent.record('updated', [order_payload(order, lines(drinks, quantities))])
+        bump_catalog_version()
+    return True
+
+
+def cancel_order(order):
+    '''
+    Deletes order and its items and takes their quantities back off the
+    leaderboard and the customer's stats.
+    '''
+    with transaction.atomic():
+        cancelled = {
+            drink_id: -quantity
+            for drink_id, quantity in OrderItem.objects.filter(order=order).values_list('drink_id', 'quantity')
+        }
+        order_id = order.id
+        order.delete()
+        DrinkLeaderboard.record(cancelled, order.created_on)
+        CustomerStats.record(order.customer_id, cancelled, order.created_on, visits=-1)
+        OrderEvent.record('cancelled', [{'id': order_id, 'status': 'cancelled'}])
@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from drinks.menu_cache import bump_catalog_version
+
+from .models import OrderItem
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def invalidate_menu_fragments(sender, **kwargs):
+    # Ordered quantities only show in the menus' top drinks
+    bump_catalog_version()
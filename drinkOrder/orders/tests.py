@@ -1,3 +1,510 @@
-from django.test import TestCase
+import asyncio
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from drinkOrder.query_budget import QueryBudgetTestMixin
+from drinkOrder.query_plans import QueryPlanTestMixin
+from drinks.models import Category, Drink, DrinkLeaderboard
+from users.models import CustomUser
+
+from .archive import archive_served_orders
+from .events import broker
+from .models import ArchivedOrder, DrinkSalesDay, Order, OrderEvent, OrderItem, SalesRollupWatermark
+from .rollups import rebuild_sales_rollups, update_sales_rollups
+from .views import encode_cursor
+
+
+def seed_orders(orders_per_customer=5, items_per_order=3, customers=3):
+    '''
+    Orders for several customers with a few items each, so that loading the
+    items or drinks per order shows up as dozens of extra queries.
+    '''
+    drinks = [Drink.objects.create(name=f"Drink {index}", price=2 + index) for index in range(items_per_order * 2)]
+    users = [CustomUser.objects.create_user(f"customer{index}", password='password') for index in range(customers)]
+    for user in users:
+        for index in range(orders_per_customer):
+            ordered = drinks[index % 2::2][:items_per_order]
+            order = Order.objects.create(customer=user, total_price=sum(drink.price * 2 for drink in ordered))
+            for drink in ordered:
+                OrderItem.objects.create(order=order, drink=drink, quantity=2, unit_price=drink.price)
+            DrinkLeaderboard.record({drink.id: 2 for drink in ordered}, order.created_on)
+    return drinks, users
+
+
+class OrderViewQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.drinks, cls.customers = seed_orders()
+        cls.bartender = CustomUser.objects.create_user(
+            'bartender', password='password', is_customer=False, is_bartender=True
+        )
+
+    def test_order_list(self):
+        self.client.force_login(self.bartender)
+        with self.assertQueryBudget('orders:order_list'):
+            response = self.client.get(reverse('orders:order_list'))
+        self.assertContains(response, 'customer2')
+        self.assertContains(response, 'Drink 5 (x2)')
+
+    def test_order_list_pages_by_keyset(self):
+        Order.objects.filter(pk__in=Order.objects.order_by('id').values('pk')[:3]).update(status='served')
+        pending = list(Order.objects.filter(status='pending').order_by('-created_on', '-id').values_list('id', flat=True))
+        self.client.force_login(self.bartender)
+
+        seen = []
+        url = reverse('orders:order_list')
+        with mock.patch('orders.views.ORDER_PAGE_SIZE', 4):
+            for _ in range(len(pending)):
+                with self.assertQueryBudget('orders:order_list'):
+                    response = self.client.get(url)
+                seen += [order.id for order in response.context['orders']]
+                cursor = response.context['next_cursor']
+                if not cursor:
+                    break
+                url = f"{reverse('orders:order_list')}?status=pending&after={cursor}"
+        self.assertEqual(seen, pending)
+
+        response = self.client.get(reverse('orders:order_list'), {'status': 'served'})
+        self.assertEqual(len(response.context['orders']), 3)
+        self.assertIsNone(response.context['next_cursor'])
+
+    @override_settings(SERVER_TIMING=True)
+    def test_serve_order_once(self):
+        self.client.force_login(self.bartender)
+        order = Order.objects.order_by('id').first()
+        with self.assertQueryBudget('orders:serve_order'):
+            response = self.client.post(reverse('orders:serve_order', args=[order.id]))
+        self.assertRedirects(response, reverse('orders:order_list'))
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'served')
+        self.assertIsNotNone(order.served_on)
+
+        served_on = order.served_on
+        response = self.client.post(reverse('orders:serve_order', args=[order.id]))
+        self.assertIn('serve;desc="skipped=1"', response['Server-Timing'])
+        order.refresh_from_db()
+        self.assertEqual(order.served_on, served_on)
+
+    @override_settings(SERVER_TIMING=True)
+    def test_bulk_serve_orders(self):
+        self.client.force_login(self.bartender)
+        first, second, third = Order.objects.order_by('id')[:3]
+        Order.mark_served([first.id])
+        with self.assertQueryBudget('orders:serve_orders'):
+            response = self.client.post(reverse('orders:serve_orders'), {'order_ids': [first.id, second.id, third.id, 'x']})
+        self.assertIn('serve;desc="served=2 skipped=1"', response['Server-Timing'])
+        self.assertEqual(Order.objects.filter(pk__in=[first.id, second.id, third.id], status='served').count(), 3)
+
+        self.client.force_login(self.customers[0])
+        response = self.client.post(reverse('orders:serve_orders'), {'order_ids': [Order.objects.filter(status='pending').first().id]})
+        self.assertEqual(response.status_code, 403)
+
+    def test_customer_order_list(self):
+        self.client.force_login(self.customers[0])
+        with self.assertQueryBudget('orders:customer_order_list'):
+            response = self.client.get(reverse('orders:customer_order_list'))
+        self.assertContains(response, 'Drink 4 (x2)')
+
+    def test_place_order(self):
+        self.client.force_login(self.customers[0])
+        with self.assertQueryBudget('orders:place_order'):
+            response = self.client.get(reverse('orders:place_order'))
+        self.assertContains(response, 'Drink 5')
+
+        ordered_before = DrinkLeaderboard.objects.get(drink=self.drinks[0]).total_quantity
+        data = {f"quantity_{drink.id}": 1 for drink in self.drinks}
+        with self.assertQueryBudget('orders:place_order'):
+            response = self.client.post(reverse('orders:place_order'), data)
+        self.assertContains(response, 'Drink 5 (x1)')
+        self.assertEqual(DrinkLeaderboard.objects.get(drink=self.drinks[0]).total_quantity, ordered_before + 1)
+
+    @override_settings(SERVER_TIMING=True)
+    def test_resubmitted_order_form_places_one_order(self):
+        self.client.force_login(self.customers[0])
+        key = self.client.get(reverse('orders:place_order')).context['idempotency_key']
+        data = {f"quantity_{self.drinks[0].id}": 1, 'idempotency_key': key}
+        orders_before = Order.objects.count()
+        ordered_before = DrinkLeaderboard.objects.get(drink=self.drinks[0]).total_quantity
+
+        first = self.client.post(reverse('orders:place_order'), data)
+        with self.assertQueryBudget('orders:place_order'):
+            second = self.client.post(reverse('orders:place_order'), data)
+        self.assertEqual(second.context['order'].id, first.context['order'].id)
+        self.assertContains(second, 'Drink 0 (x1)')
+        self.assertIn('idempotency;desc="replayed=1"', second['Server-Timing'])
+        self.assertEqual(Order.objects.count(), orders_before + 1)
+        self.assertEqual(DrinkLeaderboard.objects.get(drink=self.drinks[0]).total_quantity, ordered_before + 1)
+
+        # Another customer's form with the same key is a different order
+        self.client.force_login(self.customers[1])
+        third = self.client.post(reverse('orders:place_order'), data)
+        self.assertNotEqual(third.context['order'].id, first.context['order'].id)
+
+        # Once the key has expired, the same form places a new order
+        call_command('expire_idempotency_keys', ttl=0, stdout=StringIO())
+        self.client.force_login(self.customers[0])
+        fourth = self.client.post(reverse('orders:place_order'), data)
+        self.assertNotEqual(fourth.context['order'].id, first.context['order'].id)
+
+    def test_place_order_ignores_unavailable_and_unknown_drinks(self):
+        self.client.force_login(self.customers[0])
+        Drink.objects.filter(pk=self.drinks[1].pk).update(is_available=False)
+        data = {f"quantity_{self.drinks[0].id}": 2, f"quantity_{self.drinks[1].id}": 1, 'quantity_999999': 1, 'quantity_x': 1}
+        response = self.client.post(reverse('orders:place_order'), data)
+        order = response.context['order']
+        self.assertEqual(list(order.orderitem_set.values_list('drink_id', 'quantity')), [(self.drinks[0].id, 2)])
+        self.assertEqual(order.total_price, self.drinks[0].price * 2)
+
+        response = self.client.post(reverse('orders:place_order'), {f"quantity_{self.drinks[1].id}": 1})
+        self.assertEqual(response.context['error'], 'Please select at least one drink.')
+        self.assertEqual(Order.objects.filter(customer=self.customers[0]).count(), 6)
+
+    def test_update_order_applies_the_difference(self):
+        self.client.force_login(self.customers[0])
+        order = Order.objects.filter(customer=self.customers[0]).order_by('id').first()
+        kept, changed, removed = order.orderitem_set.order_by('id')
+        added = next(drink for drink in self.drinks if drink.id not in {kept.drink_id, changed.drink_id, removed.drink_id})
+        totals_before = dict(DrinkLeaderboard.objects.values_list('drink_id', 'total_quantity'))
+
+        data = {f"quantity_{kept.drink_id}": 2, f"quantity_{changed.drink_id}": 5, f"quantity_{added.id}": 1}
+        response = self.client.post(reverse('orders:order_update', args=[order.id]), data)
+        self.assertRedirects(response, reverse('orders:customer_order_list'))
+
+        items = {item.drink_id: item for item in order.orderitem_set.all()}
+        self.assertEqual({drink_id: item.quantity for drink_id, item in items.items()}, {
+            kept.drink_id: 2, changed.drink_id: 5, added.id: 1,
+        })
+        # Unchanged and changed lines keep their rows
+        self.assertEqual(items[kept.drink_id].pk, kept.pk)
+        self.assertEqual(items[changed.drink_id].pk, changed.pk)
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, sum(Drink.objects.get(pk=drink_id).price * item.quantity for drink_id, item in items.items()))
+
+        totals = dict(DrinkLeaderboard.objects.values_list('drink_id', 'total_quantity'))
+        self.assertEqual(totals[kept.drink_id], totals_before[kept.drink_id])
+        self.assertEqual(totals[changed.drink_id], totals_before[changed.drink_id] + 3)
+        self.assertEqual(totals[removed.drink_id], totals_before[removed.drink_id] - 2)
+        self.assertEqual(totals[added.id], totals_before.get(added.id, 0) + 1)
+
+    def test_order_lines_keep_the_price_they_were_ordered_at(self):
+        self.client.force_login(self.customers[0])
+        first, second = self.drinks[:2]
+        response = self.client.post(reverse('orders:place_order'), {f"quantity_{first.id}": 2})
+        order = response.context['order']
+        self.assertEqual(order.total_price, first.price * 2)
+
+        Drink.objects.filter(pk__in=[first.pk, second.pk]).update(price=F('price') + 10)
+        data = {f"quantity_{first.id}": 3, f"quantity_{second.id}": 1}
+        self.client.post(reverse('orders:order_update', args=[order.id]), data)
+        order.refresh_from_db()
+        self.assertEqual(order.orderitem_set.get(drink=first).unit_price, first.price)
+        self.assertEqual(order.orderitem_set.get(drink=second).unit_price, second.price + 10)
+        self.assertEqual(order.total_price, first.price * 3 + second.price + 10)
+        self.assertEqual(OrderItem.revenue(order.orderitem_set.all()), order.total_price)
+
+    def test_cancel_order(self):
+        self.client.force_login(self.customers[0])
+        order = Order.objects.filter(customer=self.customers[0]).order_by('id').first()
+        drink_id = order.orderitem_set.first().drink_id
+        total_before = DrinkLeaderboard.objects.get(drink_id=drink_id).total_quantity
+        self.client.post(reverse('orders:order_update', args=[order.id]), {'cancel': 'true'})
+        self.assertFalse(Order.objects.filter(pk=order.pk).exists())
+        self.assertEqual(DrinkLeaderboard.objects.get(drink_id=drink_id).total_quantity, total_before - 2)
+
+
+class OrderQueryPlanTests(QueryPlanTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.drinks, cls.customers = seed_orders()
+        Order.objects.filter(pk__in=Order.objects.order_by('id').values('pk')[:5]).update(status='served')
+        cls.bartender = CustomUser.objects.create_user(
+            'bartender', password='password', is_customer=False, is_bartender=True
+        )
+
+    def test_order_list_uses_status_indexes(self):
+        self.client.force_login(self.bartender)
+        url = reverse('orders:order_list')
+        with self.assertUsesIndex('order_pending_queue_idx'):
+            response = self.client.get(url)
+        cursor = encode_cursor(response.context['orders'][0])
+        with self.assertUsesIndex('order_pending_queue_idx'):
+            self.client.get(url, {'after': cursor})
+        for status in ('served', 'all'):
+            with self.assertUsesIndex('order_created_idx'):
+                self.client.get(url, {'status': status})
+
+    def test_customer_order_list_uses_customer_index(self):
+        self.client.force_login(self.customers[0])
+        with self.assertUsesIndex('order_customer_created_idx'):
+            self.client.get(reverse('orders:customer_order_list'))
+
+    def test_order_form_uses_drink_name_index(self):
+        self.client.force_login(self.customers[0])
+        with self.assertUsesIndex('drink_name_idx'):
+            self.client.get(reverse('orders:place_order'))
+
+
+class OrderEventFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.drinks, cls.customers = seed_orders(orders_per_customer=2, customers=2)
+        cls.bartender = CustomUser.objects.create_user(
+            'bartender', password='password', is_customer=False, is_bartender=True
+        )
+
+    def event_kinds(self, after):
+        return list(OrderEvent.objects.filter(pk__gt=after).order_by('pk').values_list('kind', 'order_id'))
+
+    def test_order_writes_record_events(self):
+        start = OrderEvent.latest_id()
+        self.client.force_login(self.customers[0])
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            order = self.client.post(reverse('orders:place_order'), {f"quantity_{self.drinks[0].id}": 2}).context['order']
+        self.assertEqual(len(callbacks), 2)  # the catalog version bump and the broker
+        event = OrderEvent.objects.get(pk__gt=start)
+        self.assertEqual(event.payload['items'], [{'drink': 'Drink 0', 'quantity': 2}])
+        self.assertEqual(event.payload['customer'], 'customer0')
+
+        self.client.post(reverse('orders:order_update', args=[order.id]), {f"quantity_{self.drinks[1].id}": 1})
+        pending = Order.objects.filter(status='pending').exclude(pk=order.pk).order_by('id')
+        other, taken = pending[0], pending[1]
+        Order.mark_served([taken.id])
+        self.client.force_login(self.bartender)
+        self.client.post(reverse('orders:serve_orders'), {'order_ids': [other.id, taken.id]})
+        self.client.force_login(self.customers[0])
+        self.client.post(reverse('orders:order_update', args=[order.id]), {'cancel': 'true'})
+        self.assertEqual(self.event_kinds(start), [
+            ('new', order.id), ('updated', order.id), ('served', taken.id), ('served', other.id), ('cancelled', order.id),
+        ])
+
+    def test_empty_live_queue_has_a_table_to_fill(self):
+        Order.objects.update(status='served')
+        self.client.force_login(self.bartender)
+        response = self.client.get(reverse('orders:order_list'))
+        self.assertContains(response, '<div id="order-table" class="overflow-x-auto hidden">', html=False)
+        self.assertContains(response, '<tbody id="order-rows" aria-live="polite">', html=False)
+        self.assertContains(response, 'No pending orders at this time.')
+        self.assertContains(response, f"?last_event_id={OrderEvent.latest_id()}")
+
+        # Other statuses are not live
+        response = self.client.get(reverse('orders:order_list'), {'status': 'served'})
+        self.assertNotContains(response, 'EventSource')
+        self.assertNotContains(response, 'No pending orders at this time.')
+
+    def test_feed_without_asgi_returns_the_events_so_far(self):
+        start = OrderEvent.latest_id()
+        Order.mark_served([Order.objects.order_by('id').first().id])
+        self.client.force_login(self.customers[0])
+        self.assertEqual(self.client.get(reverse('orders:order_events')).status_code, 403)
+
+        self.client.force_login(self.bartender)
+        response = self.client.get(reverse('orders:order_events'), HTTP_LAST_EVENT_ID=str(start))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = response.content.decode()
+        self.assertTrue(body.startswith('retry: '))
+        self.assertIn(f"id: {start + 1}\nevent: served\n", body)
+        # Without a Last-Event-ID the feed starts from now
+        self.assertNotIn('event:', self.client.get(reverse('orders:order_events')).content.decode())
+
+        response = self.client.get(reverse('orders:order_list'))
+        self.assertEqual(response.context['last_event_id'], start + 1)
+
+    async def test_stream_resumes_and_pushes_events(self):
+        first = await Order.objects.order_by('id').afirst()
+        start = await sync_to_async(OrderEvent.latest_id)()
+        await sync_to_async(Order.mark_served)([first.id])
+        await self.async_client.aforce_login(self.bartender)
+        response = await self.async_client.get(reverse('orders:order_events'), headers={'Last-Event-ID': str(start)})
+        self.assertTrue(response.streaming)
+        chunks = aiter(response.streaming_content)
+
+        self.assertTrue((await asyncio.wait_for(anext(chunks), 5)).decode().startswith('retry: '))
+        # The event written before connecting comes from the database
+        self.assertIn(f"id: {start + 1}\nevent: served\n", (await asyncio.wait_for(anext(chunks), 5)).decode())
+        # Later ones are pushed by the broker
+        broker.publish([{'id': start + 2, 'type': 'new', 'data': {'id': 12345}}])
+        pushed = (await asyncio.wait_for(anext(chunks), 5)).decode()
+        self.assertEqual(pushed, f'id: {start + 2}\nevent: new\ndata: {{"id": 12345}}\n\n')
+
+        # A disconnect cancels the pending read, which unsubscribes the stream
+        read = asyncio.ensure_future(anext(chunks))
+        await asyncio.sleep(0.05)
+        read.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await read
+        self.assertFalse(broker.subscriptions)
+
+
+class OrderArchiveTests(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.drinks, cls.customers = seed_orders(orders_per_customer=4, customers=2)
+        cls.bartender = CustomUser.objects.create_user(
+            'bartender', password='password', is_customer=False, is_bartender=True
+        )
+        orders = list(Order.objects.order_by('id').values_list('id', flat=True))
+        # Per customer: two old served orders, one old pending and one recent served
+        cls.old_served = [order_id for index, order_id in enumerate(orders) if index % 4 in (0, 1)]
+        old = [order_id for index, order_id in enumerate(orders) if index % 4 != 3]
+        Order.mark_served(cls.old_served + [order_id for index, order_id in enumerate(orders) if index % 4 == 3])
+        Order.objects.filter(pk__in=old).update(created_on=timezone.now() - timedelta(days=100))
+
+    def test_archive_moves_old_served_orders(self):
+        items = {
+            order_id: sorted([drink_id, quantity, str(unit_price)] for drink_id, quantity, unit_price in OrderItem.objects.filter(
+                order_id=order_id
+            ).values_list('drink_id', 'quantity', 'unit_price'))
+            for order_id in self.old_served
+        }
+        totals = dict(Order.objects.filter(pk__in=self.old_served).values_list('id', 'total_price'))
+        live = Order.objects.count()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            call_command('archive_orders', batch_size=3, stdout=StringIO())
+        self.assertEqual(callbacks, [])
+
+        self.assertEqual(Order.objects.count(), live - len(self.old_served))
+        self.assertFalse(OrderItem.objects.filter(order_id__in=self.old_served).exists())
+        archived = ArchivedOrder.objects.in_bulk()
+        self.assertEqual(sorted(archived), sorted(self.old_served))
+        for order_id, order in archived.items():
+            self.assertEqual(sorted(order.items), items[order_id])
+            self.assertEqual(order.total_price, totals[order_id])
+            self.assertIsNotNone(order.served_on)
+        # Old pending and recent served orders stay live
+        self.assertEqual(Order.objects.filter(status='served').count(), 2)
+        self.assertEqual(Order.objects.filter(status='pending').count(), 2)
+        # A second run has nothing left to do
+        self.assertEqual(archive_served_orders(timezone.now() - timedelta(days=90)), 0)
+
+    def test_full_history_reads_both_tables(self):
+        archive_served_orders(timezone.now() - timedelta(days=90), batch_size=10, max_batches=1)
+        customer = self.customers[0]
+        archived_ids = list(customer.archived_orders.order_by('-created_on', '-id').values_list('id', flat=True))
+        self.assertEqual(len(archived_ids), 2)
+
+        self.client.force_login(customer)
+        response = self.client.get(reverse('orders:customer_order_list'))
+        self.assertEqual(len(response.context['orders']), 2)
+        with self.assertQueryBudget('orders:customer_order_list'):
+            response = self.client.get(reverse('orders:customer_order_list'), {'history': 'all'})
+        orders = response.context['orders']
+        self.assertEqual([order.id for order in orders[2:]], archived_ids)
+        self.assertEqual([order.created_on for order in orders], sorted((order.created_on for order in orders), reverse=True))
+        self.assertContains(response, 'Drink 1 (x2)')
+
+    def test_analytics_include_archived_orders(self):
+        leaderboard = dict(DrinkLeaderboard.objects.values_list('drink_id', 'total_quantity'))
+        customer = self.customers[0]
+        self.client.force_login(self.bartender)
+        favorites = [
+            (drink.id, drink.total_quantity)
+            for drink in self.client.get(reverse('users:customer_profile', args=[customer.id])).context['favorite_drinks']
+        ]
+
+        archive_served_orders(timezone.now() - timedelta(days=90))
+        output = StringIO()
+        call_command('rebuild_leaderboard', stdout=output)
+        self.assertIn('0 all-time counters had drifted', output.getvalue())
+        self.assertEqual(dict(DrinkLeaderboard.objects.values_list('drink_id', 'total_quantity')), leaderboard)
+        with self.assertQueryBudget('users:customer_profile'):
+            response = self.client.get(reverse('users:customer_profile', args=[customer.id]))
+        self.assertEqual([(drink.id, drink.total_quantity) for drink in response.context['favorite_drinks']], favorites)
+
+
+class SalesRollupTests(QueryBudgetTestMixin, QueryPlanTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.drinks, cls.customers = seed_orders(orders_per_customer=3, customers=2)
+        category = Category.objects.create(name='Cocktails')
+        Drink.objects.filter(pk__in=[drink.id for drink in cls.drinks[:3]]).update(category=category)
+        cls.bartender = CustomUser.objects.create_user(
+            'bartender', password='password', is_customer=False, is_bartender=True
+        )
+        cls.orders = list(Order.objects.order_by('id').values_list('id', flat=True))
+
+    def rollups(self):
+        return {
+            (row.drink_id, row.day): (row.quantity, row.revenue, row.order_count)
+            for row in DrinkSalesDay.objects.all()
+        }
+
+    def test_update_adds_only_newly_served_orders(self):
+        Order.mark_served(self.orders[:2])
+        later = timezone.now() + timedelta(minutes=5)
+        update_sales_rollups(later)
+        self.assertEqual(SalesRollupWatermark.current(), later - timedelta(seconds=60))
+        self.assertEqual(sum(row.order_count for row in DrinkSalesDay.objects.all()), 6)
+
+        Order.mark_served(self.orders[2:4])
+        Order.objects.filter(pk=self.orders[2]).update(served_on=later + timedelta(minutes=5))
+        Order.objects.filter(pk=self.orders[3]).update(served_on=later + timedelta(minutes=30))
+        # Served within the lag: left for the next run
+        update_sales_rollups(later + timedelta(minutes=10))
+        self.assertEqual(sum(row.order_count for row in DrinkSalesDay.objects.all()), 9)
+        with self.assertNumQueries(1):
+            self.assertEqual(update_sales_rollups(later + timedelta(minutes=10)), 0)
+        update_sales_rollups(later + timedelta(hours=1))
+
+        incremental = self.rollups()
+        rebuild_sales_rollups(later + timedelta(hours=1))
+        self.assertEqual(self.rollups(), incremental)
+        day = timezone.localdate()
+        served = OrderItem.objects.filter(order_id__in=self.orders[:4], drink=self.drinks[0])
+        self.assertEqual(incremental[(self.drinks[0].id, day)], (
+            sum(item.quantity for item in served), sum(item.line_total for item in served), served.count(),
+        ))
+
+    def test_rebuild_includes_archived_orders_and_archive_waits_for_rollups(self):
+        Order.mark_served(self.orders)
+        Order.objects.filter(pk__in=self.orders).update(created_on=timezone.now() - timedelta(days=100))
+        update_sales_rollups(timezone.now() + timedelta(minutes=5))
+        rolled_up = self.rollups()
+        self.assertEqual(archive_served_orders(timezone.now() - timedelta(days=90), batch_size=4), len(self.orders))
+        rebuild_sales_rollups(timezone.now() + timedelta(minutes=5))
+        self.assertEqual(self.rollups(), rolled_up)
+
+        order = Order.objects.create(customer=self.customers[0], total_price=2)
+        Order.objects.filter(pk=order.pk).update(created_on=timezone.now() - timedelta(days=100))
+        Order.mark_served([order.pk])
+        Order.objects.filter(pk=order.pk).update(served_on=timezone.now() + timedelta(hours=1))
+        self.assertEqual(archive_served_orders(timezone.now() - timedelta(days=90)), 0)
+
+    def test_sales_report(self):
+        Order.mark_served(self.orders)
+        update_sales_rollups(timezone.now() + timedelta(minutes=5))
+        url = reverse('orders:sales_report_data')
+        self.client.force_login(self.customers[0])
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(self.bartender)
+        with self.assertQueryBudget('orders:sales_report'):
+            response = self.client.get(reverse('orders:sales_report'))
+        self.assertContains(response, 'Cocktails')
+        revenue = sum(item.line_total for item in OrderItem.objects.all())
+        self.assertEqual(response.context['total_revenue'], revenue)
+
+        today = timezone.localdate().isoformat()
+        with self.assertUsesIndex('drink_sales_day_idx'), self.assertQueryBudget('orders:sales_report_data'):
+            data = self.client.get(url, {'start': today, 'end': today}).json()
+        self.assertEqual(data['rows'], [{'day': today, 'quantity': OrderItem.objects.count() * 2, 'revenue': str(revenue)}])
+        drinks = self.client.get(url, {'group': 'drink'}).json()['rows']
+        self.assertEqual({row['drink_id'] for row in drinks}, {drink.id for drink in self.drinks})
+        self.assertEqual(sum(row['order_count'] for row in drinks), OrderItem.objects.count())
+        categories = self.client.get(url, {'group': 'category'}).json()['rows']
+        self.assertEqual({row['category'] for row in categories}, {'Cocktails', 'Uncategorized'})
+
+        response = self.client.get(url, {'group': '<script>'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'group must be one of day, drink, category'})
+        self.assertEqual(self.client.get(url, {'start': today, 'end': '2000-01-01'}).status_code, 400)
+        response = self.client.get(url, {'start': '<script>alert(1)</script>'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'start/end must be YYYY-MM-DD, start <= end'})
@@ -1,12 +1,16 @@
 from django.urls import path, include
-from .views import OrderListView, ServeOrderView, PlaceOrderView, CustomerOrderView, OrderUpdateView
+from .views import OrderListView, OrderEventStreamView, ServeOrderView, BulkServeOrderView, PlaceOrderView, CustomerOrderView, OrderUpdateView, SalesReportView, SalesReportDataView
 
 app_name = 'orders'
 
 urlpatterns = [
     path('', OrderListView.as_view(), name='order_list'),
     path('serve/<int:order_id>/', ServeOrderView.as_view(), name='serve_order'),
+    path('serve/', BulkServeOrderView.as_view(), name='serve_orders'),
+    path('events/', OrderEventStreamView.as_view(), name='order_events'),
     path('place/', PlaceOrderView.as_view(), name='place_order'),
     path('my-orders/', CustomerOrderView.as_view(), name='customer_order_list'),
     path('update/<int:order_id>/', OrderUpdateView.as_view(), name='order_update'),
+    path('reports/sales/', SalesReportView.as_view(), name='sales_report'),
+    path('reports/sales.json', SalesReportDataView.as_view(), name='sales_report_data'),
 ]
\ No newline at end of file
@@ -1,91 +1,287 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views import View
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from .models import Order, OrderItem
+from .archive import customer_order_history
+from .events import broker, format_event
+from .models import Order, OrderEvent, OrderItem, SalesRollupWatermark
+from .rollups import REPORT_GROUPS, sales_report
+from .services import (
+    cancel_order, new_idempotency_key, parse_idempotency_key, parse_quantities, place_order, update_order,
+)
 from drinks.models import Drink
+from drinkOrder.instrumentation import count
+from django.db.models import Prefetch, Q
+from datetime import date, datetime, timedelta, timezone as dt_timezone
 from django.urls import reverse
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from asgiref.sync import sync_to_async
+from decimal import Decimal
+import asyncio
 import logging
 
 logger = logging.getLogger('django')
 
+ORDER_PAGE_SIZE = 25
+ORDER_STATUS_FILTERS = ['pending', 'served', 'all']
+CURSOR_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+def encode_cursor(order):
+    # Microseconds since the epoch keep the cursor URL-safe and exact
+    return f"{(order.created_on - CURSOR_EPOCH) // timedelta(microseconds=1)}-{order.id}"
+
+def decode_cursor(cursor):
+    '''
+    Returns the (created_on, id) key encoded by encode_cursor, or None when
+    the cursor is missing or malformed.
+    '''
+    try:
+        micros, order_id = cursor.split('-')
+        return CURSOR_EPOCH + timedelta(microseconds=int(micros)), int(order_id)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
 class OrderListView(LoginRequiredMixin, UserPassesTestMixin, View):
+    '''
+    Bartender order queue, pending orders by default, newest first.
+    Paginated by keyset on (created_on, id): each page is one query for the
+    orders with their customers and one for their items with drinks, however
+    many orders have ever been placed.
+    '''
     def test_func(self):
         return self.request.user.is_bartender
     def get(self, request):
-        orders = Order.objects.all().order_by('-created_on')
-        return render(request, 'orders/order_list.html', {'orders': orders})
+        status = request.GET.get('status', 'pending')
+        if status not in ORDER_STATUS_FILTERS:
+            status = 'pending'
+        orders = Order.objects.select_related('customer').prefetch_related(
+            Prefetch('orderitem_set', queryset=OrderItem.objects.select_related('drink').order_by('id'))
+        ).order_by('-created_on', '-id')
+        if status != 'all':
+            orders = orders.filter(status=status)
+
+        cursor = decode_cursor(request.GET.get('after'))
+        if cursor:
+            created_on, order_id = cursor
+            orders = orders.filter(Q(created_on__lt=created_on) | Q(created_on=created_on, id__lt=order_id))
+
+        # One extra row tells whether there is a next page
+        orders = list(orders[:ORDER_PAGE_SIZE + 1])
+        next_cursor = encode_cursor(orders[ORDER_PAGE_SIZE - 1]) if len(orders) > ORDER_PAGE_SIZE else None
+        # The live feed picks up from the orders on this page
+        live = status == 'pending' and cursor is None
+        return render(request, 'orders/order_list.html', {
+            'orders': orders[:ORDER_PAGE_SIZE],
+            'status': status,
+            'status_filters': ORDER_STATUS_FILTERS,
+            'next_cursor': next_cursor,
+            'is_first_page': cursor is None,
+            'last_event_id': OrderEvent.latest_id() if live else None,
+        })
+
+def parse_event_id(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+async def stream_order_events(last_id):
+    '''
+    Yields the Server-Sent Events after event last_id until the client goes
+    away: batches pushed by the broker when they follow on from the last
+    event sent, the database otherwise (see events.py).
+    '''
+    loop = asyncio.get_running_loop()
+    subscription = broker.subscribe()
+    try:
+        yield f"retry: {settings.ORDER_EVENTS_RETRY}\n\n"
+        messages = await sync_to_async(OrderEvent.after)(last_id)
+        last_sent = loop.time()
+        while True:
+            if messages:
+                last_id = messages[-1]['id']
+                yield ''.join(format_event(message) for message in messages)
+                last_sent = loop.time()
+            try:
+                batch = await asyncio.wait_for(subscription.queue.get(), settings.ORDER_EVENTS_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                batch = None
+            if batch is not None:
+                messages = [message for message in batch if message['id'] > last_id]
+                if not messages or messages[0]['id'] == last_id + 1:
+                    continue
+            # Idle, or events from another process (or dropped ones) come first
+            messages = await sync_to_async(OrderEvent.after)(last_id)
+            if not messages and loop.time() - last_sent >= settings.ORDER_EVENTS_HEARTBEAT:
+                yield ": keepalive\n\n"
+                last_sent = loop.time()
+    finally:
+        broker.unsubscribe(subscription)
+
+class OrderEventStreamView(View):
+    '''
+    Live feed of new, updated, cancelled and served orders for the bartender
+    queue, as Server-Sent Events. Resumes after the Last-Event-ID header
+    (or the last_event_id parameter the order list renders), otherwise
+    starts from the latest event.
+    '''
+    async def get(self, request):
+        user = await request.auser()
+        if not user.is_authenticated or not user.is_bartender:
+            return HttpResponseForbidden()
+        last_id = parse_event_id(request.headers.get('Last-Event-ID') or request.GET.get('last_event_id'))
+        if last_id is None:
+            last_id = await sync_to_async(OrderEvent.latest_id)()
+        if isinstance(request, ASGIRequest):
+            response = StreamingHttpResponse(stream_order_events(last_id), content_type='text/event-stream')
+        else:
+            # A WSGI worker can't hold the connection open: send the events so
+            # far and let the browser reconnect after the retry delay
+            messages = await sync_to_async(OrderEvent.after)(last_id)
+            response = HttpResponse(
+                f"retry: {settings.ORDER_EVENTS_RETRY}\n\n" + ''.join(format_event(message) for message in messages),
+                content_type='text/event-stream'
+            )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
 
 class ServeOrderView(LoginRequiredMixin, UserPassesTestMixin, View):
     def test_func(self):
         return self.request.user.is_bartender
     def post(self, request, order_id):
         try:
-            order = get_object_or_404(Order, id=order_id, status='pending')
-            order.status = 'served'
-            order.save()
-            return redirect(reverse('orders:order_list'))
+            if Order.mark_served([order_id]):
+                count('serve', 'served')
+            else:
+                count('serve', 'skipped')
+                logger.info(f"Order {order_id} was not pending when {request.user.username} served it")
         except Exception as e:
             logger.error(f"ServeOrderView error: {str(e)}")
-            return redirect(reverse('orders:order_list'))
+        return redirect(reverse('orders:order_list'))
+
+class BulkServeOrderView(LoginRequiredMixin, UserPassesTestMixin, View):
+    '''
+    Serves every order ticked on the bartender queue with a single UPDATE.
+    '''
+    def test_func(self):
+        return self.request.user.is_bartender
+    def post(self, request):
+        order_ids = set()
+        for order_id in request.POST.getlist('order_ids'):
+            try:
+                order_ids.add(int(order_id))
+            except ValueError:
+                logger.error(f"Invalid order id to serve: {order_id}")
+        try:
+            served = Order.mark_served(order_ids) if order_ids else 0
+            count('serve', 'served', served)
+            count('serve', 'skipped', len(order_ids) - served)
+            logger.info(f"Bartender {request.user.username} served {served} of {len(order_ids)} orders")
+        except Exception as e:
+            logger.error(f"BulkServeOrderView error: {str(e)}")
+        return redirect(reverse('orders:order_list'))
+
+def parse_report_range(params):
+    '''
+    The first and last day of a sales report from the start and end
+    (YYYY-MM-DD) query parameters, by default the last SALES_REPORT_DAYS
+    days. Raises ValueError when a day is malformed or the range is reversed.
+    '''
+    end = date.fromisoformat(params['end']) if params.get('end') else timezone.localdate()
+    if params.get('start'):
+        start = date.fromisoformat(params['start'])
+    else:
+        start = end - timedelta(days=getattr(settings, 'SALES_REPORT_DAYS', 30) - 1)
+    if start > end:
+        raise ValueError(f"Report starts after it ends: {start} > {end}")
+    return start, end
+
+class SalesReportView(LoginRequiredMixin, UserPassesTestMixin, View):
+    '''
+    Sales by day, drink and category over a date range, for bartenders and
+    staff, read from the daily rollups (rollups.py).
+    '''
+    def test_func(self):
+        return self.request.user.is_bartender or self.request.user.is_staff
+    def get(self, request):
+        try:
+            start, end = parse_report_range(request.GET)
+        except ValueError as e:
+            logger.error(f"Invalid sales report range: {str(e)}")
+            return render(request, 'orders/sales_report.html', {'error': "Enter the days as YYYY-MM-DD, start before end."})
+        by_day = sales_report(start, end, 'day')
+        return render(request, 'orders/sales_report.html', {
+            'start': start,
+            'end': end,
+            'by_day': by_day,
+            'by_drink': sales_report(start, end, 'drink'),
+            'by_category': sales_report(start, end, 'category'),
+            'total_quantity': sum(row['quantity'] for row in by_day),
+            'total_revenue': sum(Decimal(row['revenue']) for row in by_day),
+            'rolled_up_until': SalesRollupWatermark.current(),
+        })
+
+class SalesReportDataView(LoginRequiredMixin, UserPassesTestMixin, View):
+    '''
+    JSON sales report: ?start=&end=&group=day|drink|category, answered from
+    the daily rollups. rolled_up_until tells how recent the figures are.
+    '''
+    def test_func(self):
+        return self.request.user.is_bartender or self.request.user.is_staff
+    def get(self, request):
+        group_by = request.GET.get('group', 'day')
+        # Fixed messages: the rejected values are never echoed back
+        if group_by not in REPORT_GROUPS:
+            return JsonResponse({'error': f"group must be one of {', '.join(REPORT_GROUPS)}"}, status=400)
+        try:
+            start, end = parse_report_range(request.GET)
+        except ValueError:
+            return JsonResponse({'error': 'start/end must be YYYY-MM-DD, start <= end'}, status=400)
+        rolled_up_until = SalesRollupWatermark.current()
+        return JsonResponse({
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'group': group_by,
+            'rolled_up_until': rolled_up_until.isoformat() if rolled_up_until else None,
+            'rows': sales_report(start, end, group_by),
+        })
 
 class PlaceOrderView(LoginRequiredMixin, UserPassesTestMixin, View):
     def test_func(self):
         return self.request.user.is_customer
     def get(self, request):
         drinks = Drink.objects.filter(is_available=True).order_by('name')
-        return render(request, 'orders/order_form.html', {'drinks': drinks})
+        return render(request, 'orders/order_form.html', {'drinks': drinks, 'idempotency_key': new_idempotency_key()})
 
     def post(self, request):
-        drinks = Drink.objects.filter(is_available=True)
-        total_price = 0
-        order_items = []
-
-        # Process quantities from form
-        for drink in drinks:
-            quantity = request.POST.get(f'quantity_{drink.id}', '0')
-            try:
-                quantity = int(quantity)
-                if quantity > 0:
-                    total_price += drink.price * quantity
-                    order_items.append((drink, quantity))
-            except ValueError:
-                logger.error(f"Invalid quantity for drink {drink.id}: {quantity}")
-                continue
-
-        if not order_items:
-            return render(request, 'orders/order_form.html', {
-                'drinks': drinks,
-                'error': 'Please select at least one drink.'
-            })
-
-        # Create order
+        quantities = parse_quantities(request.POST)
+        idempotency_key = parse_idempotency_key(request.POST)
         try:
-            order = Order.objects.create(
-                total_price=total_price,
-                status='pending',
-                customer=request.user
-            )
-            for drink, quantity in order_items:
-                OrderItem.objects.create(
-                    order=order,
-                    drink=drink,
-                    quantity=quantity
-                )
-            return render(request, 'orders/order_confirmation.html', {'order': order})
+            order = place_order(request.user, quantities, idempotency_key) if quantities else None
+            if order is not None:
+                return render(request, 'orders/order_confirmation.html', {'order': order})
+            error = 'Please select at least one drink.'
         except Exception as e:
             logger.error(f"Error creating order: {str(e)}")
-            return render(request, 'orders/order_form.html', {
-                'drinks': drinks,
-                'error': 'Failed to place order. Please try again.'
-            })
+            error = 'Failed to place order. Please try again.'
+        return render(request, 'orders/order_form.html', {
+            'drinks': Drink.objects.filter(is_available=True).order_by('name'),
+            'idempotency_key': idempotency_key or new_idempotency_key(),
+            'error': error
+        })
 
 
 class CustomerOrderView(LoginRequiredMixin, UserPassesTestMixin, View):
     def test_func(self):
         return self.request.user.is_customer
     def get(self, request):
-        orders = Order.objects.filter(customer=request.user).order_by('-created_on')
-        return render(request, 'orders/customer_order_list.html', {'orders': orders})
+        # ?history=all adds the orders archive_orders has moved out of the live tables
+        full_history = request.GET.get('history') == 'all'
+        orders = customer_order_history(request.user, full_history)
+        return render(request, 'orders/customer_order_list.html', {'orders': orders, 'full_history': full_history})
 
 class OrderUpdateView(LoginRequiredMixin, UserPassesTestMixin, View):
     def test_func(self):
@@ -94,7 +290,7 @@ class OrderUpdateView(LoginRequiredMixin, UserPassesTestMixin, View):
         order = get_object_or_404(Order, id=order_id, customer=request.user, status='pending')
         drinks = Drink.objects.all().order_by('name')
         # Add current quantities to drinks
-        current_items = {item.drink.id: item.quantity for item in order.orderitem_set.all()}
+        current_items = {item.drink_id: item.quantity for item in order.orderitem_set.all()}
         for drink in drinks:
             drink.current_quantity = current_items.get(drink.id, 0)
         return render(request, 'orders/order_update.html', {
@@ -103,58 +299,29 @@ class OrderUpdateView(LoginRequiredMixin, UserPassesTestMixin, View):
         })
 
     def post(self, request, order_id):
-        order = get_object_or_404(Order, id=order_id, customer=request.user, status='pending')
+        order = get_object_or_404(Order.objects.select_related('customer'), id=order_id, customer=request.user, status='pending')
         if request.POST.get('cancel') == 'true':
             try:
-                order.delete()
+                cancel_order(order)
                 return redirect('orders:customer_order_list')
             except Exception as e:
                 logger.error(f"Error canceling order {order_id}: {str(e)}")
-                orders = Order.objects.filter(customer=request.user).order_by('-created_on')
+                orders = Order.objects.filter(customer=request.user).prefetch_related('orderitem_set__drink').order_by('-created_on')
                 return render(request, 'orders/customer_order_list.html', {
                     'orders': orders,
                     'error': 'Failed to cancel order. Please try again.'
                 })
 
-        drinks = Drink.objects.all()
-        total_price = 0
-        order_items = []
-
-        for drink in drinks:
-            quantity = request.POST.get(f'quantity_{drink.id}', '0')
-            try:
-                quantity = int(quantity)
-                if quantity > 0:
-                    total_price += drink.price * quantity
-                    order_items.append((drink, quantity))
-            except ValueError:
-                logger.error(f"Invalid quantity for drink {drink.id}: {quantity}")
-                continue
-
-        if not order_items:
-            return render(request, 'orders/order_update.html', {
-                'order': order,
-                'drinks': drinks,
-                'error': 'Please select at least one drink.'
-            })
-
+        quantities = parse_quantities(request.POST)
         try:
-            # Update order
-            order.total_price = total_price
-            order.save()
-            # Clear existing items and add new ones
-            order.orderitem_set.all().delete()
-            for drink, quantity in order_items:
-                OrderItem.objects.create(
-                    order=order,
-                    drink=drink,
-                    quantity=quantity
-                )
-            return redirect('orders:customer_order_list')
+            if quantities and update_order(order, quantities):
+                return redirect('orders:customer_order_list')
+            error = 'Please select at least one drink.'
         except Exception as e:
             logger.error(f"Error updating order {order_id}: {str(e)}")
-            return render(request, 'orders/order_update.html', {
-                'order': order,
-                'drinks': drinks,
-                'error': 'Failed to update order. Please try again.'
-            })
\ No newline at end of file
+            error = 'Failed to update order. Please try again.'
+        return render(request, 'orders/order_update.html', {
+            'order': order,
+            'drinks': Drink.objects.all().order_by('name'),
+            'error': error
+        })
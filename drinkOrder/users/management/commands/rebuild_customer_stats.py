@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from orders.models import ArchivedOrder, Order, OrderItem
+from users.models import CustomerStats
+from users.stats import rebuild_customer_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the customer profile stats from the order history, archived orders included, repairing any drift.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            before = {
+                entry.customer_id: (entry.order_count, entry.drink_quantities)
+                for entry in CustomerStats.objects.only('customer_id', 'order_count', 'drink_quantities')
+            }
+            stats = rebuild_customer_stats(CustomerStats, Order, OrderItem, ArchivedOrder)
+
+        drifted = [
+            customer_id for customer_id in before.keys() | stats.keys()
+            if customer_id not in stats or before.get(customer_id) != (stats[customer_id].order_count, stats[customer_id].drink_quantities)
+        ]
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt stats for {len(stats)} customers; {len(drifted)} had drifted"
+        ))
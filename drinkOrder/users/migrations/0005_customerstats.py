@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_customuser_customer_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerStats',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('drink_quantities', models.JSONField(default=dict)),
+                ('order_count', models.IntegerField(default=0)),
+                ('last_visit', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('visit_days', models.JSONField(default=dict)),
+            ],
+            options={
+                'verbose_name_plural': 'Customer stats',
+            },
+        ),
+    ]
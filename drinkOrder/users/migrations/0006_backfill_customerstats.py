@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from users.stats import rebuild_customer_stats
+
+
+def backfill_customer_stats(apps, schema_editor):
+    rebuild_customer_stats(
+        apps.get_model('users', 'CustomerStats'),
+        apps.get_model('orders', 'Order'),
+        apps.get_model('orders', 'OrderItem'),
+        apps.get_model('orders', 'ArchivedOrder'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_archivedorder'),
+        ('users', '0005_customerstats'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_customer_stats, migrations.RunPython.noop),
+    ]
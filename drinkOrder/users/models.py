@@ -1,8 +1,17 @@
 from django.db import models
 
 # Create your models here.
+import json
+from datetime import timedelta
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.db.models import Case, F, Q, Subquery, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .stats import history_start
 
 class CustomUser(AbstractUser):
     full_name = models.CharField(max_length=150, blank=True)
@@ -19,4 +28,137 @@ class CustomUser(AbstractUser):
 
     class Meta:
         verbose_name = "User"
-        verbose_name_plural = "Users"
\ No newline at end of file
+        verbose_name_plural = "Users"
+        indexes = [
+            # Bartender customer list
+            models.Index(
+                fields=['full_name', 'username'], name='user_customer_name_idx',
+                condition=Q(is_customer=True, is_superuser=False),
+            ),
+        ]
+
+def add_counts(field, deltas, min_key=None):
+    """
+    SQL for the JSON object of counts in field with deltas, a dict of key ->
+    count delta, added to it. Keys whose count drops to 0 and, with min_key,
+    keys sorting before min_key are left out. Uses SQLite's JSON functions.
+    """
+    pairs = []
+    params = []
+    for key, delta in deltas.items():
+        path = f"$.{json.dumps(key)}"
+        pairs.append(f"%s, COALESCE(json_extract({field}, %s), 0) + %s")
+        params += [path, path, delta]
+    condition = 'value > 0'
+    if min_key is not None:
+        condition += ' AND key >= %s'
+        params.append(min_key)
+    return RawSQL(
+        f"SELECT json_group_object(key, value) FROM json_each(json_set({field}, {', '.join(pairs)})) WHERE {condition}",
+        params, output_field=models.JSONField(),
+    )
+
+class CustomerStats(models.Model):
+    """
+    Profile statistics of one customer, kept in step with their orders by
+    CustomerStats.record() (see orders/services.py): lifetime quantity per
+    drink, orders placed, last visit, and a histogram of orders per day over
+    the last CUSTOMER_VISIT_HISTORY_DAYS days. Rebuild with the
+    rebuild_customer_stats command.
+    """
+    customer = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    # {drink id: quantity}, keys as strings (JSON)
+    drink_quantities = models.JSONField(default=dict)
+    order_count = models.IntegerField(default=0)
+    last_visit = models.DateTimeField(null=True, blank=True, db_index=True)
+    # {'YYYY-MM-DD': orders placed that day}
+    visit_days = models.JSONField(default=dict)
+
+    class Meta:
+        verbose_name_plural = "Customer stats"
+
+    def __str__(self):
+        return f"Stats of {self.customer_id}: {self.order_count} orders"
+
+    @staticmethod
+    def latest_order(customer_id):
+        """
+        Expression for when customer_id last ordered, over their live and
+        archived orders (NULL if they have none left).
+        """
+        from orders.models import ArchivedOrder, Order
+
+        live, archived = (
+            Subquery(model.objects.filter(customer_id=customer_id).order_by('-created_on').values('created_on')[:1])
+            for model in (Order, ArchivedOrder)
+        )
+        # GREATEST is NULL as soon as one side is
+        return Greatest(Coalesce(live, archived), Coalesce(archived, live))
+
+    @classmethod
+    def record(cls, customer_id, quantities, ordered_on, visits=0):
+        """
+        Adds quantities, a dict of drink id -> quantity delta, to the drink
+        totals of customer_id, and visits (1 for a new order, -1 for a
+        cancelled one) to its order count and to the histogram day the order
+        was placed. One UPDATE computes the new values in the database, so
+        concurrent orders never lose an update; a customer's first order also
+        inserts the row. Call inside the transaction that writes the order,
+        after a cancelled order is deleted.
+        """
+        quantities = {str(drink_id): delta for drink_id, delta in quantities.items() if delta}
+        if customer_id is None or not (quantities or visits):
+            return
+        updates = {}
+        if quantities:
+            updates['drink_quantities'] = add_counts('drink_quantities', quantities)
+        if visits:
+            updates['order_count'] = F('order_count') + visits
+            # Old days roll out of the histogram as new ones come in
+            updates['visit_days'] = add_counts(
+                'visit_days', {timezone.localdate(ordered_on).isoformat(): visits}, min_key=history_start()
+            )
+            if visits > 0:
+                updates['last_visit'] = Case(
+                    When(Q(last_visit__isnull=True) | Q(last_visit__lt=ordered_on), then=Value(ordered_on)),
+                    default=F('last_visit'),
+                )
+            else:
+                updates['last_visit'] = cls.latest_order(customer_id)
+        if not cls.objects.filter(customer_id=customer_id).update(**updates):
+            # First order: ignore_conflicts creates the row without a savepoint
+            # even if a concurrent first order just did
+            cls.objects.bulk_create([cls(customer_id=customer_id)], ignore_conflicts=True)
+            cls.objects.filter(customer_id=customer_id).update(**updates)
+
+    def top_drinks(self, limit=None):
+        """
+        (drink id, quantity) pairs, most ordered first; ties go to the lower id.
+        """
+        ranked = sorted(
+            ((int(drink_id), quantity) for drink_id, quantity in self.drink_quantities.items()),
+            key=lambda entry: (-entry[1], entry[0]),
+        )
+        return ranked[:limit] if limit else ranked
+
+    def recent_visits(self, days=30):
+        """
+        Orders placed over the last days days (at most the histogram length).
+        """
+        start = (timezone.localdate() - timedelta(days=days - 1)).isoformat()
+        return sum(count for day, count in self.visit_days.items() if day >= start)
+
+    @classmethod
+    def regulars(cls, days=30, limit=5):
+        """
+        The stats of the limit customers sharing their profile with the most
+        orders over the last days days, each with a .visits count. Reads only
+        the customers seen in that window.
+        """
+        recent = cls.objects.filter(
+            last_visit__gte=timezone.now() - timedelta(days=days), customer__share_profile=True
+        ).select_related('customer')
+        for stats in recent:
+            stats.visits = stats.recent_visits(days)
+        ranked = sorted((stats for stats in recent if stats.visits > 0), key=lambda stats: (-stats.visits, stats.customer.username))
+        return ranked[:limit]
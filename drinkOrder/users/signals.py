@@ -0,0 +1,14 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from drinks.menu_cache import bump_drink_versions
+
+from .models import CustomUser
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_reviewed_drink_pages(sender, instance, update_fields=None, **kwargs):
+    # Reviewer names and avatars show on the drinks' detail pages; logins only touch last_login
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    bump_drink_versions(instance.review_set.values_list('drink_id', flat=True))
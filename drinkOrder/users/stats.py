@@ -0,0 +1,61 @@
+"""
+Rebuilding CustomerStats from the order history, shared by the
+rebuild_customer_stats command and the migration that backfilled the table.
+The models are passed in, so the migration can use its historical ones.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def history_start():
+    """
+    First day (ISO date) of the visit histogram.
+    """
+    days = getattr(settings, 'CUSTOMER_VISIT_HISTORY_DAYS', 90)
+    return (timezone.localdate() - timedelta(days=days - 1)).isoformat()
+
+
+def rebuild_customer_stats(CustomerStats, Order, OrderItem, ArchivedOrder):
+    """
+    Replaces every CustomerStats row with figures recomputed from the live
+    and the archived orders. Call inside a transaction. Returns the new rows
+    by customer id.
+    """
+    first_day = history_start()
+    stats = {}
+
+    def customer_stats(customer_id):
+        return stats.setdefault(customer_id, CustomerStats(customer_id=customer_id, drink_quantities={}, visit_days={}))
+
+    def add_visits(entry, day, count, last_visit):
+        entry.order_count += count
+        if day >= first_day:
+            entry.visit_days[day] = entry.visit_days.get(day, 0) + count
+        if entry.last_visit is None or last_visit > entry.last_visit:
+            entry.last_visit = last_visit
+
+    orders = Order.objects.filter(customer__isnull=False)
+    for customer_id, drink_id, quantity in OrderItem.objects.filter(order__in=orders).values(
+        'order__customer_id', 'drink_id'
+    ).annotate(total_quantity=Sum('quantity')).values_list('order__customer_id', 'drink_id', 'total_quantity'):
+        customer_stats(customer_id).drink_quantities[str(drink_id)] = quantity
+    for row in orders.annotate(day=TruncDate('created_on')).values('customer_id', 'day').annotate(
+        count=Count('id'), last_visit=Max('created_on')
+    ):
+        add_visits(customer_stats(row['customer_id']), row['day'].isoformat(), row['count'], row['last_visit'])
+    # Orders moved out by archive_orders
+    for customer_id, created_on, items in ArchivedOrder.objects.filter(customer__isnull=False).values_list(
+        'customer_id', 'created_on', 'items'
+    ).iterator():
+        entry = customer_stats(customer_id)
+        add_visits(entry, timezone.localdate(created_on).isoformat(), 1, created_on)
+        for drink_id, quantity, _ in items:
+            entry.drink_quantities[str(drink_id)] = entry.drink_quantities.get(str(drink_id), 0) + quantity
+
+    CustomerStats.objects.all().delete()
+    CustomerStats.objects.bulk_create(stats.values())
+    return stats
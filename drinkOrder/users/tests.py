@@ -1,3 +1,123 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from drinkOrder.query_budget import QueryBudgetTestMixin
+from drinkOrder.query_plans import QueryPlanTestMixin
+from orders.models import Order
+from orders.services import cancel_order, place_order, update_order
+from orders.tests import seed_orders
+
+from .models import CustomerStats, CustomUser
+
+
+class CustomerViewQueryBudgetTests(QueryBudgetTestMixin, QueryPlanTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.drinks, cls.customers = seed_orders(customers=10)
+        call_command('rebuild_customer_stats', stdout=StringIO())
+        cls.bartender = CustomUser.objects.create_user(
+            'bartender', password='password', is_customer=False, is_bartender=True
+        )
+
+    def setUp(self):
+        self.client.force_login(self.bartender)
+
+    def test_customer_list(self):
+        with self.assertQueryBudget('users:customer_list'):
+            response = self.client.get(reverse('users:customer_list'))
+        self.assertContains(response, 'customer9')
+
+    def test_customer_profile(self):
+        customer = self.customers[0]
+        with self.assertQueryBudget('users:customer_profile'):
+            response = self.client.get(reverse('users:customer_profile', args=[customer.id]))
+        self.assertContains(response, 'Drink 0')
+
+    def test_customer_views_use_indexes(self):
+        with self.assertUsesIndex('user_customer_name_idx'):
+            self.client.get(reverse('users:customer_list'))
+
+    def test_customer_profile_reads_stats_only(self):
+        customer = self.customers[0]
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('users:customer_profile', args=[customer.id]))
+        self.assertFalse([query['sql'] for query in captured if 'orders_order' in query['sql']])
+        self.assertEqual(response.context['visit_count'], 5)
+        # seed_orders gives the even drinks to three of the five orders
+        self.assertEqual(
+            [(drink.name, drink.total_quantity) for drink in response.context['favorite_drinks']],
+            [('Drink 0', 6), ('Drink 2', 6), ('Drink 4', 6)],
+        )
+
+
+class CustomerStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.drinks, cls.customers = seed_orders(orders_per_customer=2, customers=3)
+        call_command('rebuild_customer_stats', stdout=StringIO())
+        cls.bartender = CustomUser.objects.create_user(
+            'bartender', password='password', is_customer=False, is_bartender=True
+        )
+
+    def test_order_writes_keep_stats_in_step(self):
+        customer = self.customers[0]
+        first = place_order(customer, {self.drinks[0].id: 1, self.drinks[1].id: 2})
+        second = place_order(customer, {self.drinks[1].id: 3})
+        update_order(first, {self.drinks[0].id: 4, self.drinks[2].id: 1})
+        cancel_order(Order.objects.get(pk=second.pk))
+
+        stats = CustomerStats.objects.get(customer=customer)
+        self.assertEqual(stats.order_count, 3)
+        self.assertEqual(stats.recent_visits(30), 3)
+        # Cancelling the latest order moves last_visit back to the one before
+        self.assertEqual(stats.last_visit, first.created_on)
+        self.assertEqual(stats.top_drinks(2), [(self.drinks[0].id, 6), (self.drinks[2].id, 3)])
+
+        incremental = {
+            row.customer_id: (row.order_count, row.drink_quantities, row.visit_days, row.last_visit) for row in CustomerStats.objects.all()
+        }
+        output = StringIO()
+        call_command('rebuild_customer_stats', stdout=output)
+        self.assertIn('0 had drifted', output.getvalue())
+        self.assertEqual({
+            row.customer_id: (row.order_count, row.drink_quantities, row.visit_days, row.last_visit) for row in CustomerStats.objects.all()
+        }, incremental)
+
+    def test_record_drops_empty_and_expired_entries(self):
+        customer = CustomUser.objects.create_user('newcomer', password='password')
+        now = timezone.now()
+        with self.assertNumQueries(3):
+            CustomerStats.record(customer.id, {self.drinks[0].id: 2, self.drinks[1].id: 1}, now, visits=1)
+        with self.assertNumQueries(1):
+            CustomerStats.record(customer.id, {self.drinks[0].id: 1}, now - timedelta(days=365), visits=1)
+        CustomerStats.record(customer.id, {self.drinks[1].id: -1}, now)
+
+        stats = CustomerStats.objects.get(customer=customer)
+        self.assertEqual(stats.drink_quantities, {str(self.drinks[0].id): 3})
+        self.assertEqual(stats.order_count, 2)
+        # A year ago is past the histogram, and the older visit leaves last_visit alone
+        self.assertEqual(stats.visit_days, {timezone.localdate(now).isoformat(): 1})
+        self.assertEqual(stats.last_visit, now)
+
+    def test_regulars(self):
+        for _ in range(2):
+            place_order(self.customers[1], {self.drinks[0].id: 1})
+        self.customers[2].share_profile = False
+        self.customers[2].save()
+        for _ in range(3):
+            place_order(self.customers[2], {self.drinks[0].id: 1})
 
-# Create your tests here.
+        self.client.force_login(self.bartender)
+        response = self.client.get(reverse('users:customer_list'))
+        self.assertEqual(
+            [(stats.customer.username, stats.visits) for stats in response.context['regulars']],
+            [('customer1', 4), ('customer0', 2)],
+        )
+        self.assertContains(response, '4 visits in the last 30 days')
@@ -4,11 +4,9 @@ from django.contrib.auth import login
 from django.contrib.auth.views import LoginView, LogoutView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from .forms import CustomUserCreationForm, CustomUserUpdateForm
-from .models import CustomUser
+from .models import CustomerStats, CustomUser
 from drinks.models import Drink
-from orders.models import Order
-from django.utils import timezone
-from django.db.models import Sum
+from django.conf import settings
 from django.urls import reverse_lazy
 import logging
 
@@ -52,9 +50,13 @@ class CustomerListView(LoginRequiredMixin, UserPassesTestMixin, View):
 
     def get(self, request):
         customers = CustomUser.objects.filter(is_customer=True, is_superuser=False).order_by('full_name', 'username')
+        regulars_days = getattr(settings, 'REGULARS_WINDOW_DAYS', 30)
+        regulars = CustomerStats.regulars(days=regulars_days, limit=getattr(settings, 'REGULARS_LIMIT', 5))
         logger.info(f"Bartender {request.user.username} viewed customer list")
         return render(request, 'users/customer_list.html', {
             'customers': customers,
+            'regulars': regulars,
+            'regulars_days': regulars_days,
         })
 
 class CustomerProfileView(LoginRequiredMixin, UserPassesTestMixin, View):
@@ -62,26 +64,28 @@ class CustomerProfileView(LoginRequiredMixin, UserPassesTestMixin, View):
         return self.request.user.is_bartender
 
     def get(self, request, customer_id):
-        customer = get_object_or_404(CustomUser, id=customer_id, is_customer=True)
+        customer = get_object_or_404(CustomUser.objects.select_related('stats'), id=customer_id, is_customer=True)
         if not customer.share_profile:
             logger.warning(f"Bartender {request.user.username} attempted to view non-shared profile of {customer.username}")
             return render(request, 'users/customer_profile.html', {
                 'error': "This customer has not opted in to share their profile."
             })
 
+        # Favorites and visits come from the customer's precomputed stats
+        stats = getattr(customer, 'stats', None) or CustomerStats(customer=customer)
         # Favorite drinks: Top 3 drinks by quantity ordered
-        favorite_drinks = Drink.objects.filter(
-            orderitem__order__customer=customer
-        ).annotate(
-            total_quantity=Sum('orderitem__quantity')
-        ).order_by('-total_quantity')[:3]
+        ranked = stats.top_drinks()
+        drinks = Drink.objects.in_bulk([drink_id for drink_id, _ in ranked])
+        favorite_drinks = []
+        for drink_id, total_quantity in ranked:
+            # Drinks deleted since keep their totals until the next rebuild
+            if drink_id in drinks:
+                drinks[drink_id].total_quantity = total_quantity
+                favorite_drinks.append(drinks[drink_id])
+        favorite_drinks = favorite_drinks[:3]
 
         # Visit frequency: Orders in last 30 days
-        thirty_days_ago = timezone.now() - timezone.timedelta(days=30)
-        visit_count = Order.objects.filter(
-            customer=customer,
-            created_on__gte=thirty_days_ago
-        ).count()
+        visit_count = stats.recent_visits(30)
 
         logger.info(f"Bartender {request.user.username} viewed profile of {customer.username}")
         return render(request, 'users/customer_profile.html', {